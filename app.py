@@ -2,6 +2,7 @@
 import streamlit as st
 import os
 import json
+import re
 from datetime import datetime
 from PIL import Image
 import io
@@ -26,6 +27,12 @@ else:
 
 from ocr_processor_pdf2image import *
 from llm_regex_generator import *
+from ocr_cache import get_ocr_cache, pdf_hash
+from thumbnail_cache import get_thumbnail_cache
+from metrics import count_event, get_metrics, stage_timer, start_metrics_server
+from regex_safety import slow_patterns
+from pattern_stats import summarize_run
+from layout_index import DEFAULT_LABELS, extract_amounts_by_layout
 
 # Streamlit Secretsから環境変数を読み込み（本番環境）
 if IS_PRODUCTION and hasattr(st, 'secrets'):
@@ -47,12 +54,44 @@ if 'ocr_text' not in st.session_state:
     st.session_state.ocr_text = None
 if 'text_elements' not in st.session_state:
     st.session_state.text_elements = None
+if 'ocr_pages' not in st.session_state:
+    st.session_state.ocr_pages = []
 if 'extracted_values' not in st.session_state:
     st.session_state.extracted_values = []
 if 'current_patterns' not in st.session_state:
     st.session_state.current_patterns = []
 if 'document_pattern' not in st.session_state:
     st.session_state.document_pattern = None
+if 'pattern_run_stats' not in st.session_state:
+    st.session_state.pattern_run_stats = {}
+
+# LLM応答キャッシュ（同じプロンプトはAPIを呼ばずにDBから返す）
+set_llm_response_cache(get_llm_response_cache())
+
+# OCR結果キャッシュ（プロセス内で共有）
+try:
+    ocr_cache = get_ocr_cache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+except Exception as e:
+    print(f"OCRキャッシュ初期化エラー: {e}")
+    ocr_cache = None
+
+# PDFプレビュー画像のキャッシュ（プロセス内で共有）
+try:
+    thumbnail_cache = get_thumbnail_cache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+except Exception as e:
+    print(f"サムネイルキャッシュ初期化エラー: {e}")
+    thumbnail_cache = None
+
+# METRICS_PORTが設定されていればPrometheus形式で計測値を公開
+start_metrics_server()
+
+def render_extracted_values(placeholder, values):
+    """ページごとに抽出した金額を表示（抽出中は同じ場所を更新する）"""
+    import pandas as pd
+    placeholder.dataframe(pd.DataFrame([
+        {"ページ": value.get('page_number'), "金額": f"¥{value['normalized']:,}", "元": value['raw']}
+        for value in values
+    ]), hide_index=True)
 
 # タイトル
 st.title("🏦 自己破産書類OCR処理システム")
@@ -67,13 +106,22 @@ with st.sidebar:
         else:
             st.info("💻 ローカル環境（SQLite）")
         
-        # データベース接続テスト
+        # データベース接続テスト（プール済みの接続を使用）
         try:
-            session = get_session()
-            session.close()
+            check_database_connection()
             st.success("✅ データベース接続OK")
         except Exception as e:
             st.error(f"❌ データベース接続エラー: {str(e)}")
+        
+        # OCRキャッシュの状態
+        if ocr_cache:
+            cache_stats = ocr_cache.stats()
+            st.caption(
+                f"OCRキャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']} / "
+                f"{cache_stats['entries']}件 ({cache_stats['bytes'] / 1024 / 1024:.1f}MB)"
+            )
+        llm_cache = get_llm_response_cache()
+        st.caption(f"LLMキャッシュ: ヒット {llm_cache.hits} / ミス {llm_cache.misses}")
 
     st.header("📁 ファイルアップロード")
     
@@ -122,13 +170,9 @@ with st.sidebar:
 
 # メインエリア
 if uploaded_file:
-    # 一時ファイルとして保存
-    temp_dir = "temp"
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_pdf_path = os.path.join(temp_dir, f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-    
-    with open(temp_pdf_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    # アップロードされたPDFはメモリ上のバッファをそのまま使う（プレビュー・OCR・ハッシュで共有）
+    pdf_buffer = uploaded_file.getbuffer()
+    upload_hash = pdf_hash(pdf_buffer)
     
     # タブを作成
     tab1, tab2, tab3, tab4 = st.tabs(["📝 OCR処理", "💰 金額抽出", "📊 結果確認", "📈 統計情報"])
@@ -140,43 +184,108 @@ if uploaded_file:
         
         with col1:
             if st.button("🚀 OCR実行", type="primary", use_container_width=True):
-                with st.spinner("OCRを実行中..."):
+                with st.spinner("OCRを実行中..."), stage_timer('app_ocr'):
                     try:
-                        # OCR実行
-                        with open(temp_pdf_path, "rb") as f:
-                            pdf_data = f.read()
+                        # 同じPDFのOCR結果がキャッシュにあれば再利用
+                        ocr_provider = "azure" if use_azure else "google"
+                        ocr_model_id = get_ocr_model_id(use_azure)
+                        cached_result = ocr_cache.get(pdf_buffer, ocr_provider, ocr_model_id, upload_hash) if ocr_cache else None
                         
-                        if use_azure:
-                            st.session_state.ocr_text = perform_azure_ocr(pdf_data)
-                            st.session_state.text_elements = extract_text_with_coordinates(pdf_data)
+                        if cached_result:
+                            ocr_result = OCRResult.from_dict(cached_result)
+                            ocr_stream = None
+                            pages = ocr_result.pages
                         else:
-                            st.session_state.ocr_text = perform_google_ocr(temp_pdf_path)
+                            # 認識の終わったページから順に受け取る（Azureは1回の解析でテキストと座標を取得）
+                            ocr_stream = OCRPageStream(pdf_buffer, use_azure)
+                            pages = ocr_stream
                         
-                        st.success(f"✅ OCR完了！ {len(st.session_state.ocr_text)}文字を抽出しました。")
+                        # 保存済みパターンがあれば、OCR中にページごとに抽出して金額抽出タブに表示
+                        with tab2:
+                            live_results = st.empty()
+                        page_status = st.empty()
+                        extractor = None
+                        run_stats = {}
+                        for page in pages:
+                            page_status.caption(f"📄 {page['page_number']}ページ目まで認識しました")
+                            if page['page_number'] == 1 and selected_category == "自動判別" and save_to_db:
+                                # 保存済みのサンプルは書類の先頭部分のため、1ページ目で類似書類を検索できる
+                                with session_scope() as session:
+                                    similar_doc, score = find_similar_document(page['text'], session)
+                                if similar_doc and similar_doc.get_patterns():
+                                    st.info(f"📄 類似書類を発見: {similar_doc.category} (類似度: {score:.1%})")
+                                    st.session_state.document_pattern = similar_doc
+                                    extractor = PageExtractor(similar_doc.get_patterns(), run_stats)
+                            if extractor:
+                                extractor.add_page(page['page_number'], page['text'])
+                                render_extracted_values(live_results, extractor.values)
+                        page_status.empty()
                         
-                        # 自動的に書類カテゴリを判別
-                        if selected_category == "自動判別" and save_to_db:
-                            session = get_session()
-                            try:
+                        if ocr_stream:
+                            ocr_result = ocr_stream.result
+                            # 一部のページが失敗した結果はキャッシュしない
+                            if ocr_cache and not ocr_result.errors:
+                                ocr_cache.set(pdf_buffer, ocr_provider, ocr_model_id, ocr_result.to_dict(), upload_hash)
+                        
+                        st.session_state.ocr_text = ocr_result.text
+                        st.session_state.text_elements = ocr_result.text_elements
+                        st.session_state.ocr_pages = ocr_result.pages
+                        
+                        if cached_result:
+                            st.success(f"✅ OCR完了！ {len(st.session_state.ocr_text)}文字を抽出しました。（キャッシュ）")
+                        else:
+                            st.success(f"✅ OCR完了！ {len(st.session_state.ocr_text)}文字を抽出しました。")
+                        for page_error in ocr_result.errors:
+                            st.warning(f"⚠️ {page_error['page_number']}ページ目のOCRに失敗しました: {page_error['error']}")
+                        
+                        if extractor:
+                            extractor.report_errors()
+                            st.session_state.current_patterns = extractor.pattern_set.patterns
+                            st.session_state.extracted_values = extractor.values
+                            st.session_state.pattern_run_stats = run_stats
+                            st.success(f"💴 保存済みパターンで{len(extractor.values)}個の金額を抽出しました（金額抽出タブ）")
+                        
+                        # 自動的に書類カテゴリを判別（1ページ目で見つからなかった場合は全文で検索）
+                        elif selected_category == "自動判別" and save_to_db:
+                            with session_scope() as session:
                                 similar_doc, score = find_similar_document(st.session_state.ocr_text, session)
                                 if similar_doc:
                                     st.info(f"📄 類似書類を発見: {similar_doc.category} (類似度: {score:.1%})")
                                     st.session_state.document_pattern = similar_doc
-                            finally:
-                                session.close()
                         
                     except Exception as e:
+                        count_event('errors', stage='app_ocr')
                         st.error(f"❌ OCRエラー: {str(e)}")
         
         with col2:
             # PDFプレビュー
             st.subheader("PDFプレビュー")
             try:
-                # pdf2imageでプレビュー生成
-                pdf_bytes = uploaded_file.getbuffer()
-                pages = convert_from_bytes(pdf_bytes, dpi=100, first_page=1, last_page=1)
-                if pages:
-                    st.image(pages[0], caption="1ページ目", use_column_width=True)
+                if thumbnail_cache:
+                    # 表示中のページだけを描画し、描画済みのページはキャッシュから表示
+                    page_count = thumbnail_cache.page_count(pdf_buffer, upload_hash)
+                    first_page = 1
+                    if page_count > PREVIEW_PAGES_PER_VIEW:
+                        first_page = st.number_input(
+                            f"表示するページ（全{page_count}ページ）",
+                            min_value=1,
+                            max_value=page_count,
+                            value=1,
+                            step=PREVIEW_PAGES_PER_VIEW,
+                            key="preview_first_page"
+                        )
+                    last_page = min(first_page + PREVIEW_PAGES_PER_VIEW - 1, page_count)
+                    for page_number in range(first_page, last_page + 1):
+                        st.image(
+                            thumbnail_cache.get(pdf_buffer, page_number, upload_hash),
+                            caption=f"{page_number}ページ目",
+                            use_column_width=True
+                        )
+                else:
+                    # pdf2imageでプレビュー生成
+                    pages = convert_from_bytes(pdf_buffer, dpi=100, first_page=1, last_page=1)
+                    if pages:
+                        st.image(pages[0], caption="1ページ目", use_column_width=True)
             except Exception as e:
                 st.error(f"PDFプレビューエラー: {str(e)}")
         
@@ -205,7 +314,7 @@ if uploaded_file:
                     if not os.getenv('OPENAI_API_KEY') and not (IS_PRODUCTION and 'OPENAI_API_KEY' in st.secrets):
                         st.error("OpenAI APIキーを設定してください")
                     else:
-                        with st.spinner("正規表現を生成中..."):
+                        with st.spinner("正規表現を生成中..."), stage_timer('app_generate'):
                             try:
                                 patterns = generate_regex_patterns(
                                     st.session_state.ocr_text,
@@ -214,6 +323,7 @@ if uploaded_file:
                                 st.session_state.current_patterns = patterns
                                 st.success(f"✅ {len(patterns)}個のパターンを生成しました！")
                             except Exception as e:
+                                count_event('errors', stage='app_generate')
                                 st.error(f"生成エラー: {str(e)}")
                 
                 # パターンの表示と編集
@@ -232,14 +342,41 @@ if uploaded_file:
                 # 金額の抽出
                 if st.button("💴 金額を抽出", type="primary", use_container_width=True):
                     if st.session_state.current_patterns:
-                        extracted = extract_amounts_with_patterns(
-                            st.session_state.ocr_text,
-                            st.session_state.current_patterns
-                        )
+                        # ページごとに抽出して途中結果を表示（一致数・実行時間は保存時に統計として記録する）
+                        run_stats = {}
+                        extractor = PageExtractor(st.session_state.current_patterns, run_stats)
+                        pages = st.session_state.ocr_pages or [{'page_number': 1, 'text': st.session_state.ocr_text}]
+                        live_results = st.empty()
+                        for page in pages:
+                            if extractor.add_page(page['page_number'], page.get('text')):
+                                render_extracted_values(live_results, extractor.values)
+                        live_results.empty()
+                        extractor.report_errors()
+                        extracted = extractor.values
                         st.session_state.extracted_values = extracted
+                        st.session_state.pattern_run_stats = run_stats
                         st.success(f"✅ {len(extracted)}個の金額を抽出しました！")
+                        # コンパイルできなかった・拒否した・時間切れになったパターンを表示
+                        for pattern, error in extractor.errors.items():
+                            st.warning(f"⚠️ 適用できなかったパターン: {pattern} ({error})")
                     else:
                         st.warning("⚠️ 先に正規表現パターンを生成してください。")
+                
+                # 座標付きのテキスト（Azure OCR）がある場合は、ラベルの右・下にある金額を抽出できる
+                if st.session_state.text_elements:
+                    layout_labels = st.text_input(
+                        "ラベル（カンマ区切り）",
+                        value=",".join(DEFAULT_LABELS),
+                        key="layout_labels"
+                    )
+                    if st.button("📐 ラベルの右・下から金額を抽出", use_container_width=True):
+                        extracted = extract_amounts_by_layout(
+                            st.session_state.text_elements,
+                            [label.strip() for label in layout_labels.split(",") if label.strip()]
+                        )
+                        st.session_state.extracted_values = extracted
+                        st.session_state.pattern_run_stats = {}
+                        st.success(f"✅ レイアウトから{len(extracted)}個の金額を抽出しました！")
             
             with col2:
                 st.subheader("💰 抽出結果")
@@ -256,7 +393,10 @@ if uploaded_file:
                                 disabled=True
                             )
                         with col_b:
-                            st.caption(f"元: {value['raw']}")
+                            if value.get('page_number'):
+                                st.caption(f"元: {value['raw']}（{value['page_number']}ページ）")
+                            else:
+                                st.caption(f"元: {value['raw']}")
                     
                     # 修正が必要な場合
                     st.markdown("---")
@@ -269,7 +409,7 @@ if uploaded_file:
                     )
                     
                     if missing_value and st.button("🔧 パターンを改善"):
-                        with st.spinner("パターンを改善中..."):
+                        with st.spinner("パターンを改善中..."), stage_timer('app_improve'):
                             try:
                                 improved_patterns = improve_regex_patterns(
                                     st.session_state.ocr_text,
@@ -281,6 +421,7 @@ if uploaded_file:
                                 st.success("✅ パターンを改善しました！")
                                 st.rerun()
                             except Exception as e:
+                                count_event('errors', stage='app_improve')
                                 st.error(f"改善エラー: {str(e)}")
     
     with tab3:
@@ -304,39 +445,51 @@ if uploaded_file:
             st.markdown("---")
             if st.button("💾 結果を保存", type="primary", use_container_width=True):
                 if save_to_db:
-                    session = get_session()
                     try:
-                        # 書類パターンを保存
-                        if not st.session_state.document_pattern:
-                            pattern = save_document_pattern(
-                                selected_category if selected_category != "自動判別" else "その他財産書類",
-                                st.session_state.ocr_text,
-                                st.session_state.current_patterns,
+                        with stage_timer('app_save'), session_scope() as session:
+                            # 書類パターンを保存
+                            if not st.session_state.document_pattern:
+                                pattern = save_document_pattern(
+                                    selected_category if selected_category != "自動判別" else "その他財産書類",
+                                    st.session_state.ocr_text,
+                                    st.session_state.current_patterns,
+                                    session
+                                )
+                                st.session_state.document_pattern = pattern
+                            else:
+                                # 既存パターンを更新（成功回数はDB側で加算、パターンは編集された場合のみ置き換える）
+                                pattern = st.session_state.document_pattern
+                                patterns_changed = st.session_state.current_patterns != pattern.get_patterns()
+                                update_pattern_success(
+                                    pattern.id, session,
+                                    regex_patterns=st.session_state.current_patterns if patterns_changed else None,
+                                    previous_patterns=pattern.get_patterns()
+                                )
+                                if patterns_changed:
+                                    # 他の処理が同時に追加したパターンも含めて読み直す
+                                    pattern = session.get(DocumentPattern, pattern.id)
+                                    st.session_state.document_pattern = pattern
+                            
+                            # パターンごとの一致数・採用数・実行時間を加算
+                            save_pattern_statistics(
+                                pattern.id,
+                                summarize_run(st.session_state.pattern_run_stats, st.session_state.extracted_values),
                                 session
                             )
-                            st.session_state.document_pattern = pattern
-                        else:
-                            # 既存パターンを更新
-                            pattern = st.session_state.document_pattern
-                            pattern.regex_patterns = st.session_state.current_patterns
-                            pattern.success_count += 1
-                            session.commit()
                         
-                        # 抽出履歴を保存
-                        history = ExtractionHistory(
-                            document_category=selected_category,
-                            ocr_text=st.session_state.ocr_text[:1000],
-                            used_patterns=st.session_state.current_patterns,
-                            extracted_values=[v['normalized'] for v in st.session_state.extracted_values]
-                        )
-                        session.add(history)
-                        session.commit()
+                            # 抽出履歴を保存
+                            history = ExtractionHistory(
+                                document_category=selected_category,
+                                ocr_text=st.session_state.ocr_text[:1000],
+                                used_patterns=st.session_state.current_patterns,
+                                extracted_values=[v['normalized'] for v in st.session_state.extracted_values]
+                            )
+                            session.add(history)
                         
                         st.success("✅ データベースに保存しました！")
                     except Exception as e:
+                        count_event('errors', stage='app_save')
                         st.error(f"保存エラー: {str(e)}")
-                    finally:
-                        session.close()
                 
                 # 結果をダウンロード可能にする
                 result_data = {
@@ -357,62 +510,103 @@ if uploaded_file:
     with tab4:
         st.header("統計情報")
         
-        if save_to_db:
-            session = get_session()
+        # 工程別の処理時間（このプロセスで処理した分）
+        stage_summary = get_metrics().stage_summary()
+        if stage_summary:
+            import pandas as pd
+            st.subheader("⏱️ 工程別の処理時間")
+            timing_df = pd.DataFrame([
+                {
+                    "工程": stage,
+                    "件数": stats["count"],
+                    "エラー": stats["errors"],
+                    "p50 (ms)": round(stats["p50"] * 1000, 1),
+                    "p95 (ms)": round(stats["p95"] * 1000, 1),
+                    "最大 (ms)": round(stats["max"] * 1000, 1),
+                }
+                for stage, stats in stage_summary.items()
+            ])
+            st.dataframe(timing_df, hide_index=True)
+            with st.expander("カウンタ（キャッシュ・API呼び出し・トークン）"):
+                st.dataframe(pd.DataFrame([
+                    {"名前": name, "ラベル": ", ".join(f"{k}={v}" for k, v in labels), "値": value}
+                    for (name, labels), value in sorted(get_metrics().counters().items())
+                ]), hide_index=True)
+            if slow_patterns():
+                with st.expander("🐢 時間のかかった正規表現パターン"):
+                    st.dataframe(pd.DataFrame([
+                        {
+                            "パターン": pattern,
+                            "回数": stats["count"],
+                            "最大 (ms)": round(stats["max_seconds"] * 1000, 1),
+                            "時間切れ": stats["timeouts"],
+                        }
+                        for pattern, stats in slow_patterns()
+                    ]), hide_index=True)
+        
+        # タブを開いていなくても毎回実行されるため、表示を選んだ場合だけ集計する
+        if save_to_db and st.toggle("📊 パターン統計を表示", key="show_pattern_statistics"):
             try:
-                # 書類パターンの統計
-                patterns = session.query(DocumentPattern).all()
+                with session_scope() as session:
+                    # 書類パターンの統計（カテゴリ別にDB側で集計）
+                    category_stats = get_category_statistics(session)
                 
-                if patterns:
-                    st.subheader("📈 書類パターン統計")
+                    if category_stats:
+                        st.subheader("📈 書類パターン統計")
                     
-                    # カテゴリ別の統計
-                    category_stats = {}
-                    for pattern in patterns:
-                        if pattern.category not in category_stats:
-                            category_stats[pattern.category] = {
-                                "count": 0,
-                                "success": 0,
-                                "failure": 0
-                            }
-                        category_stats[pattern.category]["count"] += 1
-                        category_stats[pattern.category]["success"] += pattern.success_count
-                        category_stats[pattern.category]["failure"] += pattern.failure_count
-                    
-                    # 統計表の表示
-                    import pandas as pd
-                    df = pd.DataFrame.from_dict(category_stats, orient='index')
-                    df['成功率'] = df.apply(
-                        lambda row: row['success'] / (row['success'] + row['failure']) * 100 
-                        if (row['success'] + row['failure']) > 0 else 0, 
-                        axis=1
-                    )
-                    df = df.round(1)
-                    st.dataframe(df)
+                        # 統計表の表示
+                        import pandas as pd
+                        df = pd.DataFrame.from_dict(category_stats, orient='index')
+                        df['成功率'] = df.apply(
+                            lambda row: row['success'] / (row['success'] + row['failure']) * 100 
+                            if (row['success'] + row['failure']) > 0 else 0, 
+                            axis=1
+                        )
+                        df = df.round(1)
+                        st.dataframe(df)
+                        
+                        # 現在の書類パターンの正規表現ごとの採用実績（上から順に適用される）
+                        if st.session_state.document_pattern:
+                            ranking = get_pattern_ranking(st.session_state.document_pattern.id, session)
+                            if ranking:
+                                st.subheader("🔎 パターン別の採用実績")
+                                st.dataframe(pd.DataFrame([
+                                    {
+                                        "パターン": row["regex"],
+                                        "実行回数": row["runs"],
+                                        "一致数": row["matches"],
+                                        "採用数": row["accepted"],
+                                        "平均 (ms)": round(row["mean_seconds"] * 1000, 2),
+                                        "整理対象": "✓" if row["prunable"] else "",
+                                    }
+                                    for row in ranking
+                                ]), hide_index=True)
+                        
+                        # 採用実績順に並べ替え、一度も採用されないパターンを削除
+                        if st.button(f"🧹 パターンを整理（{PATTERN_PRUNE_MIN_RUNS}回以上採用されないパターンを削除）"):
+                            pruned = prune_patterns(session)
+                            removed = sum(len(dropped) for _, dropped in pruned)
+                            # 表示中の書類パターンを整理後の内容で読み直し、編集欄も作り直す
+                            if st.session_state.document_pattern:
+                                st.session_state.document_pattern = session.get(
+                                    DocumentPattern, st.session_state.document_pattern.id
+                                )
+                                for key in [key for key in st.session_state if re.fullmatch(r"pattern_\d+", str(key))]:
+                                    del st.session_state[key]
+                            st.success(f"✅ {len(pruned)}件の書類パターンを整理し、{removed}個のパターンを削除しました")
                     
-                    # 最近の抽出履歴
-                    st.subheader("📋 最近の抽出履歴")
-                    recent_history = session.query(ExtractionHistory).order_by(
-                        ExtractionHistory.created_at.desc()
-                    ).limit(10).all()
+                        # 最近の抽出履歴
+                        st.subheader("📋 最近の抽出履歴")
+                        recent_history = get_recent_history(session, limit=10)
                     
-                    for history in recent_history:
-                        with st.expander(f"{history.document_category} - {history.created_at.strftime('%Y/%m/%d %H:%M')}"):
-                            st.write(f"抽出値: {history.extracted_values}")
-                            st.write(f"使用パターン数: {len(history.used_patterns) if history.used_patterns else 0}")
-                else:
-                    st.info("まだデータがありません。書類を処理してパターンを保存してください。")
+                        for history in recent_history:
+                            with st.expander(f"{history.document_category} - {history.created_at.strftime('%Y/%m/%d %H:%M')}"):
+                                st.write(f"抽出値: {history.extracted_values}")
+                                st.write(f"使用パターン数: {len(history.used_patterns) if history.used_patterns else 0}")
+                    else:
+                        st.info("まだデータがありません。書類を処理してパターンを保存してください。")
             except Exception as e:
                 st.error(f"統計情報取得エラー: {str(e)}")
-            finally:
-                session.close()
-    
-    # 一時ファイルのクリーンアップ
-    if os.path.exists(temp_pdf_path):
-        try:
-            os.remove(temp_pdf_path)
-        except:
-            pass
 
 else:
     # アップロードされていない場合の表示
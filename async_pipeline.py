@@ -0,0 +1,157 @@
+# 非同期処理パイプライン（複数書類のOCR→パターン検索→LLM生成→保存を並行実行）
+import asyncio
+import hashlib
+import time
+
+from batch_process import (
+    AUTO_CATEGORY, _load_modules, find_saved_pattern, get_batch_ocr_cache, save_extraction, write_result
+)
+from client_registry import get_client_registry
+from llm_regex_generator import (
+    extract_amounts_by_page, extract_amounts_with_patterns, generate_regex_patterns_async, set_llm_response_cache
+)
+from ocr_processor_pdf2image import (
+    OCRResult, analyze_document_azure_async, analyze_document_google_async, get_ocr_model_id
+)
+from pattern_stats import summarize_run
+
+
+class AsyncPipeline:
+    """書類単位の処理を並行実行し、工程ごとに同時実行数を制限するパイプライン
+
+    OCR・LLMはAPIの上限に合わせ、DB書き込みは接続プールのサイズに合わせて制限する。
+    PDFを読み込んでから結果を保存するまでの書類数もdocument_concurrencyで制限し、
+    大量のPDFのバイト列を同時にメモリに保持しないようにする。
+    ブロッキングするDB操作・キャッシュの読み書き・正規表現の抽出はスレッドで実行する。
+    """
+
+    def __init__(self, output_dir, use_azure=True, save_to_db=True,
+                 ocr_concurrency=8, llm_concurrency=4, db_concurrency=2, document_concurrency=None):
+        self.output_dir = output_dir
+        self.use_azure = use_azure
+        self.save_to_db = save_to_db
+        self.config, self.database = _load_modules()
+        self.ocr_cache = get_batch_ocr_cache(self.config)
+        self._ocr_limit = asyncio.Semaphore(ocr_concurrency)
+        self._llm_limit = asyncio.Semaphore(llm_concurrency)
+        self._db_limit = asyncio.Semaphore(db_concurrency)
+        # 既定ではOCRの同時実行数の2倍（OCR待ちの書類とLLM・DB待ちの書類が重なる程度）
+        self._document_limit = asyncio.Semaphore(document_concurrency or ocr_concurrency * 2)
+        self.counter_buffer = None
+        self.history_writer = None
+        if save_to_db:
+            set_llm_response_cache(self.database.get_llm_response_cache())
+            # 成功回数の加算と抽出履歴は1件ずつではなくまとめて書き込む
+            self.counter_buffer = self.database.get_pattern_counter_buffer()
+            self.history_writer = self.database.get_history_writer()
+
+    async def _ocr(self, pdf_data, sha256):
+        """OCRを実行（キャッシュがあれば再利用）"""
+        provider = "azure" if self.use_azure else "google"
+        model_id = get_ocr_model_id(self.use_azure)
+        if self.ocr_cache:
+            cached_result = await asyncio.to_thread(self.ocr_cache.get, pdf_data, provider, model_id, sha256)
+            if cached_result:
+                return OCRResult.from_dict(cached_result)
+
+        async with self._ocr_limit:
+            if self.use_azure:
+                ocr_result = await analyze_document_azure_async(pdf_data)
+            else:
+                ocr_result = await analyze_document_google_async(pdf_data)
+
+        if self.ocr_cache and not ocr_result.errors:
+            await asyncio.to_thread(
+                self.ocr_cache.set, pdf_data, provider, model_id, ocr_result.to_dict(), sha256
+            )
+        return ocr_result
+
+    async def process_document(self, pdf_path, category):
+        """1件のPDFを処理して結果JSONを保存（batch_process.process_documentと同じ結果）"""
+        start = time.perf_counter()
+        pdf_data = await asyncio.to_thread(_read_bytes, pdf_path)
+        sha256 = hashlib.sha256(pdf_data).hexdigest()
+
+        ocr_result = await self._ocr(pdf_data, sha256)
+
+        document_pattern = None
+        if self.save_to_db:
+            async with self._db_limit:
+                document_pattern = await asyncio.to_thread(
+                    find_saved_pattern, self.database, category, ocr_result.text
+                )
+
+        if document_pattern and document_pattern.get_patterns():
+            patterns = document_pattern.get_patterns()
+        else:
+            async with self._llm_limit:
+                patterns = await generate_regex_patterns_async(
+                    ocr_result.text,
+                    document_category=category if category != AUTO_CATEGORY else None
+                )
+
+        # パターンごとに正規表現ワーカーとの往復があるため、イベントループを止めないようスレッドで実行
+        run_stats = {}
+        if ocr_result.pages:
+            extracted_values = await asyncio.to_thread(
+                extract_amounts_by_page, ocr_result.pages, patterns, run_stats
+            )
+        else:
+            extracted_values = await asyncio.to_thread(
+                extract_amounts_with_patterns, ocr_result.text, patterns, run_stats
+            )
+
+        if self.save_to_db:
+            async with self._db_limit:
+                await asyncio.to_thread(
+                    save_extraction, self.database, category, ocr_result.text,
+                    patterns, extracted_values, document_pattern, self.counter_buffer, self.history_writer,
+                    summarize_run(run_stats, extracted_values)
+                )
+
+        output_path = await asyncio.to_thread(
+            write_result, self.output_dir, pdf_path, sha256, category,
+            patterns, extracted_values, ocr_result.errors
+        )
+
+        return {
+            "file": pdf_path,
+            "sha256": sha256,
+            "status": "ok",
+            "output": str(output_path),
+            "pages": len(ocr_result.pages),
+            "values": len(extracted_values),
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    async def run(self, jobs, on_result=None):
+        """(PDFパス, カテゴリ) のリストを並行処理し、完了順に on_result(パス, 結果, 例外) を呼ぶ"""
+        async def run_job(pdf_path, category):
+            # PDFの読み込みは同時に処理する書類数の上限の範囲内で行う
+            async with self._document_limit:
+                try:
+                    return pdf_path, await self.process_document(pdf_path, category), None
+                except Exception as e:
+                    return pdf_path, None, e
+
+        results = []
+        tasks = [asyncio.create_task(run_job(pdf_path, category)) for pdf_path, category in jobs]
+        try:
+            for task in asyncio.as_completed(tasks):
+                pdf_path, record, error = await task
+                if on_result:
+                    on_result(pdf_path, record, error)
+                results.append((pdf_path, record, error))
+        finally:
+            if self.counter_buffer is not None:
+                await asyncio.to_thread(self.counter_buffer.flush)
+            if self.history_writer is not None:
+                await asyncio.to_thread(self.history_writer.flush)
+            # このループで作成した非同期クライアントの接続を閉じる
+            await get_client_registry().close_loop_clients()
+        return results
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
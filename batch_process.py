@@ -0,0 +1,302 @@
+# 一括処理コマンド（Streamlitを使わずにOCR→パターン検索→金額抽出→保存を実行）
+#
+# 使い方:
+#   python batch_process.py PDFディレクトリ --workers 4
+#   python batch_process.py manifest.txt --category 預金通帳 --no-save
+# manifest.txt は1行に「PDFのパス[,書類カテゴリ]」を記載する。
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+AUTO_CATEGORY = "自動判別"
+DEFAULT_CATEGORY = "その他財産書類"
+
+
+def _load_modules():
+    """app.pyと同じ判定で設定・データベースモジュールを読み込む"""
+    if os.getenv('STREAMLIT_RUNTIME_ENV') == 'cloud' or os.getenv('DATABASE_URL'):
+        import config_web as config
+        import database_models_postgres as database
+    else:
+        import config
+        import database_models as database
+    return config, database
+
+
+def collect_jobs(source, default_category):
+    """ディレクトリまたはマニフェストから (PDFパス, カテゴリ) のリストを作成"""
+    source = Path(source)
+    if source.is_dir():
+        return [(str(path), default_category) for path in sorted(source.rglob("*.pdf"))]
+
+    jobs = []
+    base_dir = source.parent
+    for line in source.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        path, _, category = line.partition(",")
+        path = Path(path.strip())
+        if not path.is_absolute():
+            path = base_dir / path
+        jobs.append((str(path), category.strip() or default_category))
+    return jobs
+
+
+def load_checkpoint(checkpoint_path):
+    """処理済みのファイル（パスとハッシュ）を読み込む"""
+    done = set()
+    if checkpoint_path.exists():
+        for line in checkpoint_path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add((record["file"], record["sha256"]))
+    return done
+
+
+def get_batch_ocr_cache(config):
+    """OCRキャッシュを取得（作成できない場合はNone）"""
+    from ocr_cache import get_ocr_cache
+    try:
+        return get_ocr_cache(config.OCR_CACHE_DIR, config.OCR_CACHE_MAX_BYTES)
+    except Exception as e:
+        print(f"OCRキャッシュ初期化エラー: {e}")
+        return None
+
+
+def find_saved_pattern(database, category, ocr_text):
+    """自動判別の場合に類似書類のパターンを検索"""
+    if category != AUTO_CATEGORY:
+        return None
+    with database.session_scope() as session:
+        document_pattern, _ = database.find_similar_document(ocr_text, session)
+    return document_pattern
+
+
+def save_extraction(database, category, ocr_text, patterns, extracted_values, document_pattern,
+                    counter_buffer=None, history_writer=None, pattern_stats=None):
+    """書類パターンと抽出履歴を保存（tab3の保存処理と同じ）
+
+    counter_bufferを指定した場合、パターンが変わらなければ成功回数の加算をまとめて書き込む。
+    history_writerを指定した場合、抽出履歴はまとめてINSERTする。
+    pattern_statsにはpattern_stats.summarize_runで作成したパターンごとの統計を渡す。
+    """
+    history = dict(
+        document_category=category,
+        ocr_text=ocr_text[:1000],
+        used_patterns=patterns,
+        extracted_values=[v['normalized'] for v in extracted_values]
+    )
+    with database.session_scope() as session:
+        if document_pattern is None:
+            pattern_id = database.save_document_pattern(
+                category if category != AUTO_CATEGORY else DEFAULT_CATEGORY,
+                ocr_text,
+                patterns,
+                session
+            ).id
+        elif counter_buffer is not None and patterns == document_pattern.get_patterns():
+            pattern_id = document_pattern.id
+            counter_buffer.increment(pattern_id, success=1)
+        else:
+            pattern_id = document_pattern.id
+            database.update_pattern_success(
+                pattern_id, session, regex_patterns=patterns, previous_patterns=document_pattern.get_patterns()
+            )
+        if pattern_stats:
+            database.save_pattern_statistics(pattern_id, pattern_stats, session)
+        if history_writer is None:
+            session.add(database.ExtractionHistory(**history))
+    if history_writer is not None:
+        history_writer.add(**history)
+
+
+def write_result(output_dir, pdf_path, sha256, category, patterns, extracted_values, ocr_errors):
+    """tab3のダウンロードと同じ形式で結果JSONを保存"""
+    result_data = {
+        "timestamp": datetime.now().isoformat(),
+        "document_category": category,
+        "patterns": patterns,
+        "extracted_values": extracted_values,
+        "source_file": pdf_path,
+        "ocr_errors": ocr_errors
+    }
+    output_path = Path(output_dir) / f"{Path(pdf_path).stem}_{sha256[:8]}.json"
+    output_path.write_text(json.dumps(result_data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return output_path
+
+
+def process_document(pdf_path, category, output_dir, use_azure, save_to_db):
+    """1件のPDFを処理して結果JSONを保存（ワーカープロセスで実行）"""
+    config, database = _load_modules()
+    from ocr_processor_pdf2image import (
+        OCRResult, analyze_document_azure, analyze_document_google, get_ocr_model_id
+    )
+    from llm_regex_generator import (
+        extract_amounts_by_page, extract_amounts_with_patterns, generate_regex_patterns, set_llm_response_cache
+    )
+    from pattern_stats import summarize_run
+
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        pdf_data = f.read()
+    sha256 = hashlib.sha256(pdf_data).hexdigest()
+
+    # OCR（キャッシュがあれば再利用）
+    ocr_cache = get_batch_ocr_cache(config)
+    provider = "azure" if use_azure else "google"
+    model_id = get_ocr_model_id(use_azure)
+    cached_result = ocr_cache.get(pdf_data, provider, model_id, sha256) if ocr_cache else None
+    if cached_result:
+        ocr_result = OCRResult.from_dict(cached_result)
+    else:
+        ocr_result = analyze_document_azure(pdf_data) if use_azure else analyze_document_google(pdf_data)
+        if ocr_cache and not ocr_result.errors:
+            ocr_cache.set(pdf_data, provider, model_id, ocr_result.to_dict(), sha256)
+
+    # 類似書類のパターンを検索し、なければLLMで生成
+    document_pattern = None
+    if save_to_db:
+        set_llm_response_cache(database.get_llm_response_cache())
+        document_pattern = find_saved_pattern(database, category, ocr_result.text)
+
+    if document_pattern and document_pattern.get_patterns():
+        patterns = document_pattern.get_patterns()
+    else:
+        patterns = generate_regex_patterns(
+            ocr_result.text,
+            document_category=category if category != AUTO_CATEGORY else None
+        )
+
+    # ページごとに抽出し、抽出結果にページ番号を付ける
+    run_stats = {}
+    if ocr_result.pages:
+        extracted_values = extract_amounts_by_page(ocr_result.pages, patterns, run_stats)
+    else:
+        extracted_values = extract_amounts_with_patterns(ocr_result.text, patterns, run_stats)
+
+    if save_to_db:
+        # ワーカープロセスごとにまとめて書き込み、プロセス終了時に残りを書き込む
+        save_extraction(
+            database, category, ocr_result.text, patterns, extracted_values, document_pattern,
+            database.get_pattern_counter_buffer(), database.get_history_writer(),
+            summarize_run(run_stats, extracted_values)
+        )
+
+    output_path = write_result(
+        output_dir, pdf_path, sha256, category, patterns, extracted_values, ocr_result.errors
+    )
+
+    return {
+        "file": pdf_path,
+        "sha256": sha256,
+        "status": "ok",
+        "output": str(output_path),
+        "pages": len(ocr_result.pages),
+        "values": len(extracted_values),
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="財産書類PDFの一括OCR・金額抽出")
+    parser.add_argument("source", help="PDFを含むディレクトリ、またはマニフェストファイル")
+    parser.add_argument("--output-dir", help="結果JSONの出力先（既定: OUTPUT_DIR/batch）")
+    parser.add_argument("--checkpoint", help="進捗ファイル（既定: 出力先/checkpoint.jsonl）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--category", default=AUTO_CATEGORY, help="書類カテゴリ（既定: 自動判別）")
+    parser.add_argument("--google", action="store_true", help="Azureの代わりにGoogle OCRを使用")
+    parser.add_argument("--no-save", action="store_true", help="データベースに保存しない")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="プロセスプールの代わりにasyncioで複数書類を同時に処理")
+    parser.add_argument("--ocr-concurrency", type=int, default=8, help="--async時のOCR同時実行数")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="--async時のLLM同時実行数")
+    parser.add_argument("--db-concurrency", type=int, default=2, help="--async時のDB書き込み同時実行数")
+    parser.add_argument("--document-concurrency", type=int, default=None,
+                        help="--async時に同時に処理する書類数（既定: OCR同時実行数の2倍）")
+    args = parser.parse_args(argv)
+
+    config, _ = _load_modules()
+    output_dir = Path(args.output_dir) if args.output_dir else Path(config.OUTPUT_DIR) / "batch"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else output_dir / "checkpoint.jsonl"
+
+    jobs = collect_jobs(args.source, args.category)
+    done = load_checkpoint(checkpoint_path)
+    pending = []
+    for pdf_path, category in jobs:
+        try:
+            with open(pdf_path, "rb") as f:
+                sha256 = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            print(f"読み込みエラー: {pdf_path}: {e}")
+            continue
+        if (pdf_path, sha256) not in done:
+            pending.append((pdf_path, category))
+
+    print(f"対象: {len(jobs)}件 / 処理済み: {len(jobs) - len(pending)}件 / 今回処理: {len(pending)}件")
+    if not pending:
+        return 0
+
+    start = time.perf_counter()
+    succeeded = 0
+    failed = 0
+    total_pages = 0
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        def record_result(pdf_path, record, error):
+            nonlocal succeeded, failed, total_pages
+            if error is None:
+                succeeded += 1
+                total_pages += record["pages"]
+                print(f"✅ {pdf_path}: {record['values']}件 ({record['seconds']}秒)")
+            else:
+                record = {"file": pdf_path, "status": "error", "error": str(error)}
+                failed += 1
+                print(f"❌ {pdf_path}: {error}")
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+
+        if args.use_async:
+            import asyncio
+            from async_pipeline import AsyncPipeline
+            pipeline = AsyncPipeline(
+                str(output_dir),
+                use_azure=not args.google,
+                save_to_db=not args.no_save,
+                ocr_concurrency=args.ocr_concurrency,
+                llm_concurrency=args.llm_concurrency,
+                db_concurrency=args.db_concurrency,
+                document_concurrency=args.document_concurrency
+            )
+            asyncio.run(pipeline.run(pending, record_result))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = {
+                    executor.submit(
+                        process_document, pdf_path, category, str(output_dir), not args.google, not args.no_save
+                    ): pdf_path
+                    for pdf_path, category in pending
+                }
+                for future in as_completed(futures):
+                    try:
+                        record_result(futures[future], future.result(), None)
+                    except Exception as e:
+                        record_result(futures[future], None, e)
+
+    elapsed = time.perf_counter() - start
+    print(f"完了: 成功 {succeeded}件 / 失敗 {failed}件 / {elapsed:.1f}秒")
+    print(f"スループット: {succeeded / elapsed * 60:.1f}件/分, {total_pages / elapsed:.2f}ページ/秒")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
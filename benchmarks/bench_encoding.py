@@ -0,0 +1,108 @@
+# OCR送信画像のエンコード設定ごとのサイズ・エンコード時間・OCR精度
+#
+# 使い方: python benchmarks/bench_encoding.py [--fixtures DIR] [--ocr google]
+#   --fixtures: PDFと同名の .txt（正解テキスト）を置いたディレクトリ（省略時は合成PDF）
+#   --ocr google: Cloud Vision APIで認識し、正解テキストとの一致率を計測（GOOGLE_CREDENTIALS_JSONが必要）
+# pdf2imageとpoppler（pdftoppm）が必要
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf2image import convert_from_bytes
+from image_encoding import ImageEncoding, encode_image
+from ocr_processor_pdf2image import _detect_page_text, get_pdf_page_sizes
+from pdf_fixtures import make_pdf_with_text
+
+# (名前, 設定, 固定dpi)
+CONFIGS = [
+    ("従来 (RGB PNG 200dpi)", ImageEncoding(image_format='PNG', mode='RGB'), 200),
+    ("グレー PNG", ImageEncoding(image_format='PNG', mode='L'), None),
+    ("グレー PNG 最適化", ImageEncoding(image_format='PNG', mode='L', optimize=True), None),
+    ("2値 PNG", ImageEncoding(image_format='PNG', mode='1'), None),
+    ("グレー JPEG q85", ImageEncoding(image_format='JPEG', mode='L', quality=85), None),
+    ("グレー WebP q80", ImageEncoding(image_format='WEBP', mode='L', quality=80), None),
+]
+
+
+def load_fixtures(directory):
+    """(名前, PDF, 正解テキスト) のリストを読み込み"""
+    fixtures = []
+    for pdf_path in sorted(Path(directory).glob("*.pdf")):
+        text_path = pdf_path.with_suffix(".txt")
+        expected = text_path.read_text(encoding="utf-8") if text_path.exists() else None
+        fixtures.append((pdf_path.name, pdf_path.read_bytes(), expected))
+    return fixtures
+
+
+def _normalize(text):
+    return re.sub(r"\s+", "", text or "")
+
+
+def _vision_client():
+    from google.cloud import vision
+    from google.oauth2 import service_account
+    credentials_dict = json.loads(os.environ["GOOGLE_CREDENTIALS_JSON"])
+    credentials = service_account.Credentials.from_service_account_info(credentials_dict)
+    return vision.ImageAnnotatorClient(credentials=credentials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR送信画像のエンコード設定の比較")
+    parser.add_argument("--fixtures")
+    parser.add_argument("--pages", type=int, default=4, help="合成PDFのページ数")
+    parser.add_argument("--ocr", choices=["google"])
+    args = parser.parse_args()
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        pdf_data, page_texts = make_pdf_with_text(args.pages)
+        fixtures = [("synthetic.pdf", pdf_data, "\n".join(page_texts))]
+    client = _vision_client() if args.ocr == "google" else None
+
+    print(f"{'設定':<24}{'KB/ページ':>10}{'描画ms':>10}{'エンコードms':>14}{'精度':>8}")
+    for name, encoding, fixed_dpi in CONFIGS:
+        total_bytes = 0
+        raster_seconds = 0.0
+        encode_seconds = 0.0
+        page_count = 0
+        accuracies = []
+
+        for _, pdf_data, expected in fixtures:
+            recognized = []
+            for page, (width, height) in sorted(get_pdf_page_sizes(pdf_data).items()):
+                dpi = fixed_dpi or encoding.choose_dpi(width, height, "google")
+                start = time.perf_counter()
+                img = convert_from_bytes(pdf_data, dpi=dpi, first_page=page, last_page=page)[0]
+                raster_seconds += time.perf_counter() - start
+
+                start = time.perf_counter()
+                data = encode_image(img, encoding)
+                encode_seconds += time.perf_counter() - start
+
+                total_bytes += len(data)
+                page_count += 1
+                if client:
+                    recognized.append(_detect_page_text(client, data) or "")
+
+            if client and expected:
+                accuracies.append(SequenceMatcher(
+                    None, _normalize(expected), _normalize("\n".join(recognized))
+                ).ratio())
+
+        accuracy = f"{sum(accuracies) / len(accuracies):.1%}" if accuracies else "-"
+        print(
+            f"{name:<24}{total_bytes / page_count / 1024:>10.1f}"
+            f"{raster_seconds / page_count * 1000:>10.1f}{encode_seconds / page_count * 1000:>14.1f}{accuracy:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# 抽出履歴の保存のベンチマーク（1件ずつcommit vs ExtractionHistoryWriterでまとめてINSERT）
+#
+# 使い方:
+#   python benchmarks/bench_history_writer.py --rows 5000               # 一時SQLiteファイル
+#   python benchmarks/bench_history_writer.py --url postgresql://...    # PostgreSQL
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+
+from database_engine import DatabaseEngine
+from history_writer import ExtractionHistoryWriter
+from migrations import apply_migrations
+
+
+def make_rows(count, seed):
+    rng = random.Random(seed)
+    return [{
+        "document_category": rng.choice(["預金通帳", "給与明細", "保険証券"]),
+        "ocr_text": "残高 " + " ".join(f"{rng.randint(1000, 9999999):,}円" for _ in range(40)),
+        "used_patterns": [r"([\d,]+)円", r"残高\s*([\d,]+)"],
+        "extracted_values": [rng.randint(1000, 9999999) for _ in range(5)],
+    } for _ in range(count)]
+
+
+def per_row_commit(database, models, rows):
+    """tab3と同じく1件ごとにsession.add + commit"""
+    for row in rows:
+        with database.session_scope() as session:
+            session.add(models.ExtractionHistory(**row))
+
+
+def buffered(database, models, rows, flush_size):
+    writer = ExtractionHistoryWriter(database.session_scope, models.ExtractionHistory, flush_size=flush_size)
+    for row in rows:
+        writer.add(**row)
+    writer.close()
+
+
+def count_rows(database, models):
+    with database.session_scope() as session:
+        return session.query(func.count(models.ExtractionHistory.id)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抽出履歴の保存のベンチマーク")
+    parser.add_argument("--url", help="データベースURL（省略時は一時SQLiteファイル）")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--flush-sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    temp_dir = None
+    url = args.url
+    if not url:
+        temp_dir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(temp_dir.name, 'history.db')}"
+    if url.startswith("postgresql"):
+        import database_models_postgres as models
+    else:
+        import database_models as models
+
+    database = DatabaseEngine(lambda: url, models.Base.metadata, migrate=apply_migrations)
+    rows = make_rows(args.rows, args.seed)
+    print(f"{database.get_engine().dialect.name} / {args.rows:,}行")
+
+    cases = [("1件ずつcommit", lambda: per_row_commit(database, models, rows))]
+    for flush_size in args.flush_sizes:
+        cases.append((f"まとめてINSERT ({flush_size}行ごと)",
+                      lambda flush_size=flush_size: buffered(database, models, rows, flush_size)))
+
+    baseline = None
+    for name, run in cases:
+        before = count_rows(database, models)
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        written = count_rows(database, models) - before
+        rows_per_second = written / seconds
+        baseline = baseline or rows_per_second
+        print(f"  {name:28s} {rows_per_second:10,.0f} 行/秒 ({rows_per_second / baseline:.1f}倍) 書き込み {written:,}行")
+
+    database.dispose()
+    if temp_dir:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
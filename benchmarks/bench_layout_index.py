@@ -0,0 +1,113 @@
+# ラベルの右・下にある金額の検索のベンチマーク（全要素の走査 vs 空間インデックス）
+#
+# 使い方: python benchmarks/bench_layout_index.py --lines 1000 5000 20000 --pages 10
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout_index import BELOW_LINES, DEFAULT_LABELS, TOLERANCE, LayoutIndex
+
+_WORDS = ["普通預金", "振込", "支店", "口座番号", "お客様番号", "備考", "摘要", "年月日", "利息", "手数料"]
+_LINE_HEIGHT = 10.0
+_LINE_PITCH = 14.0
+_PAGE_HEIGHT = 842.0
+
+
+def make_text_elements(lines, pages, rng):
+    """ラベル・金額・その他の行からなる合成のtext_elementsを生成
+
+    ページの行数が多い場合は縦に長いページとみなして座標を割り当てる。
+    ラベルの金額は同じ行の右、または次の行に置く。
+    """
+    elements = []
+    per_page = max(1, lines // pages)
+    for page in range(pages):
+        row = 0
+        count = 0
+        while count < per_page:
+            y = 40 + row * _LINE_PITCH
+            row += 1
+            kind = rng.random()
+            if kind < 0.1:
+                label = rng.choice(DEFAULT_LABELS)
+                elements.append({'text': label, 'x': 50.0, 'y': y, 'width': 30.0, 'height': _LINE_HEIGHT, 'page': page})
+                amount = f"{rng.randint(1000, 99999999):,}円"
+                if rng.random() < 0.7:
+                    elements.append({'text': amount, 'x': 300.0 + rng.random() * 100, 'y': y + rng.random(),
+                                     'width': 60.0, 'height': _LINE_HEIGHT, 'page': page})
+                else:
+                    row += 1
+                    elements.append({'text': amount, 'x': 45.0, 'y': y + _LINE_PITCH,
+                                     'width': 60.0, 'height': _LINE_HEIGHT, 'page': page})
+                count += 2
+            else:
+                # 金額を含む明細行を複数の列に並べる
+                for column in range(3):
+                    text = rng.choice(_WORDS) if column == 0 else f"{rng.randint(1, 9999999):,}"
+                    elements.append({'text': text, 'x': 50.0 + column * 150, 'y': y,
+                                     'width': 60.0, 'height': _LINE_HEIGHT, 'page': page})
+                count += 3
+    return elements
+
+
+def naive_find(index, label):
+    """全要素を走査して同じ結果を求める（インデックスを使わない場合）"""
+    results = []
+    boxes = [box for page in index.pages.values() for keys, items in page._rows.values() for box in items]
+    boxes = list({id(box): box for box in boxes}.values())
+    for label_box, after_label in index._labels.get(label, []):
+        page_boxes = [box for box in boxes if box.page == label_box.page and box is not label_box]
+        right = [box for box in page_boxes
+                 if box.x0 >= label_box.x1 - TOLERANCE and label_box.overlaps_rows(box)]
+        if right:
+            best = min(right, key=lambda box: box.x0)
+            results.append((label_box, best, 'right'))
+            continue
+        limit = (label_box.y1 - label_box.y0) * BELOW_LINES
+        below = [box for box in page_boxes
+                 if box.y0 >= label_box.y1 - TOLERANCE and box.y0 - label_box.y1 <= limit
+                 and label_box.overlaps_columns(box)]
+        if below:
+            results.append((label_box, min(below, key=lambda box: box.y0), 'below'))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ラベルの右・下にある金額の検索のベンチマーク")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        rng = random.Random(args.seed)
+        elements = make_text_elements(lines, args.pages, rng)
+
+        start = time.perf_counter()
+        index = LayoutIndex(elements)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = [(label_box, box, direction)
+                   for label in DEFAULT_LABELS for label_box, box, _, _, direction in index.find(label)]
+        indexed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        naive = [result for label in DEFAULT_LABELS for result in naive_find(index, label)]
+        naive_seconds = time.perf_counter() - start
+
+        queries = sum(len(index._labels.get(label, [])) for label in DEFAULT_LABELS)
+        same = [(a.x0, a.y0, b.x0, b.y0, d) for a, b, d in indexed] == [(a.x0, a.y0, b.x0, b.y0, d) for a, b, d in naive]
+        print(f"{len(elements):,}要素 / {args.pages}ページ / ラベル{queries}件")
+        print(f"  インデックス作成: {build_seconds * 1000:8.1f} ms")
+        print(f"  インデックス検索: {indexed_seconds * 1000:8.1f} ms ({indexed_seconds / max(queries, 1) * 1e6:.1f} µs/件)")
+        print(f"  全要素の走査:     {naive_seconds * 1000:8.1f} ms ({naive_seconds / max(queries, 1) * 1e6:.1f} µs/件)")
+        print(f"  結果一致:         {'OK' if same else 'NG'} ({len(indexed)}件)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# 金額抽出のベンチマーク（呼び出しごとにパターン文字列を渡す従来のre.finditer vs
+# 1回だけコンパイルしてキャッシュしたPatternSet。どちらもパターンごとに全文を走査する）
+#
+# 使い方: python benchmarks/bench_pattern_set.py --pages 200 --repeat 5
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pattern_set import PatternSet
+
+PATTERNS = [
+    r'(?:残高|金額|合計|計|額)[：:\s]*([¥￥]?[\d,]+)円?',
+    r'([¥￥][\d,]+)',
+    r'([\d,]+)円',
+    r'(?:[\d,]+)(?:\.[\d]+)?',
+    r'残高[：:\s]*([\d,]+)',
+    r'差引残高\s*([\d,]+)',
+    r'お支払金額\s*([¥￥]?[\d,]+)',
+    r'お預り金額\s*([\d,]+)',
+    r'支給額[：:\s]*([\d,]+)円',
+    r'年金額[：:\s]*([\d,]+)',
+    r'総支給額\s*([\d,]+)',
+    r'差引支給額\s*([\d,]+)',
+    r'所得税\s*([\d,]+)',
+    r'住民税\s*([\d,]+)',
+    r'解約返戻金[：:\s]*([¥￥]?[\d,]+)',
+    r'保険金額\s*([\d,]+)万?円',
+    r'評価額\s*([\d,]+)',
+    r'(?:定期|普通)預金\s+\S+\s+([\d,]+)',
+    r'合計金額[：:\s]*([¥￥]?[０-９\d,]+)',
+    r'([０-９,，]+)円',
+    r'^\s*([\d,]{4,})\s*$',
+    r'(?<=\s)([\d]{1,3}(?:,\d{3})+)(?=\s)',
+    r'金\s*([\d,]+)\s*円也',
+    r'(?i)total[:\s]*([\d,]+)',
+]
+
+_LINES = [
+    "{date} 普通預金 振込 {amount}円 残高 {balance}",
+    "差引残高 {balance}",
+    "お支払金額 ¥{amount}",
+    "支給額：{amount}円",
+    "所得税 {amount}  住民税 {amount2}",
+    "合計金額：￥{amount}",
+    "    {amount}    ",
+    "定期預金 満期 {amount}",
+    "金 {amount} 円也",
+    "備考 お客様番号 {number}",
+]
+
+
+def make_ocr_text(pages, rng):
+    """複数ページ分の合成OCRテキストを生成"""
+    lines = []
+    for page in range(pages):
+        lines.append(f"--- {page + 1} ページ ---")
+        for _ in range(60):
+            line = rng.choice(_LINES)
+            lines.append(line.format(
+                date=f"2024/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}",
+                amount=f"{rng.randint(100, 9999999):,}",
+                amount2=f"{rng.randint(100, 999999):,}",
+                balance=f"{rng.randint(1000, 99999999):,}",
+                number=rng.randint(10000000, 99999999),
+            ))
+    return "\n".join(lines)
+
+
+def legacy_normalize_amount(amount_str):
+    """従来の金額正規化"""
+    try:
+        amount_str = amount_str.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
+        amount_str = re.sub(r'[¥￥,円]', '', amount_str)
+        amount_str = amount_str.strip()
+        if amount_str:
+            return int(amount_str)
+        else:
+            return None
+    except:
+        return None
+
+
+def legacy_extract(text, patterns):
+    """従来の実装（呼び出しごとにパターン文字列をre.finditerに渡して全文を走査）"""
+    extracted_values = []
+    for pattern in patterns:
+        try:
+            for match in re.finditer(pattern, text, re.MULTILINE | re.IGNORECASE):
+                value = match.group(1) if match.groups() else match.group(0)
+                normalized_value = legacy_normalize_amount(value)
+                if normalized_value:
+                    extracted_values.append({
+                        'raw': value,
+                        'normalized': normalized_value,
+                        'pattern': pattern,
+                        'position': match.span()
+                    })
+        except Exception:
+            pass
+
+    unique_values = []
+    seen_normalized = set()
+    for value in extracted_values:
+        if value['normalized'] not in seen_normalized:
+            unique_values.append(value)
+            seen_normalized.add(value['normalized'])
+    return unique_values
+
+
+def _best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="金額抽出のベンチマーク")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"パターン数: {len(PATTERNS)}")
+
+    start = time.perf_counter()
+    pattern_set = PatternSet(PATTERNS)
+    print(f"コンパイル: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for pages in args.pages:
+        text = make_ocr_text(pages, rng)
+        legacy_seconds, expected = _best_of(args.repeat, lambda: legacy_extract(text, PATTERNS))
+        set_seconds, actual = _best_of(args.repeat, lambda: list(pattern_set.extract(text)))
+
+        print(f"{pages}ページ ({len(text):,}文字)")
+        print(f"  re.finditer x {len(PATTERNS)}: {legacy_seconds * 1000:.1f} ms")
+        print(f"  PatternSet:        {set_seconds * 1000:.1f} ms")
+        print(f"  結果一致:          {'OK' if actual == expected else 'NG'} ({len(actual)}件)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# PDFラスタライズのベンチマーク（並列数ごとのページ/秒）
+#
+# 使い方: python benchmarks/bench_rasterize.py --pages 64 --workers 1 2 4 8
+# pdf2imageとpoppler（pdftoppm）が必要
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_processor_pdf2image import iter_pdf_images
+from pdf_fixtures import make_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDFラスタライズのベンチマーク")
+    parser.add_argument("--pages", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--window", type=int, default=4)
+    parser.add_argument("--dpi", type=int, default=200)
+    args = parser.parse_args()
+
+    pdf_data = make_pdf(args.pages)
+    print(f"{args.pages}ページ / {args.dpi}dpi / 範囲 {args.window}ページ / CPU {os.cpu_count()}コア")
+
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        page_count = 0
+        for _ in iter_pdf_images(pdf_data, dpi=args.dpi, window=args.window, workers=workers):
+            page_count += 1
+        seconds = time.perf_counter() - start
+        pages_per_second = page_count / seconds
+        baseline = baseline or pages_per_second
+        print(f"  workers={workers}: {pages_per_second:.2f} ページ/秒 ({pages_per_second / baseline:.2f}倍)")
+
+
+if __name__ == "__main__":
+    main()
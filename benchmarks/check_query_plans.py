@@ -0,0 +1,201 @@
+# アプリのクエリがインデックスを使っているかをEXPLAINで確認
+#
+# 使い方:
+#   python benchmarks/check_query_plans.py                       # 一時SQLiteに投入して確認
+#   python benchmarks/check_query_plans.py --url postgresql://... # PostgreSQL（空のDBを指定）
+#
+# 大量のデータを投入してマイグレーションを適用した後、統計情報タブ・類似検索・
+# LLMキャッシュで実際に発行されるSQLを記録し、テーブルの全件走査がないかを確認する。
+# 全件走査が見つかった場合は終了コード1を返す。
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from bench_similarity import make_document, make_templates
+from database_engine import DatabaseEngine
+from llm_cache import LLMResponseCache, make_cache_key
+from migrations import apply_migrations
+from similarity_index import SimilarityIndex, text_signature
+
+# 大きくなり続けるテーブル
+LARGE_TABLES = ("document_patterns", "extraction_history", "llm_response_cache", "document_signatures")
+
+
+def _load_models(url):
+    if url.startswith("postgresql"):
+        import database_models_postgres as models
+    else:
+        import database_models as models
+    return models
+
+
+def seed(database, models, patterns, seed_value):
+    """パターン・シグネチャ・抽出履歴・LLMキャッシュを一括投入"""
+    rng = random.Random(seed_value)
+    templates = make_templates(200, rng)
+    samples = [make_document(template, rng)[:1000] for template in templates]
+    signatures = [text_signature(sample) for sample in samples]
+    categories = ["預金通帳", "給与明細", "保険証券", "年金通知書", "源泉徴収票", "その他財産書類"]
+    now = datetime.now()
+
+    engine = database.get_engine()
+    chunk = 5000
+    with engine.begin() as connection:
+        for start in range(0, patterns, chunk):
+            ids = range(start + 1, min(start + chunk, patterns) + 1)
+            connection.execute(models.DocumentPattern.__table__.insert(), [{
+                "id": i,
+                "category": rng.choice(categories),
+                "ocr_text_sample": samples[i % len(samples)],
+                "regex_patterns": [r"([\d,]+)円"],
+                "success_count": rng.randint(0, 20),
+                "failure_count": rng.randint(0, 5),
+                "created_at": now,
+                "updated_at": now,
+            } for i in ids])
+            connection.execute(models.DocumentSignature.__table__.insert(), [
+                {"pattern_id": i, "signature": signatures[i % len(signatures)]} for i in ids
+            ])
+        for start in range(0, patterns * 2, chunk):
+            connection.execute(models.ExtractionHistory.__table__.insert(), [{
+                "document_category": rng.choice(categories),
+                "ocr_text": samples[i % len(samples)],
+                "used_patterns": [r"([\d,]+)円"],
+                "extracted_values": [rng.randint(1000, 9999999)],
+                "created_at": now - timedelta(minutes=i),
+            } for i in range(start, min(start + chunk, patterns * 2))])
+        for start in range(0, patterns // 2, chunk):
+            connection.execute(models.LLMCacheEntry.__table__.insert(), [{
+                "cache_key": f"{i:064x}",
+                "model": "gpt-3.5-turbo",
+                "temperature": 0.3,
+                "response_text": "{}",
+                "created_at": now - timedelta(minutes=i),
+                "last_used_at": now - timedelta(minutes=i),
+                "hit_count": 0,
+            } for i in range(start, min(start + chunk, patterns // 2))])
+        connection.exec_driver_sql("ANALYZE")
+    return samples
+
+
+class StatementRecorder:
+    """実行されたSQLを記録（INSERTは対象外）"""
+
+    def __init__(self, engine):
+        self.statements = []
+        self.label = None
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.label and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            self.statements.append((self.label, statement, parameters))
+
+
+def explain(engine, statement, parameters):
+    """実行計画を取得し、(計画の文字列, 全件走査したテーブルのリスト) を返す"""
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            plan = plan if isinstance(plan, list) else json.loads(plan)
+            scans = []
+
+            def walk(node):
+                if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+                    scans.append(node["Relation Name"])
+                for child in node.get("Plans", []):
+                    walk(child)
+
+            walk(plan[0]["Plan"])
+            return json.dumps(plan[0]["Plan"], ensure_ascii=False), scans
+
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        details = [row[-1] for row in rows]
+        scans = [
+            table for detail in details for table in LARGE_TABLES
+            if detail.startswith(f"SCAN {table}") and "INDEX" not in detail and "PRIMARY KEY" not in detail
+        ]
+        return "\n".join(details), scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アプリのクエリの実行計画を確認")
+    parser.add_argument("--url", help="データベースURL（省略時は一時SQLiteファイル）")
+    parser.add_argument("--patterns", type=int, default=100000, help="投入するパターン数（履歴は2倍）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="実行計画を表示")
+    args = parser.parse_args()
+
+    temp_dir = None
+    url = args.url
+    if not url:
+        temp_dir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(temp_dir.name, 'query_plans.db')}"
+
+    models = _load_models(url)
+    database = DatabaseEngine(lambda: url, models.Base.metadata, migrate=apply_migrations)
+    engine = database.get_engine()
+
+    start = time.perf_counter()
+    samples = seed(database, models, args.patterns, args.seed)
+    print(f"投入: パターン {args.patterns:,}件 / 履歴 {args.patterns * 2:,}件 ({time.perf_counter() - start:.1f}秒)")
+
+    recorder = StatementRecorder(engine)
+    llm_cache = LLMResponseCache(database.session_scope, models.LLMCacheEntry, max_entries=args.patterns // 2)
+    models._similarity_index = SimilarityIndex()
+
+    # 初回の類似検索はシグネチャ未保存のパターンを補完するため全件を確認する（1回だけ）
+    allowed_scans = {"類似検索（初回のインデックス読み込み）"}
+    if engine.dialect.name == "postgresql":
+        # 全件の集計はPostgreSQLでは順次走査の方が速い場合があり、プランナーの選択に任せる
+        allowed_scans.add("統計情報タブ: カテゴリ別集計")
+    exercises = [
+        ("統計情報タブ: カテゴリ別集計", lambda s: models.get_category_statistics(s)),
+        ("統計情報タブ: 最近の抽出履歴", lambda s: models.get_recent_history(s, limit=10)),
+        ("類似検索（初回のインデックス読み込み）", lambda s: models.find_similar_document(samples[0], s)),
+        ("類似検索", lambda s: models.find_similar_document(samples[1], s)),
+        ("LLMキャッシュ: 取得", lambda s: llm_cache.get(f"{1:064x}")),
+        ("LLMキャッシュ: 保存と期限切れ・LRU削除",
+         lambda s: llm_cache.set(make_cache_key([{"role": "user", "content": "x"}], "m", 0.3), "m", 0.3, "{}")),
+    ]
+    for label, exercise in exercises:
+        recorder.label = label
+        with database.session_scope() as session:
+            exercise(session)
+    recorder.label = None
+
+    failures = 0
+    seen = set()
+    for label, statement, parameters in recorder.statements:
+        key = (label, statement)
+        if key in seen:
+            continue
+        seen.add(key)
+        start = time.perf_counter()
+        plan, scans = explain(engine, statement, parameters)
+        seconds = time.perf_counter() - start
+        ok = not scans or label in allowed_scans
+        failures += 0 if ok else 1
+        status = "OK" if ok else f"NG（全件走査: {', '.join(sorted(set(scans)))}）"
+        print(f"[{status}] {label}: {' '.join(statement.split())[:120]} ({seconds * 1000:.1f} ms)")
+        if args.verbose or not ok:
+            for line in plan.splitlines():
+                print(f"      {line}")
+
+    database.dispose()
+    if temp_dir:
+        temp_dir.cleanup()
+    print("すべてのクエリがインデックスを使用しています" if not failures else f"全件走査のクエリ: {failures}件")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+# ベンチマーク用のAzure・Google Vision・OpenAIの代替クライアント（ネットワーク不要）
+#
+# 応答は合成テキスト、または記録済みのOCR結果（OCRCacheのJSON = OCRResult.to_dict()）から作る。
+# latencyで1呼び出しあたりの待ち時間（秒）を指定する。
+import asyncio
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from client_registry import credential_fingerprint, get_client_registry
+
+FAKE_AZURE_ENDPOINT = "https://fake-azure.invalid/"
+FAKE_AZURE_API_KEY = "fake-azure-key"
+FAKE_GOOGLE_CREDENTIALS_JSON = '{"type": "service_account", "project_id": "fake"}'
+FAKE_OPENAI_API_KEY = "fake-openai-key"
+
+# LLMの合成応答（generate_regex_patternsが解析できる形式）
+DEFAULT_LLM_RESPONSE = json.dumps({
+    "patterns": [
+        {"regex": r"BALANCE\s+([\d,]+)", "description": "残高", "priority": 1},
+        {"regex": r"TRANSFER\s+([\d,]+)", "description": "取引額", "priority": 2},
+        {"regex": r"([\d,]+)円", "description": "円表記", "priority": 3},
+    ]
+}, ensure_ascii=False)
+
+
+def load_recorded_pages(path):
+    """記録済みのOCR結果JSONからページごとのテキストを取得"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    pages = data.get("pages") or [{"page_number": 1, "text": data.get("text", "")}]
+    return [page.get("text", "") for page in pages]
+
+
+def _azure_page(page_number, text):
+    lines = []
+    for i, content in enumerate(text.splitlines()):
+        y = 0.5 + i * 0.15
+        polygon = [SimpleNamespace(x=x, y=y) for x in (0.5, 7.5)] + [SimpleNamespace(x=x, y=y + 0.12) for x in (7.5, 0.5)]
+        lines.append(SimpleNamespace(content=content, polygon=polygon))
+    return SimpleNamespace(page_number=page_number, width=8.2639, height=11.6944, unit="inch", lines=lines)
+
+
+def _azure_result(page_texts):
+    return SimpleNamespace(pages=[_azure_page(i, text) for i, text in enumerate(page_texts, 1)])
+
+
+class FakeAzureClient:
+    """DocumentAnalysisClientの代替（begin_analyze_document → poller.result()）"""
+
+    def __init__(self, page_texts, latency=0.0):
+        self.page_texts = page_texts
+        self.latency = latency
+        self.calls = 0
+
+    def begin_analyze_document(self, model_id, document):
+        self.calls += 1
+        result = _azure_result(self.page_texts)
+        latency = self.latency
+
+        class Poller:
+            def result(self):
+                time.sleep(latency)
+                return result
+
+        return Poller()
+
+    def close(self):
+        pass
+
+
+class FakeAsyncAzureClient(FakeAzureClient):
+    """azure.ai.formrecognizer.aio.DocumentAnalysisClientの代替"""
+
+    async def begin_analyze_document(self, model_id, document):
+        self.calls += 1
+        result = _azure_result(self.page_texts)
+        latency = self.latency
+
+        class Poller:
+            async def result(self):
+                await asyncio.sleep(latency)
+                return result
+
+        return Poller()
+
+    async def close(self):
+        pass
+
+
+def _vision_response(text):
+    return SimpleNamespace(
+        error=SimpleNamespace(message=""),
+        text_annotations=[SimpleNamespace(description=text)] if text else []
+    )
+
+
+class FakeVisionClient:
+    """ImageAnnotatorClientの代替（呼び出し順にページのテキストを返す）"""
+
+    def __init__(self, page_texts, latency=0.0):
+        self.page_texts = page_texts
+        self.latency = latency
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _next_text(self):
+        with self._lock:
+            index = next(self._counter)
+        return self.page_texts[index % len(self.page_texts)]
+
+    def text_detection(self, image):
+        time.sleep(self.latency)
+        return _vision_response(self._next_text())
+
+    def close(self):
+        pass
+
+
+class FakeAsyncVisionClient(FakeVisionClient):
+    """ImageAnnotatorAsyncClientの代替"""
+
+    async def text_detection(self, image):
+        await asyncio.sleep(self.latency)
+        return _vision_response(self._next_text())
+
+    async def close(self):
+        pass
+
+
+class FakeChatCompletion:
+    """openai.ChatCompletionの代替（create / acreate）"""
+
+    def __init__(self, response_text=DEFAULT_LLM_RESPONSE, latency=0.0):
+        self.response_text = response_text
+        self.latency = latency
+        self.calls = 0
+
+    def _response(self):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.response_text))])
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return self._response()
+
+    async def acreate(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._response()
+
+
+class _FakeSession:
+    def close(self):
+        pass
+
+
+def install_fake_clients(environ, page_texts, ocr_latency=0.0, page_latency=0.0):
+    """環境変数に架空の認証情報を設定し、クライアントレジストリに代替クライアントを登録"""
+    environ["AZURE_ENDPOINT"] = FAKE_AZURE_ENDPOINT
+    environ["AZURE_API_KEY"] = FAKE_AZURE_API_KEY
+    environ["GOOGLE_CREDENTIALS_JSON"] = FAKE_GOOGLE_CREDENTIALS_JSON
+    environ["OPENAI_API_KEY"] = FAKE_OPENAI_API_KEY
+
+    registry = get_client_registry()
+    registry.clear()
+    registry.get("azure", credential_fingerprint(FAKE_AZURE_ENDPOINT, FAKE_AZURE_API_KEY),
+                 lambda: FakeAzureClient(page_texts, ocr_latency))
+    registry.get("vision", credential_fingerprint(FAKE_GOOGLE_CREDENTIALS_JSON),
+                 lambda: FakeVisionClient(page_texts, page_latency))
+    registry.get("openai", credential_fingerprint(FAKE_OPENAI_API_KEY), _FakeSession)
+
+
+async def install_fake_async_clients(page_texts, ocr_latency=0.0, page_latency=0.0):
+    """実行中のイベントループに非同期の代替クライアントを登録（install_fake_clientsの後に呼ぶ）"""
+    registry = get_client_registry()
+    await registry.get_async("azure", credential_fingerprint(FAKE_AZURE_ENDPOINT, FAKE_AZURE_API_KEY),
+                             lambda: FakeAsyncAzureClient(page_texts, ocr_latency))
+    await registry.get_async("vision", credential_fingerprint(FAKE_GOOGLE_CREDENTIALS_JSON),
+                             lambda: FakeAsyncVisionClient(page_texts, page_latency))
+
+    class _FakeAsyncSession:
+        async def close(self):
+            pass
+
+    await registry.get_async("openai", credential_fingerprint(FAKE_OPENAI_API_KEY), _FakeAsyncSession)
@@ -0,0 +1,74 @@
+# ベンチマーク用の合成PDF生成（外部ライブラリ不要）
+import random
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _page_content(page_number, rng, lines_per_page):
+    lines = [f"Statement page {page_number}"]
+    for _ in range(lines_per_page):
+        lines.append(
+            f"2024/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}  TRANSFER  "
+            f"{rng.randint(100, 9999999):>12,}  BALANCE {rng.randint(1000, 99999999):>14,}"
+        )
+    commands = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td", _pdf_string(lines[0]) + " Tj"]
+    for line in lines[1:]:
+        commands.append("T*")
+        commands.append(_pdf_string(line) + " Tj")
+    commands.append("ET")
+    # ページごとに罫線を描画（ラスタライズ負荷を実際の帳票に近づける）
+    for i in range(lines_per_page // 5):
+        y = 790 - i * 55
+        commands.append(f"30 {y} m 565 {y} l S")
+    return "\n".join(commands).encode("latin-1"), "\n".join(lines)
+
+
+def make_pdf(pages, lines_per_page=60, seed=0):
+    """A4サイズの複数ページPDFをバイト列として生成"""
+    return make_pdf_with_text(pages, lines_per_page, seed)[0]
+
+
+def make_pdf_with_text(pages, lines_per_page=60, seed=0):
+    """A4サイズの複数ページPDFと、ページごとの正解テキストを生成"""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None)
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+
+    page_ids = []
+    page_texts = []
+    for page_number in range(1, pages + 1):
+        content, page_text = _page_content(page_number, rng, lines_per_page)
+        page_texts.append(page_text)
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    return bytes(output), page_texts
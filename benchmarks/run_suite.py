@@ -0,0 +1,230 @@
+# オフラインのベンチマーク一式（Azure・Google・OpenAIは代替クライアントを使用）
+#
+# 使い方:
+#   python benchmarks/run_suite.py --output results.json
+#   python benchmarks/run_suite.py --ocr-latency 1.5 --llm-latency 2.0 --compare results.json
+#   python benchmarks/run_suite.py --recorded-ocr ocr_cache/xxxx.json   # 記録済みOCR結果で計測
+# pdf_to_imagesの計測にはpdf2imageとpoppler（pdftoppm）が必要（無い場合はスキップ）
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import database_models
+import llm_regex_generator
+from bench_similarity import make_document, make_templates
+from database_engine import DatabaseEngine
+from fakes import FakeChatCompletion, install_fake_async_clients, install_fake_clients, load_recorded_pages
+from llm_regex_generator import (
+    extract_amounts_with_patterns, generate_regex_patterns, generate_regex_patterns_async, set_llm_response_cache
+)
+from ocr_processor_pdf2image import (
+    analyze_document_azure, analyze_document_azure_async, analyze_document_google, pdf_to_images
+)
+from pdf_fixtures import make_pdf_with_text
+from similarity_index import SimilarityIndex
+
+
+def measure(fn, repeat, warmup=1):
+    """fnをrepeat回実行し、1回あたりの秒数の統計を取得"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _create_database(pattern_count, seed):
+    """インメモリDBに類似検索用のパターンを登録"""
+    database = DatabaseEngine(lambda: "sqlite://", database_models.Base.metadata)
+    database_models._similarity_index = SimilarityIndex()
+    rng = random.Random(seed)
+    templates = make_templates(max(pattern_count // 50, 10), rng)
+    with database.session_scope() as session:
+        for _ in range(pattern_count):
+            database_models.save_document_pattern(
+                "預金通帳", make_document(rng.choice(templates), rng), [r"([\d,]+)円"], session
+            )
+    queries = [make_document(rng.choice(templates), rng) for _ in range(20)]
+    return database, queries
+
+
+def _save_extraction(database, ocr_text, patterns, extracted_values):
+    """tab3の保存処理（新規パターン + 抽出履歴）"""
+    with database.session_scope() as session:
+        database_models.save_document_pattern("預金通帳", ocr_text, patterns, session)
+        session.add(database_models.ExtractionHistory(
+            document_category="預金通帳",
+            ocr_text=ocr_text[:1000],
+            used_patterns=patterns,
+            extracted_values=[v['normalized'] for v in extracted_values]
+        ))
+
+
+def run_suite(args):
+    results = {}
+    pdf_data, page_texts = make_pdf_with_text(args.pages, seed=args.seed)
+    if args.recorded_ocr:
+        page_texts = load_recorded_pages(args.recorded_ocr)
+    ocr_text = "\n".join(page_texts)
+
+    install_fake_clients(os.environ, page_texts, args.ocr_latency, args.page_latency)
+    fake_llm = FakeChatCompletion(latency=args.llm_latency)
+    original_chat_completion = llm_regex_generator.openai.ChatCompletion
+    llm_regex_generator.openai.ChatCompletion = fake_llm
+    set_llm_response_cache(None)  # LLM呼び出し自体を計測するためキャッシュは使わない
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_data)
+        pdf_path = f.name
+
+    try:
+        try:
+            results["pdf_to_images"] = measure(lambda: pdf_to_images(pdf_path), args.repeat)
+        except Exception as e:
+            print(f"pdf_to_imagesをスキップ: {e}")
+
+        patterns = generate_regex_patterns(ocr_text)
+        results["extract_amounts_with_patterns"] = measure(
+            lambda: extract_amounts_with_patterns(ocr_text, patterns), args.repeat * 10
+        )
+
+        database, queries = _create_database(args.patterns, args.seed)
+        query_iter = iter(queries * (args.repeat * 10 // len(queries) + 2))
+        with database.session_scope() as session:
+            results["find_similar_document"] = measure(
+                lambda: database_models.find_similar_document(next(query_iter), session), args.repeat * 10
+            )
+
+        extracted_values = extract_amounts_with_patterns(ocr_text, patterns)
+        results["db_save"] = measure(
+            lambda: _save_extraction(database, ocr_text, patterns, extracted_values), args.repeat * 10
+        )
+
+        results["ocr_azure"] = measure(lambda: analyze_document_azure(pdf_data), args.repeat)
+        try:
+            results["ocr_google"] = measure(lambda: analyze_document_google(pdf_path), args.repeat)
+        except Exception as e:
+            print(f"ocr_googleをスキップ: {e}")
+
+        results["generate_regex_patterns"] = measure(lambda: generate_regex_patterns(ocr_text), args.repeat)
+
+        def pipeline():
+            """1件分の処理（OCR→類似検索→LLM生成→抽出→保存）"""
+            text = analyze_document_azure(pdf_data).text
+            with database.session_scope() as session:
+                database_models.find_similar_document(text, session)
+            document_patterns = generate_regex_patterns(text)
+            values = extract_amounts_with_patterns(text, document_patterns)
+            _save_extraction(database, text, document_patterns, values)
+
+        results["pipeline_document"] = measure(pipeline, args.repeat)
+
+        async def pipeline_async():
+            """args.documents件をOCR・LLMを重ねて同時に処理"""
+            await install_fake_async_clients(page_texts, args.ocr_latency, args.page_latency)
+
+            async def one():
+                text = (await analyze_document_azure_async(pdf_data)).text
+                document_patterns = await generate_regex_patterns_async(text)
+                return extract_amounts_with_patterns(text, document_patterns)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.documents)))
+            return time.perf_counter() - start
+
+        seconds = asyncio.run(pipeline_async())
+        results["pipeline_async_batch"] = summarize([seconds])
+        results["pipeline_async_batch"]["documents_per_second"] = args.documents / seconds
+    finally:
+        llm_regex_generator.openai.ChatCompletion = original_chat_completion
+        os.unlink(pdf_path)
+
+    return results
+
+
+def print_results(results, previous=None):
+    for name, stats in results.items():
+        line = f"  {name:32s} p50 {stats['p50'] * 1000:10.2f} ms  p95 {stats['p95'] * 1000:10.2f} ms"
+        if previous and name in previous:
+            ratio = stats["p50"] / previous[name]["p50"] if previous[name]["p50"] else float("inf")
+            line += f"  前回比 {ratio:.2f}倍" + ("  ⚠️" if ratio > 1.2 else "")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="オフラインのベンチマーク一式")
+    parser.add_argument("--pages", type=int, default=8, help="合成PDFのページ数")
+    parser.add_argument("--patterns", type=int, default=500, help="類似検索用に登録するパターン数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--documents", type=int, default=20, help="非同期処理で同時に処理する書類数")
+    parser.add_argument("--ocr-latency", type=float, default=0.0, help="Azure OCRの1回あたりの待ち時間（秒）")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="Google OCRの1ページあたりの待ち時間（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="LLMの1回あたりの待ち時間（秒）")
+    parser.add_argument("--recorded-ocr", help="記録済みのOCR結果JSON（OCRキャッシュのファイル）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果JSON")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
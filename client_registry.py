@@ -0,0 +1,207 @@
+# 外部APIクライアントの共有モジュール（Azure・Google Vision・OpenAI）
+#
+# クライアントはプロセス内で1度だけ作成し、HTTP/gRPCの接続を使い回す。
+# 認証情報（環境変数）が変わった場合だけ作り直す。
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import weakref
+
+# OpenAIのHTTP接続プールのサイズ
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', '16'))
+
+
+def credential_fingerprint(*values):
+    """認証情報の識別子（値そのものは保持しない）"""
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update((value or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _close_client(client):
+    """クライアントの接続を閉じる（閉じられない場合は何もしない）"""
+    try:
+        if hasattr(client, 'close'):
+            client.close()
+        elif hasattr(client, 'transport'):
+            client.transport.close()
+    except Exception as e:
+        print(f"クライアント終了エラー: {e}")
+
+
+async def _close_client_async(client):
+    """非同期クライアントの接続を閉じる"""
+    try:
+        if hasattr(client, 'close'):
+            result = client.close()
+        else:
+            result = client.transport.close()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        print(f"クライアント終了エラー: {e}")
+
+
+class ClientRegistry:
+    """名前ごとにクライアントを1つ保持し、認証情報が変わった場合だけ作り直す
+
+    非同期クライアントは接続がイベントループに紐づくため、ループごとに保持する。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, name, fingerprint, factory):
+        """クライアントを取得（未作成または認証情報が変わった場合はfactoryで作成）"""
+        with self._lock:
+            entry = self._clients.get(name)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+            client = factory()
+            self._clients[name] = (fingerprint, client)
+        if entry is not None:
+            _close_client(entry[1])
+        return client
+
+    async def get_async(self, name, fingerprint, factory):
+        """実行中のイベントループ用の非同期クライアントを取得"""
+        loop = asyncio.get_running_loop()
+        clients = self._loop_clients.setdefault(loop, {})
+        entry = clients.get(name)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        client = factory()
+        clients[name] = (fingerprint, client)
+        if entry is not None:
+            await _close_client_async(entry[1])
+        return client
+
+    def clear(self):
+        """同期クライアントをすべて閉じて破棄"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for _, client in clients:
+            _close_client(client)
+
+    async def close_loop_clients(self):
+        """実行中のイベントループの非同期クライアントをすべて閉じる（ループ終了前に呼ぶ）"""
+        clients = self._loop_clients.pop(asyncio.get_running_loop(), {})
+        for _, client in clients.values():
+            await _close_client_async(client)
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry():
+    """プロセス共通のクライアントレジストリを取得"""
+    return _registry
+
+
+def _azure_settings():
+    """環境変数からAzure Form Recognizerの設定を取得"""
+    azure_endpoint = os.getenv('AZURE_ENDPOINT')
+    azure_api_key = os.getenv('AZURE_API_KEY')
+    if not azure_endpoint or not azure_api_key:
+        raise ValueError("Azure Form Recognizerの設定が不足しています")
+    return azure_endpoint, azure_api_key
+
+
+def get_azure_client():
+    """Azure DocumentAnalysisClientを取得"""
+    azure_endpoint, azure_api_key = _azure_settings()
+
+    def create():
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(endpoint=azure_endpoint, credential=AzureKeyCredential(azure_api_key))
+
+    return _registry.get('azure', credential_fingerprint(azure_endpoint, azure_api_key), create)
+
+
+async def get_azure_client_async():
+    """Azure DocumentAnalysisClient（aio版）を取得"""
+    azure_endpoint, azure_api_key = _azure_settings()
+
+    def create():
+        from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(endpoint=azure_endpoint, credential=AzureKeyCredential(azure_api_key))
+
+    return await _registry.get_async('azure', credential_fingerprint(azure_endpoint, azure_api_key), create)
+
+
+def _google_credentials_json():
+    google_credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
+    if not google_credentials_json:
+        raise ValueError("Google Cloud Vision APIの認証情報が設定されていません")
+    return google_credentials_json
+
+
+def _google_credentials(google_credentials_json):
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(json.loads(google_credentials_json))
+
+
+def get_vision_client():
+    """Google Cloud Vision ImageAnnotatorClientを取得"""
+    google_credentials_json = _google_credentials_json()
+
+    def create():
+        from google.cloud import vision
+        return vision.ImageAnnotatorClient(credentials=_google_credentials(google_credentials_json))
+
+    return _registry.get('vision', credential_fingerprint(google_credentials_json), create)
+
+
+async def get_vision_client_async():
+    """Google Cloud Vision ImageAnnotatorAsyncClientを取得"""
+    google_credentials_json = _google_credentials_json()
+
+    def create():
+        from google.cloud import vision
+        return vision.ImageAnnotatorAsyncClient(credentials=_google_credentials(google_credentials_json))
+
+    return await _registry.get_async('vision', credential_fingerprint(google_credentials_json), create)
+
+
+def configure_openai():
+    """OpenAIのAPIキーと共有HTTPセッションを設定"""
+    import openai
+    api_key = os.getenv("OPENAI_API_KEY", "")
+
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=OPENAI_POOL_SIZE, pool_maxsize=OPENAI_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    session = _registry.get('openai', credential_fingerprint(api_key), create)
+    openai.api_key = api_key
+    openai.requestssession = session
+    return session
+
+
+async def configure_openai_async():
+    """OpenAIの非同期呼び出し用の共有aiohttpセッションを設定"""
+    import openai
+    api_key = os.getenv("OPENAI_API_KEY", "")
+
+    def create():
+        import aiohttp
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=OPENAI_POOL_SIZE))
+
+    session = await _registry.get_async('openai', credential_fingerprint(api_key), create)
+    openai.api_key = api_key
+    openai.aiosession.set(session)
+    return session
@@ -31,6 +31,16 @@ except Exception:
 # データベースパス
 DATABASE_PATH = DATABASE_DIR / "ocr_patterns.db"
 
+# OCR結果キャッシュ（同じPDFの再OCRを省略）
+OCR_CACHE_DIR = OUTPUT_DIR / "ocr_cache"
+OCR_CACHE_MAX_BYTES = int(os.getenv('OCR_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))  # 500MB
+
+# PDFプレビュー画像のキャッシュ（再表示のたびに描画しない）
+THUMBNAIL_CACHE_DIR = OUTPUT_DIR / "thumbnail_cache"
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))  # 100MB
+# プレビューで一度に表示するページ数
+PREVIEW_PAGES_PER_VIEW = int(os.getenv('PREVIEW_PAGES_PER_VIEW', '3'))
+
 # Azure Form Recognizer設定（環境変数から取得）
 AZURE_ENDPOINT = os.getenv('AZURE_ENDPOINT', "https://docintelligence-debt.cognitiveservices.azure.com/")
 AZURE_API_KEY = os.getenv('AZURE_API_KEY', "")
@@ -0,0 +1,115 @@
+# データベースエンジン管理モジュール（SQLite/PostgreSQL共通）
+import os
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+from metrics import stage_timer
+
+# コネクションプールの設定（環境変数で調整可能）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+
+def _engine_options(database_url):
+    """データベースURLに応じたcreate_engineのオプションを取得"""
+    if database_url.startswith('sqlite'):
+        # Streamlitは複数スレッドからセッションを使うためスレッドチェックを無効化
+        options = {'connect_args': {'check_same_thread': False}}
+        if database_url in ('sqlite://', 'sqlite:///:memory:'):
+            # インメモリDBは単一接続を共有しないとテーブルが見えない
+            options['poolclass'] = StaticPool
+        else:
+            options.update(
+                poolclass=QueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+        return options
+
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def _create_all(metadata, engine, attempts=3):
+    """テーブルを作成（複数プロセスが同時に作成して競合した場合は再試行）"""
+    for attempt in range(attempts):
+        try:
+            metadata.create_all(engine)
+            return
+        except DBAPIError:
+            if attempt == attempts - 1:
+                raise
+
+
+class DatabaseEngine:
+    """プロセス内で共有するエンジンとセッションファクトリ
+
+    エンジンは最初の利用時に1回だけ作成し、テーブル作成とマイグレーションも
+    その時に1回だけ行う。
+    """
+
+    def __init__(self, url_factory, metadata, migrate=None):
+        self._url_factory = url_factory
+        self._metadata = metadata
+        self._migrate = migrate
+        self._engine = None
+        self._session_factory = None
+        self._lock = threading.Lock()
+
+    def get_engine(self):
+        """エンジンを取得（未作成の場合は作成してテーブルを初期化）"""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    database_url = self._url_factory()
+                    engine = create_engine(database_url, **_engine_options(database_url))
+                    _create_all(self._metadata, engine)
+                    if self._migrate is not None:
+                        self._migrate(engine)
+                    # セッション終了後もst.session_stateに保持したオブジェクトを参照できるようにする
+                    self._session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+                    self._engine = engine
+        return self._engine
+
+    def get_session(self):
+        """セッションを取得"""
+        self.get_engine()
+        return self._session_factory()
+
+    @contextmanager
+    def session_scope(self):
+        """コミット/ロールバック/クローズを自動で行うセッション"""
+        session = self.get_session()
+        try:
+            yield session
+            with stage_timer('db_commit'):
+                session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def check_connection(self):
+        """データベースに接続できるか確認"""
+        with self.get_engine().connect() as connection:
+            connection.execute(text('SELECT 1'))
+
+    def dispose(self):
+        """エンジンとコネクションプールを破棄"""
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+            self._engine = None
+            self._session_factory = None
@@ -1,9 +1,22 @@
 # データベースモデル
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Float, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import defer
 from datetime import datetime
 import json
+from database_engine import DatabaseEngine
+from history_writer import ExtractionHistoryWriter, close_at_exit
+from llm_cache import LLMResponseCache
+from migrations import apply_migrations
+from pattern_counters import (
+    PatternCounterBuffer, append_patterns, apply_pattern_changes, increment_pattern_counts
+)
+from pattern_stats import (
+    PATTERN_PRUNE_MIN_RUNS, load_pattern_statistics, prune_document_patterns, rank_patterns,
+    record_pattern_statistics
+)
+from metrics import stage_timer
+from similarity_index import SimilarityIndex, find_best_pattern, text_signature
 from config import DATABASE_PATH
 
 Base = declarative_base()
@@ -25,8 +38,8 @@ class DocumentPattern(Base):
         """新しい正規表現パターンを追加"""
         patterns = self.regex_patterns or []
         if pattern not in patterns:
-            patterns.append(pattern)
-            self.regex_patterns = patterns
+            # 同じリストへのappendでは変更が検出されないため新しいリストを代入
+            self.regex_patterns = patterns + [pattern]
             
     def get_patterns(self):
         """正規表現パターンのリストを取得"""
@@ -44,37 +57,81 @@ class ExtractionHistory(Base):
     user_corrections = Column(JSON)  # ユーザーによる修正
     created_at = Column(DateTime, default=datetime.now)
 
+class DocumentSignature(Base):
+    """類似検索用MinHashシグネチャのデータベースモデル"""
+    __tablename__ = 'document_signatures'
+    
+    pattern_id = Column(Integer, primary_key=True)  # DocumentPattern.id
+    signature = Column(JSON)  # ocr_text_sampleのMinHashシグネチャ
+
+class LLMCacheEntry(Base):
+    """LLM応答キャッシュのデータベースモデル"""
+    __tablename__ = 'llm_response_cache'
+    
+    cache_key = Column(String(64), primary_key=True)  # プロンプト・モデル・temperatureのハッシュ
+    model = Column(String(100))
+    temperature = Column(Float)
+    response_text = Column(Text)  # LLMの応答本文
+    created_at = Column(DateTime, default=datetime.now)
+    last_used_at = Column(DateTime, default=datetime.now)
+    hit_count = Column(Integer, default=0)
+
+class PatternStatistic(Base):
+    """正規表現パターンごとの抽出統計のデータベースモデル"""
+    __tablename__ = 'pattern_statistics'
+    
+    pattern_id = Column(Integer, primary_key=True)  # DocumentPattern.id
+    pattern_hash = Column(String(64), primary_key=True)  # 正規表現のSHA-256
+    regex = Column(Text)  # 正規表現パターン
+    runs = Column(Integer, default=0)  # 抽出に使われた回数
+    match_count = Column(Integer, default=0)  # 一致した金額の数
+    accepted_count = Column(Integer, default=0)  # 保存された抽出結果に採用された金額の数
+    total_seconds = Column(Float, default=0.0)  # 実行時間の合計
+    last_accepted_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.now)
+
+# 類似検索用インデックス（プロセス内で共有）
+_similarity_index = SimilarityIndex()
+
 # データベースの初期化
+def _database_url():
+    """データベースURLを取得"""
+    return f'sqlite:///{DATABASE_PATH}'
+
+# エンジンとセッションファクトリ（プロセス内で共有）
+_database = DatabaseEngine(_database_url, Base.metadata, migrate=apply_migrations)
+
 def init_database():
-    """データベースとテーブルを初期化"""
-    engine = create_engine(f'sqlite:///{DATABASE_PATH}')
-    Base.metadata.create_all(engine)
-    return engine
+    """データベースとテーブルを初期化（プロセス内で1回のみ）"""
+    return _database.get_engine()
 
 def get_session():
     """データベースセッションを取得"""
-    engine = init_database()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    return _database.get_session()
+
+def session_scope():
+    """コミット/ロールバック/クローズを自動で行うセッションを取得"""
+    return _database.session_scope()
+
+def check_database_connection():
+    """データベース接続を確認"""
+    _database.check_connection()
 
+# LLM応答キャッシュ（プロセス内で共有）
+_llm_response_cache = LLMResponseCache(session_scope, LLMCacheEntry)
+
+def get_llm_response_cache():
+    """このデータベースを使うLLM応答キャッシュを取得"""
+    return _llm_response_cache
+
+@stage_timer('similarity_search')
 def find_similar_document(ocr_text, session, threshold=0.7):
-    """類似した書類パターンを検索"""
-    from difflib import SequenceMatcher
-    
-    all_patterns = session.query(DocumentPattern).all()
-    best_match = None
-    best_score = 0
-    
-    for pattern in all_patterns:
-        if pattern.ocr_text_sample:
-            # テキストの類似度を計算
-            similarity = SequenceMatcher(None, ocr_text[:500], pattern.ocr_text_sample[:500]).ratio()
-            if similarity > best_score and similarity > threshold:
-                best_score = similarity
-                best_match = pattern
-    
-    return best_match, best_score
+    """類似した書類パターンを検索（MinHash/LSHインデックスで候補を絞り込み）"""
+    return find_best_pattern(
+        ocr_text, session, _similarity_index, DocumentPattern, DocumentSignature, threshold
+    )
 
+@stage_timer('db_save_pattern')
 def save_document_pattern(category, ocr_text, regex_patterns, session):
     """書類パターンを保存"""
     pattern = DocumentPattern(
@@ -83,22 +140,93 @@ def save_document_pattern(category, ocr_text, regex_patterns, session):
         regex_patterns=regex_patterns
     )
     session.add(pattern)
+    session.flush()
+    signature = text_signature(pattern.ocr_text_sample)
+    session.add(DocumentSignature(pattern_id=pattern.id, signature=signature))
     session.commit()
+    _similarity_index.add(pattern.id, signature)
     return pattern
 
-def update_pattern_success(pattern_id, session):
-    """パターンの成功回数を更新"""
-    pattern = session.query(DocumentPattern).get(pattern_id)
-    if pattern:
-        pattern.success_count += 1
-        session.commit()
+def update_pattern_success(pattern_id, session, regex_patterns=None, previous_patterns=()):
+    """パターンの成功回数を更新
+
+    regex_patternsを指定した場合は、読み込んだ時点のパターン（previous_patterns）からの
+    追加・削除だけをDB側で反映する（他のプロセスが同時に追加したパターンは残る）。
+    """
+    increment_pattern_counts(session, DocumentPattern, pattern_id, success=1)
+    if regex_patterns is not None:
+        apply_pattern_changes(session, DocumentPattern, pattern_id, previous_patterns, regex_patterns)
+    session.commit()
 
 def update_pattern_failure(pattern_id, new_patterns, session):
     """パターンの失敗を記録し、新しいパターンを追加"""
-    pattern = session.query(DocumentPattern).get(pattern_id)
-    if pattern:
-        pattern.failure_count += 1
-        for new_pattern in new_patterns:
-            pattern.add_pattern(new_pattern)
-        pattern.updated_at = datetime.now()
-        session.commit()
+    increment_pattern_counts(session, DocumentPattern, pattern_id, failure=1)
+    append_patterns(session, DocumentPattern, pattern_id, new_patterns)
+    session.commit()
+
+# 成功/失敗回数・抽出履歴をまとめて書き込むバッファ（一括処理用、終了時に残りを書き込む）
+_pattern_counter_buffer = None
+_history_writer = None
+
+def get_pattern_counter_buffer():
+    """成功/失敗回数の書き込みバッファを取得"""
+    global _pattern_counter_buffer
+    if _pattern_counter_buffer is None:
+        _pattern_counter_buffer = close_at_exit(PatternCounterBuffer(session_scope, DocumentPattern))
+    return _pattern_counter_buffer
+
+def get_history_writer():
+    """抽出履歴の書き込みバッファを取得"""
+    global _history_writer
+    if _history_writer is None:
+        _history_writer = close_at_exit(ExtractionHistoryWriter(session_scope, ExtractionHistory))
+    return _history_writer
+
+@stage_timer('db_statistics')
+def get_category_statistics(session):
+    """カテゴリ別のパターン数・成功回数・失敗回数を集計（GROUP BYでDB側で集計）"""
+    rows = session.query(
+        DocumentPattern.category,
+        func.count(DocumentPattern.id),
+        func.coalesce(func.sum(DocumentPattern.success_count), 0),
+        func.coalesce(func.sum(DocumentPattern.failure_count), 0)
+    ).group_by(DocumentPattern.category).all()
+    return {
+        category: {"count": count, "success": int(success), "failure": int(failure)}
+        for category, count, success, failure in rows
+    }
+
+def get_recent_history(session, limit=10):
+    """最近の抽出履歴を取得（表示しないOCRテキストは読み込まない）"""
+    return session.query(ExtractionHistory).options(
+        defer(ExtractionHistory.ocr_text)
+    ).order_by(ExtractionHistory.created_at.desc()).limit(limit).all()
+
+def save_pattern_statistics(pattern_id, summary, session):
+    """1回の抽出のパターンごとの統計（pattern_stats.summarize_runの結果）を加算"""
+    record_pattern_statistics(session, PatternStatistic, pattern_id, summary)
+
+def get_pattern_ranking(pattern_id, session, min_runs=PATTERN_PRUNE_MIN_RUNS):
+    """書類パターンの正規表現を採用実績順に並べ、統計と整理の対象かどうかを取得"""
+    pattern = session.query(DocumentPattern).filter(DocumentPattern.id == pattern_id).first()
+    if pattern is None:
+        return []
+    statistics = load_pattern_statistics(session, PatternStatistic, pattern_id)
+    kept, dropped = rank_patterns(pattern.get_patterns(), statistics, min_runs)
+    ranking = []
+    for regex in kept + dropped:
+        stat = statistics.get(regex)
+        runs = stat.runs if stat else 0
+        ranking.append({
+            "regex": regex,
+            "runs": runs,
+            "matches": stat.match_count if stat else 0,
+            "accepted": stat.accepted_count if stat else 0,
+            "mean_seconds": stat.total_seconds / runs if runs else 0.0,
+            "prunable": regex in dropped,
+        })
+    return ranking
+
+def prune_patterns(session, min_runs=PATTERN_PRUNE_MIN_RUNS, dry_run=False):
+    """すべての書類パターンを採用実績順に並べ替え、採用されないパターンを削除"""
+    return prune_document_patterns(session, DocumentPattern, PatternStatistic, min_runs, dry_run)
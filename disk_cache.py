@@ -0,0 +1,100 @@
+# ディスク上のLRUキャッシュモジュール
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+class DiskLRUCache:
+    """サイズ上限付きのディスクキャッシュ
+
+    1エントリ1ファイルで保存し、最終アクセス時刻（mtime）の古い順に削除する。
+    複数プロセスから同じディレクトリを共有しても壊れないよう、書き込みは
+    一時ファイルからのリネームで行う。
+    """
+
+    def __init__(self, directory, max_bytes, suffix=".bin"):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def _entries(self):
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        """キャッシュから取得（存在しない場合はNone）"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # LRU用に最終アクセス時刻を更新（ファイルシステムの時刻精度に依存しないよう明示的に指定）
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        """キャッシュに保存し、上限を超えた分を削除"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        temp_path.write_bytes(data)
+        now = time.time()
+        os.utime(temp_path, (now, now))
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """古いエントリから削除して上限以下にする"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def stats(self):
+        """ヒット/ミス回数と使用量を取得"""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
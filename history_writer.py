@@ -0,0 +1,112 @@
+# 抽出履歴の書き込みバッファ（まとめてINSERTする）
+import threading
+import time
+import weakref
+from datetime import datetime
+from multiprocessing import util
+from sqlalchemy import insert
+
+# ExtractionHistoryWriterの既定の書き込み条件
+HISTORY_FLUSH_SIZE = 200
+HISTORY_FLUSH_SECONDS = 2.0
+
+
+def close_at_exit(writer):
+    """プロセス終了時にwriter.close()を呼ぶ
+
+    atexitはProcessPoolExecutorのワーカープロセスでは呼ばれないため、
+    multiprocessingの終了処理（メインプロセスではatexitから呼ばれる）に登録する。
+    """
+    util.Finalize(writer, writer.close, exitpriority=10)
+    return writer
+
+
+class ExtractionHistoryWriter:
+    """ExtractionHistoryの行をためて、件数または経過時間の条件で一括INSERTする
+
+    書き込みに失敗した行はバッファに残して次回に再試行する。close()で残りを書き込む。
+    """
+
+    def __init__(self, session_scope, history_model, flush_size=HISTORY_FLUSH_SIZE,
+                 flush_seconds=HISTORY_FLUSH_SECONDS):
+        self._session_scope = session_scope
+        self._table = history_model.__table__
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._rows = []
+        self._first_row_at = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def add(self, **row):
+        """1行を追加（created_atは追加した時刻）"""
+        row.setdefault('created_at', datetime.now())
+        with self._lock:
+            self._rows.append(row)
+            if self._first_row_at is None:
+                self._first_row_at = time.monotonic()
+            due = len(self._rows) >= self.flush_size
+            if self._thread is None and self.flush_seconds:
+                self._start_timer()
+        if due:
+            self.flush()
+
+    def _start_timer(self):
+        # 経過時間の条件で書き込むためのスレッド（self._lockを保持した状態で呼ぶ）
+        writer_ref = weakref.ref(self)
+        closed = self._closed
+        interval = self.flush_seconds
+
+        def run():
+            while not closed.wait(interval / 2):
+                writer = writer_ref()
+                if writer is None:
+                    return
+                try:
+                    writer._flush_if_due()
+                except Exception as e:
+                    print(f"抽出履歴の書き込みエラー: {e}")
+                del writer
+
+        self._thread = threading.Thread(target=run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _flush_if_due(self):
+        with self._lock:
+            due = self._first_row_at is not None and time.monotonic() - self._first_row_at >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """バッファの行をまとめてINSERTし、書き込んだ行数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._rows
+                self._rows = []
+                self._first_row_at = None
+            if not rows:
+                return 0
+            try:
+                with self._session_scope() as session:
+                    session.execute(insert(self._table), rows)
+            except Exception:
+                with self._lock:
+                    self._rows = rows + self._rows
+                    if self._first_row_at is None:
+                        self._first_row_at = time.monotonic()
+                raise
+            return len(rows)
+
+    def pending(self):
+        """未書き込みの行数"""
+        with self._lock:
+            return len(self._rows)
+
+    def close(self):
+        """タイマーを止めて残りの行を書き込む"""
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
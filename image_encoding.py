@@ -0,0 +1,89 @@
+# OCR送信用の画像エンコード設定モジュール
+import io
+import math
+import os
+
+# OCRプロバイダごとの1画像あたりの画素数上限
+PROVIDER_MAX_PIXELS = {
+    'google': 75_000_000,  # Cloud Vision APIの上限
+    'azure': 100_000_000,  # Document Intelligenceの上限（10000 x 10000）
+}
+
+
+class ImageEncoding:
+    """ページ画像の解像度・色・形式の設定
+
+    dpiは目標画素数から決め、ページが大きいほど低く、小さいほど高くする
+    （min_dpi〜max_dpiの範囲、かつプロバイダの画素数上限以下）。
+    """
+
+    def __init__(self, image_format='PNG', mode='L', quality=85, optimize=False,
+                 target_pixels=4_000_000, min_dpi=100, max_dpi=300, threshold=160):
+        self.image_format = image_format.upper()
+        self.mode = mode
+        self.quality = quality
+        self.optimize = optimize
+        self.target_pixels = target_pixels  # A4を200dpiで描画した場合と同程度
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.threshold = threshold  # 2値化の閾値
+
+    @classmethod
+    def from_env(cls):
+        """環境変数から設定を作成"""
+        return cls(
+            image_format=os.getenv('OCR_IMAGE_FORMAT', 'PNG'),
+            mode=os.getenv('OCR_IMAGE_MODE', 'L'),
+            quality=int(os.getenv('OCR_IMAGE_QUALITY', '85')),
+            optimize=os.getenv('OCR_IMAGE_OPTIMIZE', '').lower() in ('1', 'true', 'yes'),
+            target_pixels=int(os.getenv('OCR_TARGET_PIXELS', '4000000')),
+            min_dpi=int(os.getenv('OCR_MIN_DPI', '100')),
+            max_dpi=int(os.getenv('OCR_MAX_DPI', '300')),
+        )
+
+    @property
+    def cache_tag(self):
+        """OCRキャッシュのキーに含める設定の識別子"""
+        return (
+            f"{self.image_format}-{self.mode}-q{self.quality}-o{int(self.optimize)}-"
+            f"{self.target_pixels}px-{self.min_dpi}-{self.max_dpi}dpi"
+        )
+
+    def __repr__(self):
+        return f"ImageEncoding({self.cache_tag})"
+
+    def choose_dpi(self, width_pt, height_pt, provider='google'):
+        """ページサイズ（ポイント）から描画解像度を決定"""
+        area_in2 = (width_pt / 72) * (height_pt / 72)
+        if area_in2 <= 0:
+            return self.max_dpi
+        max_pixels = min(self.target_pixels, PROVIDER_MAX_PIXELS.get(provider, self.target_pixels))
+        dpi = int(math.sqrt(max_pixels / area_in2))
+        dpi = max(self.min_dpi, min(self.max_dpi, dpi))
+        # 最低解像度でもプロバイダの上限を超える場合は上限を優先
+        provider_limit = PROVIDER_MAX_PIXELS.get(provider)
+        if provider_limit:
+            dpi = min(dpi, int(math.sqrt(provider_limit / area_in2)))
+        return max(dpi, 1)
+
+
+def encode_image(img, encoding):
+    """PIL画像を設定に従ってエンコード"""
+    mode = encoding.mode
+    if mode == '1':
+        if encoding.image_format == 'JPEG':
+            # JPEGは2値画像を扱えないためグレースケールで保存
+            img = img.convert('L')
+        else:
+            img = img.convert('L').point(lambda v: 255 if v >= encoding.threshold else 0, mode='1')
+    elif img.mode != mode:
+        img = img.convert(mode)
+
+    output = io.BytesIO()
+    if encoding.image_format == 'JPEG':
+        img.save(output, format='JPEG', quality=encoding.quality, optimize=encoding.optimize)
+    elif encoding.image_format == 'WEBP':
+        img.save(output, format='WEBP', quality=encoding.quality, method=4 if encoding.optimize else 0)
+    else:
+        img.save(output, format='PNG', optimize=encoding.optimize)
+    return output.getvalue()
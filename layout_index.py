@@ -0,0 +1,214 @@
+# テキスト要素（行ごとの座標）の空間インデックスと、ラベルの右・下にある金額の検索
+#
+# OCRのtext_elements（x, y, width, height はポイント単位、pageは0始まり）をページごとに
+# 帯状の格子に分け、横方向の帯ごとにx座標順、縦方向の帯ごとにy座標順に並べておく。
+# 「残高の右にある金額」は残高の行と重なる帯を二分探索し、右側で最も近い要素を返す。
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from metrics import stage_timer
+from pattern_set import normalize_amount
+
+# 検索するラベルの既定値
+DEFAULT_LABELS = ('残高', '合計')
+# 帯の幅（ポイント）。行の高さ程度にすると1行が1〜2個の帯に収まる
+ROW_BAND = 12.0
+COLUMN_BAND = 72.0
+# ラベルの下を探す範囲（ラベルの高さの倍数）
+BELOW_LINES = 3.0
+# 座標の誤差の許容値（ポイント）
+TOLERANCE = 2.0
+
+# 金額とみなす形（¥付き・3桁区切り・円付きのいずれか。「2024年」「令和5年度」などの数字は除く）
+_AMOUNT = re.compile(
+    r'(?<![0-9０-９,，])'
+    r'(?:[¥￥][0-9０-９][0-9０-９,，]*円?'
+    r'|[0-9０-９]{1,3}(?:[,，][0-9０-９]{3})+円?'
+    r'|[0-9０-９]+円)'
+    r'(?![0-9０-９年月日])'
+)
+# ラベルの直後に続いてもよい文字（「合計額」「残高金額」など）
+_LABEL_SUFFIXES = '金額'
+
+
+def _find_amount(text, start=0):
+    """文字列中の最初の金額を (元の文字列, 正規化値) で返す（なければNone）"""
+    for match in _AMOUNT.finditer(text, start):
+        normalized = normalize_amount(match.group().replace('，', ','))
+        if normalized:
+            return match.group(), normalized
+    return None
+
+
+def _label_end(text, label):
+    """ラベルが単独の語として現れる位置の直後を返す（なければ-1）
+
+    「残高証明書」のように長い語の一部になっているものはラベルとみなさない。
+    """
+    for match in re.finditer(re.escape(label), text):
+        end = match.end()
+        while end < len(text) and text[end] in _LABEL_SUFFIXES:
+            end += 1
+        if end == len(text) or not text[end].isalnum() or text[end].isdecimal():
+            return end
+    return -1
+
+
+class _Box:
+    __slots__ = ('x0', 'y0', 'x1', 'y1', 'text', 'page', 'amount')
+
+    def __init__(self, element, amount=None):
+        self.x0 = element['x']
+        self.y0 = element['y']
+        self.x1 = element['x'] + element['width']
+        self.y1 = element['y'] + element['height']
+        self.text = element['text']
+        self.page = element.get('page', 0)
+        self.amount = amount
+
+    def overlaps_rows(self, other):
+        """縦方向に重なるか（同じ行とみなすか）"""
+        overlap = min(self.y1, other.y1) - max(self.y0, other.y0)
+        return overlap > 0.5 * min(self.y1 - self.y0, other.y1 - other.y0)
+
+    def overlaps_columns(self, other):
+        """横方向に重なるか（同じ列とみなすか）"""
+        return min(self.x1, other.x1) - max(self.x0, other.x0) > 0
+
+
+def _band_range(start, end, size):
+    return range(int(start // size), int(end // size) + 1)
+
+
+class PageSpatialIndex:
+    """1ページ分の金額を含む要素の格子状インデックス
+
+    要素は重なる横方向の帯（行）ごとにx座標順、縦方向の帯（列）ごとにy座標順に並べる。
+    検索は帯ごとに二分探索するため、要素数nに対してO(log n)で最も近い候補に到達する。
+    """
+
+    def __init__(self, boxes, row_band=ROW_BAND, column_band=COLUMN_BAND):
+        self.row_band = row_band
+        self.column_band = column_band
+        rows = defaultdict(list)
+        columns = defaultdict(list)
+        for box in boxes:
+            for band in _band_range(box.y0, box.y1, row_band):
+                rows[band].append((box.x0, box))
+            for band in _band_range(box.x0, box.x1, column_band):
+                columns[band].append((box.y0, box))
+        # 帯ごとに (座標のリスト, 要素のリスト) を座標順に保持
+        self._rows = {band: self._sorted(items) for band, items in rows.items()}
+        self._columns = {band: self._sorted(items) for band, items in columns.items()}
+
+    @staticmethod
+    def _sorted(items):
+        items.sort(key=lambda item: item[0])
+        return [key for key, _ in items], [box for _, box in items]
+
+    def right_of(self, label, max_distance=None):
+        """ラベルと同じ行で右側にある最も近い金額の要素（なければNone）"""
+        best = None
+        best_distance = max_distance if max_distance is not None else float('inf')
+        for band in _band_range(label.y0, label.y1, self.row_band):
+            if band not in self._rows:
+                continue
+            keys, boxes = self._rows[band]
+            for index in range(bisect_left(keys, label.x1 - TOLERANCE), len(keys)):
+                distance = keys[index] - label.x1
+                if distance > best_distance:
+                    break
+                box = boxes[index]
+                if box is not label and label.overlaps_rows(box):
+                    best, best_distance = box, distance
+                    break
+        return best
+
+    def below(self, label, max_distance=None):
+        """ラベルの下で横方向に重なる最も近い金額の要素（なければNone）"""
+        if max_distance is None:
+            max_distance = (label.y1 - label.y0) * BELOW_LINES
+        best = None
+        best_distance = max_distance
+        for band in _band_range(label.x0, label.x1, self.column_band):
+            if band not in self._columns:
+                continue
+            keys, boxes = self._columns[band]
+            for index in range(bisect_left(keys, label.y1 - TOLERANCE), len(keys)):
+                distance = keys[index] - label.y1
+                if distance > best_distance:
+                    break
+                box = boxes[index]
+                if box is not label and label.overlaps_columns(box):
+                    best, best_distance = box, distance
+                    break
+        return best
+
+
+class LayoutIndex:
+    """text_elementsのページごとの空間インデックスとラベルの位置
+
+    ラベルを含む要素は作成時に1回だけ探しておき、検索はページのインデックスだけを使う。
+    """
+
+    def __init__(self, text_elements, labels=DEFAULT_LABELS):
+        self.labels = tuple(labels)
+        self._labels = defaultdict(list)  # ラベル -> [(ラベルの要素, ラベルの後ろの位置)]
+        amount_boxes = defaultdict(list)
+        for element in text_elements:
+            text = element.get('text') or ''
+            amount = _find_amount(text)
+            box = _Box(element, amount)
+            if amount:
+                amount_boxes[box.page].append(box)
+            for label in self.labels:
+                end = _label_end(text, label)
+                if end >= 0:
+                    self._labels[label].append((box, end))
+        self.pages = {page: PageSpatialIndex(boxes) for page, boxes in amount_boxes.items()}
+
+    def find(self, label):
+        """ラベルごとに (ラベルの要素, 金額の要素, 元の文字列, 正規化値, 位置) を返す
+
+        位置は'same'（同じ行の要素内）、'right'（右）、'below'（下）のいずれか。
+        """
+        results = []
+        for label_box, after_label in self._labels.get(label, []):
+            # 「残高 1,234円」のように同じ行の要素にラベルと金額がある場合
+            amount = _find_amount(label_box.text, after_label)
+            if amount:
+                results.append((label_box, label_box, amount[0], amount[1], 'same'))
+                continue
+            page_index = self.pages.get(label_box.page)
+            if page_index is None:
+                continue
+            for direction, box in (('right', page_index.right_of(label_box)),
+                                   ('below', page_index.below(label_box))):
+                if box is not None:
+                    results.append((label_box, box, box.amount[0], box.amount[1], direction))
+                    break
+        return results
+
+
+@stage_timer('layout_extract')
+def extract_amounts_by_layout(text_elements, labels=DEFAULT_LABELS):
+    """ラベルの右・下にある金額を抽出（extract_amounts_with_patternsと同じ形式、重複は除去）"""
+    index = LayoutIndex(text_elements, labels)
+    seen_normalized = set()
+    values = []
+    for label in index.labels:
+        for label_box, box, raw, normalized, direction in index.find(label):
+            if normalized in seen_normalized:
+                continue
+            seen_normalized.add(normalized)
+            values.append({
+                'raw': raw,
+                'normalized': normalized,
+                'pattern': None,
+                'position': None,
+                'page_number': box.page + 1,
+                'label': label,
+                'direction': direction,
+                'bbox': (box.x0, box.y0, box.x1, box.y1),
+            })
+    return values
@@ -0,0 +1,80 @@
+# LLM応答のキャッシュモジュール（データベースに保存）
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+# キャッシュの有効期限と最大件数（環境変数で調整可能）
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+
+
+def _normalize_prompt(text):
+    """空白の違いだけのプロンプトが同じキーになるよう正規化"""
+    lines = [re.sub(r'[ \t　]+', ' ', line).strip() for line in text.strip().splitlines()]
+    return "\n".join(lines)
+
+
+def make_cache_key(messages, model, temperature, max_tokens=None):
+    """正規化したプロンプト・モデル・temperatureからキャッシュキーを作成"""
+    payload = {
+        'messages': [{'role': m['role'], 'content': _normalize_prompt(m['content'])} for m in messages],
+        'model': model,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """LLM応答をデータベースに保存するキャッシュ（TTL + LRUで削除）"""
+
+    def __init__(self, session_scope, entry_model, ttl_seconds=None, max_entries=None):
+        self._session_scope = session_scope
+        self._entry_model = entry_model
+        self.ttl_seconds = LLM_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key):
+        """キャッシュ済みの応答を取得（期限切れ・未登録の場合はNone）"""
+        Entry = self._entry_model
+        now = datetime.now()
+        with self._session_scope() as session:
+            entry = session.query(Entry).filter(Entry.cache_key == cache_key).first()
+            if entry is None or entry.created_at < now - timedelta(seconds=self.ttl_seconds):
+                self.misses += 1
+                return None
+            entry.last_used_at = now
+            entry.hit_count = (entry.hit_count or 0) + 1
+            self.hits += 1
+            return entry.response_text
+
+    def set(self, cache_key, model, temperature, response_text):
+        """応答を保存し、期限切れと上限を超えた古いエントリを削除"""
+        Entry = self._entry_model
+        now = datetime.now()
+        with self._session_scope() as session:
+            session.merge(Entry(
+                cache_key=cache_key,
+                model=model,
+                temperature=temperature,
+                response_text=response_text,
+                created_at=now,
+                last_used_at=now,
+                hit_count=0
+            ))
+            session.flush()
+
+            session.query(Entry).filter(
+                Entry.created_at < now - timedelta(seconds=self.ttl_seconds)
+            ).delete(synchronize_session=False)
+
+            overflow = session.query(Entry).count() - self.max_entries
+            if overflow > 0:
+                oldest = session.query(Entry.cache_key).order_by(Entry.last_used_at).limit(overflow).all()
+                session.query(Entry).filter(
+                    Entry.cache_key.in_([key for key, in oldest])
+                ).delete(synchronize_session=False)
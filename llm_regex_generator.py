@@ -1,14 +1,110 @@
 # LLMによる正規表現生成モジュール
 import openai
 import re
+import asyncio
 import json
 import os
+from client_registry import configure_openai, configure_openai_async
+from llm_cache import make_cache_key
+from metrics import count_event, stage_timer
+from pattern_set import compile_pattern_set, normalize_amount
+from regex_safety import vet_patterns
 
 # OpenAI APIキーを環境変数から取得
 openai.api_key = os.getenv("OPENAI_API_KEY", "")
 
-def generate_regex_patterns(ocr_text, target_values=None, document_category=None):
-    """LLMを使用して金額抽出用の正規表現を生成"""
+# LLM応答キャッシュ（set_llm_response_cacheで設定）
+_response_cache = None
+
+def set_llm_response_cache(cache):
+    """LLM応答キャッシュを設定（Noneで無効化）"""
+    global _response_cache
+    _response_cache = cache
+
+def _cached_response(cache_key):
+    """キャッシュ済みの応答を取得（キャッシュ未設定・エラー時はNone）"""
+    if _response_cache is None:
+        return None
+    try:
+        cached_text = _response_cache.get(cache_key)
+    except Exception as e:
+        print(f"LLMキャッシュ取得エラー: {e}")
+        count_event('errors', stage='llm_cache')
+        return None
+    count_event('cache_requests', cache='llm', result='miss' if cached_text is None else 'hit')
+    return cached_text
+
+def _store_response(cache_key, model, temperature, result_text):
+    """応答をキャッシュに保存"""
+    if _response_cache is None:
+        return
+    try:
+        _response_cache.set(cache_key, model, temperature, result_text)
+    except Exception as e:
+        print(f"LLMキャッシュ保存エラー: {e}")
+        count_event('errors', stage='llm_cache')
+
+def _count_tokens(response, model):
+    """応答のトークン使用量をカウンタに加算"""
+    usage = getattr(response, 'usage', None)
+    if usage:
+        count_event('llm_tokens', getattr(usage, 'prompt_tokens', 0) or 0, model=model, kind='prompt')
+        count_event('llm_tokens', getattr(usage, 'completion_tokens', 0) or 0, model=model, kind='completion')
+
+def _chat_completion(messages, model, temperature, max_tokens):
+    """ChatCompletionを実行し応答本文を返す（同じプロンプトはキャッシュから返す）"""
+    cache_key = make_cache_key(messages, model, temperature, max_tokens)
+    cached_text = _cached_response(cache_key)
+    if cached_text is not None:
+        return cached_text
+    
+    configure_openai()
+    count_event('api_calls', service='openai')
+    with stage_timer('llm'):
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    _count_tokens(response, model)
+    result_text = response.choices[0].message.content
+    
+    _store_response(cache_key, model, temperature, result_text)
+    return result_text
+
+async def _chat_completion_async(messages, model, temperature, max_tokens):
+    """_chat_completionの非同期版（キャッシュのDBアクセスはスレッドで実行）"""
+    cache_key = make_cache_key(messages, model, temperature, max_tokens)
+    cached_text = await asyncio.to_thread(_cached_response, cache_key)
+    if cached_text is not None:
+        return cached_text
+    
+    await configure_openai_async()
+    count_event('api_calls', service='openai')
+    with stage_timer('llm'):
+        response = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    _count_tokens(response, model)
+    result_text = response.choices[0].message.content
+    
+    await asyncio.to_thread(_store_response, cache_key, model, temperature, result_text)
+    return result_text
+
+# LLMが使えない場合のフォールバックパターン
+FALLBACK_PATTERNS = [
+    r'(?:残高|金額|合計|計|額)[：:\s]*([¥￥]?[\d,]+)円?',
+    r'([¥￥][\d,]+)',
+    r'([\d,]+)円',
+    r'(?:[\d,]+)(?:\.[\d]+)?'
+]
+
+def _generate_request(ocr_text, target_values=None, document_category=None):
+    """正規表現生成のChatCompletion引数を作成"""
     
     # プロンプトの構築
     prompt = f"""以下のOCRテキストから金額を抽出するための正規表現パターンを生成してください。
@@ -50,42 +146,49 @@ JSON形式で、以下のような構造で返してください：
 }
 """
 
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": "あなたは正規表現のエキスパートです。日本の財産書類から金額を抽出するための最適な正規表現を生成してください。"},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 1000
+    }
+
+def _parse_generated_patterns(result_text):
+    """LLMの応答から正規表現のリストを取得"""
+    # JSONを抽出
+    json_match = re.search(r'\{[\s\S]*\}', result_text)
+    if json_match:
+        result_json = json.loads(json_match.group())
+        # バックトラックが爆発する構文のパターンは使わない
+        patterns = vet_patterns([pattern["regex"] for pattern in result_json["patterns"]])
+        if patterns:
+            return patterns
+    # フォールバックパターン
+    return list(FALLBACK_PATTERNS)
+
+def generate_regex_patterns(ocr_text, target_values=None, document_category=None):
+    """LLMを使用して金額抽出用の正規表現を生成"""
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "あなたは正規表現のエキスパートです。日本の財産書類から金額を抽出するための最適な正規表現を生成してください。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        
-        result_text = response.choices[0].message.content
-        
-        # JSONを抽出
-        json_match = re.search(r'\{[\s\S]*\}', result_text)
-        if json_match:
-            result_json = json.loads(json_match.group())
-            return [pattern["regex"] for pattern in result_json["patterns"]]
-        else:
-            # フォールバックパターン
-            return [
-                r'(?:残高|金額|合計|計|額)[：:\s]*([¥￥]?[\d,]+)円?',
-                r'([¥￥][\d,]+)',
-                r'([\d,]+)円',
-                r'(?:[\d,]+)(?:\.[\d]+)?'
-            ]
-            
+        result_text = _chat_completion(**_generate_request(ocr_text, target_values, document_category))
+        return _parse_generated_patterns(result_text)
     except Exception as e:
         print(f"LLMエラー: {e}")
+        count_event('errors', stage='llm')
         # エラー時のフォールバックパターン
-        return [
-            r'(?:残高|金額|合計|計|額)[：:\s]*([¥￥]?[\d,]+)円?',
-            r'([¥￥][\d,]+)',
-            r'([\d,]+)円',
-            r'(?:[\d,]+)(?:\.[\d]+)?'
-        ]
+        return list(FALLBACK_PATTERNS)
+
+async def generate_regex_patterns_async(ocr_text, target_values=None, document_category=None):
+    """generate_regex_patternsの非同期版"""
+    try:
+        result_text = await _chat_completion_async(**_generate_request(ocr_text, target_values, document_category))
+        return _parse_generated_patterns(result_text)
+    except Exception as e:
+        print(f"LLMエラー: {e}")
+        count_event('errors', stage='llm')
+        return list(FALLBACK_PATTERNS)
 
 def improve_regex_patterns(ocr_text, current_patterns, missed_values, document_category=None):
     """既存のパターンを改善"""
@@ -113,7 +216,7 @@ JSON形式で、改善された正規表現パターンのリストを返して
 """
 
     try:
-        response = openai.ChatCompletion.create(
+        result_text = _chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "あなたは正規表現のエキスパートです。既存のパターンを分析し、改善してください。"},
@@ -123,69 +226,68 @@ JSON形式で、改善された正規表現パターンのリストを返して
             max_tokens=800
         )
         
-        result_text = response.choices[0].message.content
-        
         # JSONを抽出
         json_match = re.search(r'\{[\s\S]*\}', result_text)
         if json_match:
             result_json = json.loads(json_match.group())
-            return result_json["patterns"]
+            return vet_patterns(result_json["patterns"]) or current_patterns
         else:
             return current_patterns
             
     except Exception as e:
         print(f"LLM改善エラー: {e}")
+        count_event('errors', stage='llm')
         return current_patterns
 
-def extract_amounts_with_patterns(text, patterns):
-    """正規表現パターンを使用して金額を抽出"""
-    extracted_values = []
-    
-    for pattern in patterns:
-        try:
-            matches = re.finditer(pattern, text, re.MULTILINE | re.IGNORECASE)
-            for match in matches:
-                # グループがある場合は最初のグループ、なければ全体
-                value = match.group(1) if match.groups() else match.group(0)
-                
-                # 数値の正規化
-                normalized_value = normalize_amount(value)
-                if normalized_value:
-                    extracted_values.append({
-                        'raw': value,
-                        'normalized': normalized_value,
-                        'pattern': pattern,
-                        'position': match.span()
-                    })
-        except Exception as e:
-            print(f"パターン適用エラー: {pattern}, {e}")
+@stage_timer('regex_extract')
+def extract_amounts_with_patterns(text, patterns, stats=None):
+    """正規表現パターンを使用して金額を抽出
+
+    statsに辞書を渡すとパターンごとの {パターン: [一致数, 実行秒数]} を記録する。
+    """
+    pattern_set = compile_pattern_set(patterns)
     
     # 重複を除去（同じ正規化値を持つものを除去）
-    unique_values = []
-    seen_normalized = set()
-    for value in extracted_values:
-        if value['normalized'] not in seen_normalized:
-            unique_values.append(value)
-            seen_normalized.add(value['normalized'])
+    errors = dict(pattern_set.errors)
+    extracted = list(pattern_set.extract(text, stats, errors=errors))
+    # コンパイルエラー・拒否・時間切れのパターンを表示
+    for pattern, error in errors.items():
+        print(f"パターン適用エラー: {pattern}, {error}")
+    return extracted
+
+class PageExtractor:
+    """OCRのページが届くたびに金額を抽出（ページをまたいで同じ金額は最初の1回だけ返す）
+
+    抽出結果には'page_number'を付け、'position'はページ内の位置とする。
+    """
+    
+    def __init__(self, patterns, stats=None):
+        self.pattern_set = compile_pattern_set(patterns)
+        self.stats = stats
+        self.values = []
+        # コンパイルエラー・拒否と、この書類で時間切れになったパターン
+        self.errors = dict(self.pattern_set.errors)
+        self._seen_normalized = set()
     
-    return unique_values
+    @stage_timer('regex_extract_page')
+    def add_page(self, page_number, text):
+        """1ページ分を抽出し、このページで新たに見つかった金額を返す"""
+        page_values = []
+        for value in self.pattern_set.extract(text or "", self.stats, self._seen_normalized, self.errors):
+            value['page_number'] = page_number
+            page_values.append(value)
+        self.values.extend(page_values)
+        return page_values
+    
+    def report_errors(self):
+        """コンパイルエラー・拒否・時間切れのパターンを表示"""
+        for pattern, error in self.errors.items():
+            print(f"パターン適用エラー: {pattern}, {error}")
 
-def normalize_amount(amount_str):
-    """金額文字列を正規化（数値に変換）"""
-    try:
-        # 全角数字を半角に変換
-        amount_str = amount_str.translate(str.maketrans('０１２３４５６７８９', '0123456789'))
-        
-        # 円記号、カンマ、円を除去
-        amount_str = re.sub(r'[¥￥,円]', '', amount_str)
-        
-        # 空白を除去
-        amount_str = amount_str.strip()
-        
-        # 数値に変換
-        if amount_str:
-            return int(amount_str)
-        else:
-            return None
-    except:
-        return None
+def extract_amounts_by_page(pages, patterns, stats=None):
+    """ページ（'page_number'と'text'を持つ辞書）ごとに金額を抽出し、ページ番号付きのリストを返す"""
+    extractor = PageExtractor(patterns, stats)
+    for page in pages:
+        extractor.add_page(page['page_number'], page.get('text'))
+    extractor.report_errors()
+    return extractor.values
@@ -0,0 +1,194 @@
+# 処理時間・呼び出し回数の計測モジュール
+#
+# 工程（stage）ごとの処理時間を直近 METRICS_SAMPLE_SIZE 件保持してp50/p95を計算し、
+# キャッシュのヒット数・API呼び出し数・トークン数などをカウンタとして集計する。
+# METRICS_PORTを設定するとPrometheus形式のテキストをHTTPで公開する。
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_SAMPLE_SIZE = int(os.getenv('METRICS_SAMPLE_SIZE', '1024'))
+METRICS_PREFIX = 'ocr_app'
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    items = ','.join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels)
+    return '{' + items + '}'
+
+
+class _StageStats:
+    def __init__(self, sample_size):
+        self.samples = deque(maxlen=sample_size)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    """工程ごとの処理時間とカウンタを保持（スレッドセーフ）"""
+
+    def __init__(self, sample_size=METRICS_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        """工程の処理時間を記録"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats(self.sample_size)
+            stats.samples.append(seconds)
+            stats.count += 1
+            stats.total += seconds
+            if error:
+                stats.errors += 1
+
+    def increment(self, name, value=1, **labels):
+        """カウンタを加算"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def stage_summary(self):
+        """工程ごとの件数・エラー数・平均・p50・p95・最大（秒）を取得"""
+        with self._lock:
+            snapshot = {stage: (sorted(s.samples), s.count, s.total, s.errors) for stage, s in self._stages.items()}
+        summary = {}
+        for stage, (ordered, count, total, errors) in sorted(snapshot.items()):
+            summary[stage] = {
+                'count': count,
+                'errors': errors,
+                'mean': total / count if count else 0.0,
+                'p50': _percentile(ordered, 0.5),
+                'p95': _percentile(ordered, 0.95),
+                'max': ordered[-1] if ordered else 0.0,
+            }
+        return summary
+
+    def counters(self):
+        """カウンタの一覧を取得（(名前, ラベル) → 値）"""
+        with self._lock:
+            return dict(self._counters)
+
+    def render_prometheus(self):
+        """Prometheusのテキスト形式で出力"""
+        name = f'{METRICS_PREFIX}_stage_seconds'
+        lines = [f'# TYPE {name} summary']
+        summary = self.stage_summary()
+        for stage, stats in summary.items():
+            for q in ('0.5', '0.95'):
+                value = stats['p50'] if q == '0.5' else stats['p95']
+                lines.append(f'{name}{_label_text([("stage", stage), ("quantile", q)])} {value:.6f}')
+            lines.append(f'{name}_sum{_label_text([("stage", stage)])} {stats["mean"] * stats["count"]:.6f}')
+            lines.append(f'{name}_count{_label_text([("stage", stage)])} {stats["count"]}')
+
+        errors_name = f'{METRICS_PREFIX}_stage_errors_total'
+        lines.append(f'# TYPE {errors_name} counter')
+        for stage, stats in summary.items():
+            lines.append(f'{errors_name}{_label_text([("stage", stage)])} {stats["errors"]}')
+
+        declared = set()
+        for (counter, labels), value in sorted(self.counters().items()):
+            counter_name = f'{METRICS_PREFIX}_{counter}_total'
+            if counter_name not in declared:
+                lines.append(f'# TYPE {counter_name} counter')
+                declared.add(counter_name)
+            lines.append(f'{counter_name}{_label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """すべての計測値を破棄"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """プロセス共通の計測レジストリを取得"""
+    return _metrics
+
+
+class stage_timer:
+    """工程の処理時間を計測（with文またはデコレータとして使用、非同期関数にも対応）"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _metrics.observe(self.stage, time.perf_counter() - self._start, error=exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        stage = self.stage
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def count_event(name, value=1, **labels):
+    """カウンタを加算（例: count_event('api_calls', service='azure')）"""
+    _metrics.increment(name, value, **labels)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = _metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host='0.0.0.0'):
+    """Prometheus形式の計測値をHTTPで公開（2回目以降の呼び出しは何もしない）"""
+    global _server
+    port = port if port is not None else int(os.getenv('METRICS_PORT', '0') or 0)
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"メトリクスサーバー起動エラー: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
@@ -0,0 +1,94 @@
+# データベーススキーマのマイグレーション（SQLite/PostgreSQL共通）
+#
+# テーブルはSQLAlchemyのcreate_allで作成し、インデックスなど既存DBにも追加が必要な変更は
+# ここにバージョン付きで追加する。適用済みのバージョンはschema_migrationsテーブルに記録する。
+from datetime import datetime
+from sqlalchemy import text
+
+# (バージョン, 説明, {'common': 全DB共通のSQL, 'sqlite': SQLiteのみ, 'postgresql': PostgreSQLのみ})
+MIGRATIONS = [
+    (1, "document_patterns・extraction_historyの検索用インデックス", {
+        'common': [
+            # 統計情報タブのカテゴリ別集計（インデックスだけで集計できるよう件数列も含める）
+            "CREATE INDEX IF NOT EXISTS ix_document_patterns_category_counts "
+            "ON document_patterns (category, success_count, failure_count)",
+            # 最近の抽出履歴（ORDER BY created_at DESC LIMIT 10）
+            "CREATE INDEX IF NOT EXISTS ix_extraction_history_created_at "
+            "ON extraction_history (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_extraction_history_category_created_at "
+            "ON extraction_history (document_category, created_at)",
+        ],
+    }),
+    (2, "llm_response_cacheの期限切れ・LRU削除用インデックス", {
+        'common': [
+            "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_created_at "
+            "ON llm_response_cache (created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_last_used_at "
+            "ON llm_response_cache (last_used_at)",
+        ],
+    }),
+    (3, "JSONB列のGINインデックス（パターン・抽出値の包含検索用）", {
+        'postgresql': [
+            "CREATE INDEX IF NOT EXISTS ix_document_patterns_regex_patterns_gin "
+            "ON document_patterns USING gin (regex_patterns jsonb_path_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_extraction_history_used_patterns_gin "
+            "ON extraction_history USING gin (used_patterns jsonb_path_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_extraction_history_extracted_values_gin "
+            "ON extraction_history USING gin (extracted_values jsonb_path_ops)",
+        ],
+    }),
+    (4, "類似検索用シグネチャを文字の多重集合のMinHashで作り直す", {
+        'common': [
+            # 次回の類似検索時にシグネチャ未保存のパターンとして補完される
+            "DELETE FROM document_signatures",
+        ],
+    }),
+]
+
+# 複数プロセスが同時にマイグレーションしないためのアドバイザリロックのキー
+_POSTGRES_LOCK_KEY = 7305431
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"
+    ))
+
+
+def applied_versions(connection):
+    """適用済みのマイグレーションのバージョンを取得"""
+    _ensure_version_table(connection)
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migration_statements(dialect_name, steps):
+    """DBの種類に応じて実行するSQLを取得"""
+    return list(steps.get('common', [])) + list(steps.get(dialect_name, []))
+
+
+def apply_migrations(engine):
+    """未適用のマイグレーションを順に適用し、適用したバージョンのリストを返す"""
+    dialect_name = engine.dialect.name
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        try:
+            with engine.begin() as connection:
+                if dialect_name == 'postgresql':
+                    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _POSTGRES_LOCK_KEY})
+                if version in applied_versions(connection):
+                    continue
+                for statement in migration_statements(dialect_name, steps):
+                    connection.execute(text(statement))
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {"version": version, "description": description, "applied_at": datetime.now()}
+                )
+                applied.append(version)
+        except Exception:
+            # SQLiteでは別プロセスが同時に適用した場合に競合するため、適用済みなら無視する
+            with engine.connect() as connection:
+                if version not in applied_versions(connection):
+                    raise
+    return applied
@@ -0,0 +1,56 @@
+# OCR結果のキャッシュモジュール（PDFのハッシュで管理）
+import hashlib
+import json
+import threading
+from disk_cache import DiskLRUCache
+from metrics import count_event
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def pdf_hash(pdf_data):
+    """PDFのSHA-256ハッシュを取得"""
+    return hashlib.sha256(pdf_data).hexdigest()
+
+
+class OCRCache:
+    """OCR結果のキャッシュ（PDFハッシュ + OCRプロバイダ + モデルIDをキーとする）"""
+
+    def __init__(self, directory, max_bytes):
+        self._store = DiskLRUCache(directory, max_bytes, suffix=".json")
+
+    @staticmethod
+    def make_key(pdf_data, provider, model_id, digest=None):
+        """キャッシュキーを作成（digestを渡した場合はPDFのハッシュを再計算しない）"""
+        digest = digest or pdf_hash(pdf_data)
+        return hashlib.sha256(f"{provider}:{model_id}:{digest}".encode('utf-8')).hexdigest()
+
+    def get(self, pdf_data, provider, model_id, digest=None):
+        """キャッシュ済みのOCR結果を取得（存在しない場合はNone）"""
+        data = self._store.get(self.make_key(pdf_data, provider, model_id, digest))
+        count_event('cache_requests', cache='ocr', result='miss' if data is None else 'hit')
+        if data is None:
+            return None
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+
+    def set(self, pdf_data, provider, model_id, result, digest=None):
+        """OCR結果をキャッシュに保存"""
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self._store.set(self.make_key(pdf_data, provider, model_id, digest), data)
+
+    def stats(self):
+        """ヒット/ミス回数と使用量を取得"""
+        return self._store.stats()
+
+
+def get_ocr_cache(directory, max_bytes):
+    """OCRキャッシュを取得（ディレクトリごとにプロセス内で共有）"""
+    key = str(directory)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = OCRCache(directory, max_bytes)
+        return _caches[key]
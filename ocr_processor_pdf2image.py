@@ -1,129 +1,355 @@
 # OCR処理モジュール（pdf2image版）
-from pdf2image import convert_from_bytes
-from PIL import Image
-import io
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
+from pdf_source import convert_pdf, pdf_as_bytes, pdfinfo, read_pdf, spooled_pdf
 from google.cloud import vision
-from google.oauth2 import service_account
 import os
-import json
+import re
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from client_registry import (
+    get_azure_client, get_azure_client_async, get_vision_client, get_vision_client_async
+)
+from image_encoding import ImageEncoding, encode_image
+from metrics import count_event, stage_timer
 
-def pdf_to_images(pdf_path):
-    """PDFを画像に変換（pdf2image版）"""
-    # PDFファイルを読み込み
-    with open(pdf_path, 'rb') as f:
-        pdf_data = f.read()
+# Google OCRのページ並列数（環境変数で調整可能）
+GOOGLE_OCR_CONCURRENCY = int(os.getenv('GOOGLE_OCR_CONCURRENCY', '4'))
+# 一度にラスタライズするページ数（メモリ使用量の上限を決める）
+RASTER_WINDOW = int(os.getenv('RASTER_WINDOW', '4'))
+# ラスタライズの並列数（既定はCPUコア数）
+RASTER_WORKERS = int(os.getenv('RASTER_WORKERS', str(os.cpu_count() or 1)))
+
+def get_pdf_page_count(pdf_data):
+    """PDFのページ数を取得（パスまたはbytes/memoryview）"""
+    return int(pdfinfo(pdf_data)['Pages'])
+
+def get_pdf_page_sizes(pdf_data):
+    """ページごとのサイズ（ポイント）を取得 {ページ番号: (幅, 高さ)}"""
+    try:
+        info = pdfinfo(pdf_data, first_page=1, last_page=get_pdf_page_count(pdf_data))
+    except TypeError:
+        # first_page/last_pageに対応していない古いpdf2image
+        info = pdfinfo(pdf_data)
     
-    # PDFを画像に変換
-    images = convert_from_bytes(pdf_data, dpi=200)
+    page_count = int(info['Pages'])
+    sizes = {}
+    default_size = None
+    for key, value in info.items():
+        size_match = re.match(r'([\d.]+) x ([\d.]+)', str(value))
+        if not size_match:
+            continue
+        page_match = re.match(r'Page\s+(\d+)\s+size', key)
+        if page_match:
+            sizes[int(page_match.group(1))] = (float(size_match.group(1)), float(size_match.group(2)))
+        elif key == 'Page size':
+            default_size = (float(size_match.group(1)), float(size_match.group(2)))
     
-    # バイト形式に変換
+    default_size = default_size or (595.0, 842.0)  # 不明な場合はA4
+    return {page: sizes.get(page, default_size) for page in range(1, page_count + 1)}
+
+@stage_timer('rasterize')
+def _rasterize_window(pdf_data, dpi, first_page, last_page, encoding):
+    """指定範囲のページを画像（エンコード済みバイト列）に変換"""
+    images = convert_pdf(pdf_data, dpi=dpi, first_page=first_page, last_page=last_page)
     image_bytes = []
     for img in images:
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        image_bytes.append(img_byte_arr)
-    
+        image_bytes.append(encode_image(img, encoding))
+        img.close()
     return image_bytes
 
-def perform_azure_ocr(pdf_data):
-    """Azure Form Recognizerを実行"""
-    # 環境変数から設定を取得
-    azure_endpoint = os.getenv('AZURE_ENDPOINT')
-    azure_api_key = os.getenv('AZURE_API_KEY')
-    azure_model_id = os.getenv('AZURE_MODEL_ID', 'prebuilt-read')
+def _raster_ranges(pdf_data, dpi, window, encoding, provider):
+    """(開始ページ, 終了ページ, dpi) の範囲リストを作成（同じdpiの連続ページをまとめる）"""
+    if dpi:
+        page_count = get_pdf_page_count(pdf_data)
+        return [
+            (first_page, min(first_page + window - 1, page_count), dpi)
+            for first_page in range(1, page_count + 1, window)
+        ]
+    
+    ranges = []
+    for page, (width, height) in sorted(get_pdf_page_sizes(pdf_data).items()):
+        page_dpi = encoding.choose_dpi(width, height, provider)
+        if ranges and ranges[-1][2] == page_dpi and ranges[-1][1] - ranges[-1][0] + 1 < window:
+            ranges[-1] = (ranges[-1][0], page, page_dpi)
+        else:
+            ranges.append((page, page, page_dpi))
+    return ranges
+
+def iter_pdf_images(pdf_data, dpi=None, window=None, workers=None, encoding=None, provider='google'):
+    """PDFを1ページずつ画像（エンコード済みバイト列）に変換
+
+    first_page/last_pageで数ページずつ変換し、複数の範囲をworkers個の
+    pdftoppmプロセスで並列に処理する。ページ順は維持され、同時に保持する
+    画像は最大 window * workers * 2 ページ分になる。
+    dpiを省略した場合はページサイズとプロバイダの上限からページごとに決める。
+    pdf_dataはパスまたはbytes/memoryview。バイト列はこの変換の間だけ一時ファイルに1回書き出す
+    （メモリ上のバイト列はハッシュ計算・Azure・プレビュー用に残す）。
+    """
+    window = window or RASTER_WINDOW
+    workers = workers or RASTER_WORKERS
+    encoding = encoding or ImageEncoding.from_env()
+    
+    with spooled_pdf(pdf_data) as source:
+        ranges = _raster_ranges(source, dpi, window, encoding, provider)
+        
+        if workers <= 1 or len(ranges) <= 1:
+            for first_page, last_page, page_dpi in ranges:
+                yield from _rasterize_window(source, page_dpi, first_page, last_page, encoding)
+            return
+        
+        # pdftoppmは別プロセスで動き、画像のエンコードもGILを解放するためスレッドで並列化できる
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for first_page, last_page, page_dpi in ranges:
+                pending.append(executor.submit(_rasterize_window, source, page_dpi, first_page, last_page, encoding))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+def pdf_to_images(pdf_source):
+    """PDFを画像に変換（pdf2image版、パスまたはbytes/memoryview）"""
+    return list(iter_pdf_images(pdf_source))
+
+class OCRResult:
+    """OCR結果（全文テキスト、ページ情報、座標付きテキスト要素）"""
     
-    if not azure_endpoint or not azure_api_key:
-        raise ValueError("Azure Form Recognizerの設定が不足しています")
+    def __init__(self, text, pages=None, text_elements=None, errors=None):
+        self.text = text
+        self.pages = pages or []  # ページごとの番号・サイズ・テキスト
+        self.text_elements = text_elements or []  # 行ごとのテキストと座標（ポイント単位）
+        self.errors = errors or []  # ページごとのエラー（page_number, error）
     
-    client = DocumentAnalysisClient(
-        endpoint=azure_endpoint,
-        credential=AzureKeyCredential(azure_api_key)
-    )
+    def to_dict(self):
+        """キャッシュ保存用の辞書に変換"""
+        return {
+            'text': self.text,
+            'pages': self.pages,
+            'text_elements': self.text_elements,
+            'errors': self.errors
+        }
     
+    @classmethod
+    def from_dict(cls, data):
+        """辞書から復元"""
+        return cls(data.get('text', ''), data.get('pages'), data.get('text_elements'), data.get('errors'))
+
+def _build_azure_result(result):
+    """Azureの解析結果からOCRResultを作成"""
+    lines = []
+    pages = []
+    text_elements = []
+    for page in result.pages:
+        page_lines = [line.content for line in page.lines]
+        lines.extend(page_lines)
+        pages.append({
+            'page_number': page.page_number,
+            'width': page.width,
+            'height': page.height,
+            'unit': page.unit,
+            'text': "\n".join(page_lines)
+        })
+        for line in page.lines:
+            if hasattr(line, 'polygon') and line.polygon:
+                x_coords = [p.x for p in line.polygon]
+                y_coords = [p.y for p in line.polygon]
+                text_elements.append({
+                    'text': line.content,
+                    'x': min(x_coords) * 72,  # インチからポイントへ
+                    'y': min(y_coords) * 72,
+                    'width': (max(x_coords) - min(x_coords)) * 72,
+                    'height': (max(y_coords) - min(y_coords)) * 72,
+                    'page': page.page_number - 1
+                })
+    
+    return OCRResult("\n".join(lines).strip(), pages, text_elements)
+
+@stage_timer('ocr_azure')
+def analyze_document_azure(pdf_data):
+    """Azure Form Recognizerで1回だけ解析し、テキスト・座標・ページ情報をまとめて取得"""
+    client = get_azure_client()
+    azure_model_id = os.getenv('AZURE_MODEL_ID', 'prebuilt-read')
+    
+    count_event('api_calls', service='azure')
     poller = client.begin_analyze_document(
         azure_model_id,
-        document=pdf_data
+        document=pdf_as_bytes(pdf_data)
+    )
+    
+    return _build_azure_result(poller.result())
+
+@stage_timer('ocr_azure')
+async def analyze_document_azure_async(pdf_data):
+    """analyze_document_azureの非同期版（azure.ai.formrecognizer.aioを使用）"""
+    client = await get_azure_client_async()
+    azure_model_id = os.getenv('AZURE_MODEL_ID', 'prebuilt-read')
+    
+    count_event('api_calls', service='azure')
+    poller = await client.begin_analyze_document(
+        azure_model_id,
+        document=pdf_as_bytes(pdf_data)
     )
+    result = await poller.result()
     
-    result = poller.result()
+    return _build_azure_result(result)
+
+def perform_azure_ocr(pdf_data):
+    """Azure Form Recognizerを実行"""
+    return analyze_document_azure(pdf_data).text
+
+async def perform_azure_ocr_async(pdf_data):
+    """perform_azure_ocrの非同期版"""
+    return (await analyze_document_azure_async(pdf_data)).text
+
+def _page_text_from_response(response):
+    """Google OCRの応答からページのテキストを取得（テキストがない場合はNone）"""
+    if response.error.message:
+        raise Exception(f"Google OCR Error: {response.error.message}")
     
-    # テキストを抽出
+    if response.text_annotations:
+        # 最初のアノテーションが全体のテキスト
+        return response.text_annotations[0].description
+    return None
+
+@stage_timer('ocr_google_page')
+def _detect_page_text(client, img_data):
+    """1ページ分の画像をGoogle OCRで認識（テキストがない場合はNone）"""
+    count_event('api_calls', service='google')
+    image = vision.Image(content=img_data)
+    return _page_text_from_response(client.text_detection(image=image))
+
+def _build_google_result(page_results):
+    """ページごとの (ページ番号, テキスト, エラー) からOCRResultを作成"""
     full_text = ""
-    for page in result.pages:
-        for line in page.lines:
-            full_text += line.content + "\n"
+    pages = []
+    errors = []
+    for page_number, page_text, error in page_results:
+        if error is not None:
+            errors.append({'page_number': page_number, 'error': error})
+        if page_text is not None:
+            full_text += page_text + "\n"
+        pages.append({'page_number': page_number, 'text': page_text or ""})
     
-    return full_text.strip()
+    if pages and len(errors) == len(pages):
+        # 全ページ失敗した場合は従来通り例外とする
+        raise Exception(errors[0]['error'])
+    
+    return OCRResult(full_text.strip(), pages, errors=errors)
 
-def perform_google_ocr(pdf_path):
-    """Google OCRを実行"""
-    # 環境変数から認証情報を取得
-    google_credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
-    if not google_credentials_json:
-        raise ValueError("Google Cloud Vision APIの認証情報が設定されていません")
+def iter_google_pages(pdf_source, max_workers=None):
+    """Google OCRをページ単位で並列実行し、(ページ番号, テキスト, エラー) をページ順に返す
+
+    先頭のページの認識が終わりしだい返すため、長い書類でも最初のページから処理を始められる。
+    pdf_sourceはパスまたはbytes/memoryview（アップロードされたバッファをそのまま渡せる）
+    """
+    client = get_vision_client()
+    pdf_data = read_pdf(pdf_source)
+    max_workers = max_workers or GOOGLE_OCR_CONCURRENCY
     
-    credentials_dict = json.loads(google_credentials_json)
-    credentials = service_account.Credentials.from_service_account_info(credentials_dict)
-    client = vision.ImageAnnotatorClient(credentials=credentials)
+    def page_result(page_number, future):
+        try:
+            return page_number, future.result(), None
+        except Exception as e:
+            return page_number, None, str(e)
     
-    images = pdf_to_images(pdf_path)
-    full_text = ""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # ラスタライズしたページから順に送信し、未完了のページ数を制限してメモリを一定に保つ
+        pending = deque()
+        for page_number, img_data in enumerate(iter_pdf_images(pdf_data, provider='google'), 1):
+            pending.append((page_number, executor.submit(_detect_page_text, client, img_data)))
+            while pending and (len(pending) >= max_workers * 2 or pending[0][1].done()):
+                yield page_result(*pending.popleft())
+        while pending:
+            yield page_result(*pending.popleft())
+
+@stage_timer('ocr_google')
+def analyze_document_google(pdf_source, max_workers=None):
+    """Google OCRをページ単位で並列実行（ページ順を維持し、失敗したページはエラーとして記録）"""
+    return _build_google_result(iter_google_pages(pdf_source, max_workers))
+
+@stage_timer('ocr_google')
+async def analyze_document_google_async(pdf_source, max_concurrency=None):
+    """analyze_document_googleの非同期版（ImageAnnotatorAsyncClientを使用）"""
+    client = await get_vision_client_async()
+    pdf_data = await asyncio.to_thread(read_pdf, pdf_source)
     
-    for img_data in images:
-        image = vision.Image(content=img_data)
-        response = client.text_detection(image=image)
-        
-        if response.error.message:
-            raise Exception(f"Google OCR Error: {response.error.message}")
-        
-        if response.text_annotations:
-            # 最初のアノテーションが全体のテキスト
-            full_text += response.text_annotations[0].description + "\n"
+    semaphore = asyncio.Semaphore(max_concurrency or GOOGLE_OCR_CONCURRENCY)
+    
+    async def detect(page_number, img_data):
+        try:
+            count_event('api_calls', service='google')
+            with stage_timer('ocr_google_page'):
+                response = await client.text_detection(image=vision.Image(content=img_data))
+            return page_number, _page_text_from_response(response), None
+        except Exception as e:
+            return page_number, None, str(e)
+        finally:
+            semaphore.release()
+    
+    # ラスタライズはCPU処理のためスレッドで1ページずつ取り出す
+    images = iter_pdf_images(pdf_data, provider='google')
+    tasks = []
+    page_number = 0
+    while True:
+        await semaphore.acquire()
+        img_data = await asyncio.to_thread(next, images, None)
+        if img_data is None:
+            semaphore.release()
+            break
+        page_number += 1
+        tasks.append(asyncio.create_task(detect(page_number, img_data)))
     
-    return full_text.strip()
+    return _build_google_result(await asyncio.gather(*tasks))
+
+class OCRPageStream:
+    """OCR結果をページごとに順に返し、最後まで読むとresultにOCRResultを設定する
+
+    Google OCRは認識の終わったページから返す。Azureは1回の解析で全ページを返すため、
+    解析が終わってからページごとに返す。
+    """
+    
+    def __init__(self, pdf_source, use_azure=True):
+        self.pdf_source = pdf_source
+        self.use_azure = use_azure
+        self.result = None
+    
+    def __iter__(self):
+        if self.use_azure:
+            self.result = analyze_document_azure(self.pdf_source)
+            yield from self.result.pages
+            return
+        
+        # 呼び出し側の処理時間を含むため、ここではocr_googleの時間を計測しない
+        page_results = []
+        for page_number, page_text, error in iter_google_pages(self.pdf_source):
+            page_results.append((page_number, page_text, error))
+            yield {'page_number': page_number, 'text': page_text or "", 'error': error}
+        self.result = _build_google_result(page_results)
+
+def perform_google_ocr(pdf_source):
+    """Google OCRを実行"""
+    result = analyze_document_google(pdf_source)
+    for error in result.errors:
+        print(f"Google OCRエラー（{error['page_number']}ページ）: {error['error']}")
+    return result.text
+
+async def perform_google_ocr_async(pdf_source):
+    """perform_google_ocrの非同期版"""
+    result = await analyze_document_google_async(pdf_source)
+    for error in result.errors:
+        print(f"Google OCRエラー（{error['page_number']}ページ）: {error['error']}")
+    return result.text
+
+def get_ocr_model_id(use_azure=True):
+    """OCR結果のキャッシュキーに使用するモデルIDを取得"""
+    if use_azure:
+        return os.getenv('AZURE_MODEL_ID', 'prebuilt-read')
+    return f"text_detection@{ImageEncoding.from_env().cache_tag}"
 
 def extract_text_with_coordinates(pdf_data, use_azure=True):
     """座標情報付きでテキストを抽出"""
     if use_azure:
-        # 環境変数から設定を取得
-        azure_endpoint = os.getenv('AZURE_ENDPOINT')
-        azure_api_key = os.getenv('AZURE_API_KEY')
-        azure_model_id = os.getenv('AZURE_MODEL_ID', 'prebuilt-read')
-        
-        if not azure_endpoint or not azure_api_key:
-            raise ValueError("Azure Form Recognizerの設定が不足しています")
-        
-        client = DocumentAnalysisClient(
-            endpoint=azure_endpoint,
-            credential=AzureKeyCredential(azure_api_key)
-        )
-        
-        poller = client.begin_analyze_document(
-            azure_model_id,
-            document=pdf_data
-        )
-        
-        result = poller.result()
-        
-        text_elements = []
-        for page in result.pages:
-            for line in page.lines:
-                if hasattr(line, 'polygon') and line.polygon:
-                    x_coords = [p.x for p in line.polygon]
-                    y_coords = [p.y for p in line.polygon]
-                    text_elements.append({
-                        'text': line.content,
-                        'x': min(x_coords) * 72,  # インチからポイントへ
-                        'y': min(y_coords) * 72,
-                        'width': (max(x_coords) - min(x_coords)) * 72,
-                        'height': (max(y_coords) - min(y_coords)) * 72,
-                        'page': page.page_number - 1
-                    })
-        
-        return text_elements
+        return analyze_document_azure(pdf_data).text_elements
     else:
         # Google OCRの場合の実装
         return []
@@ -0,0 +1,221 @@
+# 書類パターンの成功/失敗回数の更新モジュール
+#
+# 行を読み込んでPythonで加算する代わりに UPDATE ... SET count = count + n を発行し、
+# 同時に更新しても回数が失われないようにする。パターンの追加・削除もDB側で行い、
+# リスト全体を上書きしないため、他のプロセスが同時に追加したパターンも失われない。
+import json
+import threading
+import time
+import weakref
+from datetime import datetime
+from sqlalchemy import bindparam, func, text, update
+
+# PatternCounterBufferの既定の書き込み条件
+COUNTER_FLUSH_SIZE = 100
+COUNTER_FLUSH_SECONDS = 5.0
+
+
+def _dedupe(patterns):
+    """順序を保って重複を除去"""
+    seen = set()
+    return [p for p in patterns if not (p in seen or seen.add(p))]
+
+
+def increment_pattern_counts(session, pattern_model, pattern_id, success=0, failure=0):
+    """成功/失敗回数を1回のUPDATEで加算"""
+    table = pattern_model.__table__
+    values = {
+        'success_count': func.coalesce(table.c.success_count, 0) + success,
+        'failure_count': func.coalesce(table.c.failure_count, 0) + failure,
+        'updated_at': datetime.now(),
+    }
+    return session.execute(update(table).where(table.c.id == pattern_id).values(**values)).rowcount
+
+
+def append_patterns(session, pattern_model, pattern_id, new_patterns):
+    """未登録のパターンをDB側でregex_patternsの末尾に追加"""
+    new_patterns = _dedupe(new_patterns)
+    if not new_patterns:
+        return
+    table_name = pattern_model.__tablename__
+    dialect_name = session.get_bind().dialect.name
+
+    if dialect_name == 'postgresql':
+        # JSONBの連結（||）で、まだ含まれていないパターンだけを追加
+        session.execute(text(
+            f"UPDATE {table_name} SET regex_patterns = "
+            f"COALESCE(regex_patterns, '[]'::jsonb) || COALESCE(("
+            f"  SELECT jsonb_agg(p.value ORDER BY p.ordinality)"
+            f"  FROM jsonb_array_elements(CAST(:new_patterns AS jsonb)) WITH ORDINALITY AS p(value, ordinality)"
+            f"  WHERE NOT COALESCE({table_name}.regex_patterns, '[]'::jsonb) @> jsonb_build_array(p.value)"
+            f"), '[]'::jsonb) "
+            f"WHERE id = :pattern_id"
+        ), {'new_patterns': json.dumps(new_patterns, ensure_ascii=False), 'pattern_id': pattern_id})
+    elif dialect_name == 'sqlite':
+        # JSON1拡張のjson_insertで末尾に追加（含まれている場合は更新しない）
+        statement = text(
+            f"UPDATE {table_name} SET regex_patterns = json_insert("
+            f"  COALESCE(regex_patterns, '[]'),"
+            f"  '$[' || json_array_length(COALESCE(regex_patterns, '[]')) || ']', :pattern) "
+            f"WHERE id = :pattern_id AND NOT EXISTS ("
+            f"  SELECT 1 FROM json_each(COALESCE({table_name}.regex_patterns, '[]')) WHERE value = :pattern)"
+        )
+        for pattern in new_patterns:
+            session.execute(statement, {'pattern': pattern, 'pattern_id': pattern_id})
+    else:
+        # JSON関数がないDBでは行をロックして読み書きする
+        pattern = session.query(pattern_model).filter(pattern_model.id == pattern_id).with_for_update().first()
+        if pattern:
+            for new_pattern in new_patterns:
+                pattern.add_pattern(new_pattern)
+
+
+def remove_patterns(session, pattern_model, pattern_id, patterns):
+    """指定したパターンをDB側でregex_patternsから削除（残りの順序は保つ）"""
+    patterns = _dedupe(patterns)
+    if not patterns:
+        return
+    table_name = pattern_model.__tablename__
+    dialect_name = session.get_bind().dialect.name
+    params = {'patterns': json.dumps(patterns, ensure_ascii=False), 'pattern_id': pattern_id}
+
+    if dialect_name == 'postgresql':
+        # JSONBの配列から文字列の要素を削除（- text[]）
+        session.execute(text(
+            f"UPDATE {table_name} SET regex_patterns = COALESCE(regex_patterns, '[]'::jsonb) - "
+            f"ARRAY(SELECT jsonb_array_elements_text(CAST(:patterns AS jsonb))) "
+            f"WHERE id = :pattern_id"
+        ), params)
+    elif dialect_name == 'sqlite':
+        # json_eachで削除しない要素だけを元の順序で集め直す
+        session.execute(text(
+            f"UPDATE {table_name} SET regex_patterns = ("
+            f"  SELECT json_group_array(kept.value) FROM ("
+            f"    SELECT p.value FROM json_each(COALESCE({table_name}.regex_patterns, '[]')) AS p"
+            f"    WHERE p.value NOT IN (SELECT value FROM json_each(:patterns)) ORDER BY p.key"
+            f"  ) AS kept) "
+            f"WHERE id = :pattern_id"
+        ), params)
+    else:
+        pattern = session.query(pattern_model).filter(pattern_model.id == pattern_id).with_for_update().first()
+        if pattern:
+            pattern.regex_patterns = [p for p in pattern.get_patterns() if p not in patterns]
+
+
+def apply_pattern_changes(session, pattern_model, pattern_id, previous_patterns, patterns):
+    """読み込んだ時点のパターン（previous_patterns）からの変更だけをDB側で反映
+
+    削除・編集されたパターンを削除し、追加・編集後のパターンを末尾に追加する。
+    変更がなければ何も書き込まない。
+    """
+    previous = set(previous_patterns)
+    current = set(patterns)
+    remove_patterns(session, pattern_model, pattern_id, [p for p in previous_patterns if p not in current])
+    append_patterns(session, pattern_model, pattern_id, [p for p in patterns if p not in previous])
+
+
+class PatternCounterBuffer:
+    """成功/失敗回数の加算をまとめて書き込むバッファ
+
+    パターンごとに加算値を集計し、件数（flush_size）または経過時間（flush_seconds）の
+    条件を満たしたら1回のexecutemanyで書き込む。経過時間はタイマースレッドでも確認するため、
+    次の加算がなくても書き込まれる。close()で残りを書き込む。
+    """
+
+    def __init__(self, session_scope, pattern_model, flush_size=COUNTER_FLUSH_SIZE,
+                 flush_seconds=COUNTER_FLUSH_SECONDS):
+        self._session_scope = session_scope
+        self._pattern_model = pattern_model
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._pending_count = 0
+        self._first_pending_at = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def increment(self, pattern_id, success=0, failure=0):
+        """加算をバッファに追加（条件を満たしたら書き込む）"""
+        with self._lock:
+            counts = self._pending.setdefault(pattern_id, [0, 0])
+            counts[0] += success
+            counts[1] += failure
+            self._pending_count += 1
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            due = (self._pending_count >= self.flush_size
+                   or time.monotonic() - self._first_pending_at >= self.flush_seconds)
+            if self._thread is None and self.flush_seconds:
+                self._start_timer()
+        if due:
+            self.flush()
+
+    def _start_timer(self):
+        # 経過時間の条件で書き込むためのスレッド（self._lockを保持した状態で呼ぶ）
+        buffer_ref = weakref.ref(self)
+        closed = self._closed
+        interval = self.flush_seconds
+
+        def run():
+            while not closed.wait(interval / 2):
+                buffer = buffer_ref()
+                if buffer is None:
+                    return
+                try:
+                    buffer._flush_if_due()
+                except Exception as e:
+                    print(f"成功/失敗回数の書き込みエラー: {e}")
+                del buffer
+
+        self._thread = threading.Thread(target=run, name="pattern-counter-buffer", daemon=True)
+        self._thread.start()
+
+    def _flush_if_due(self):
+        with self._lock:
+            due = (self._first_pending_at is not None
+                   and time.monotonic() - self._first_pending_at >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """バッファの加算をまとめて書き込み、書き込んだパターン数を返す"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._pending_count = 0
+            self._first_pending_at = None
+        if not pending:
+            return 0
+
+        table = self._pattern_model.__table__
+        statement = update(table).where(table.c.id == bindparam('pattern_id')).values(
+            success_count=func.coalesce(table.c.success_count, 0) + bindparam('success_delta'),
+            failure_count=func.coalesce(table.c.failure_count, 0) + bindparam('failure_delta'),
+        )
+        rows = [
+            {'pattern_id': pattern_id, 'success_delta': success, 'failure_delta': failure}
+            for pattern_id, (success, failure) in sorted(pending.items())
+        ]
+        try:
+            with self._session_scope() as session:
+                session.execute(statement, rows)
+        except Exception:
+            # 書き込めなかった加算はバッファに戻して次回に再試行
+            with self._lock:
+                for pattern_id, (success, failure) in pending.items():
+                    counts = self._pending.setdefault(pattern_id, [0, 0])
+                    counts[0] += success
+                    counts[1] += failure
+                    self._pending_count += 1
+                if self._first_pending_at is None:
+                    self._first_pending_at = time.monotonic()
+            raise
+        return len(rows)
+
+    def close(self):
+        """タイマーを止めて残りの加算を書き込む"""
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
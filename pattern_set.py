@@ -0,0 +1,127 @@
+# 金額抽出用の正規表現パターンセット（コンパイル済み・重複除去しながら抽出）
+import re
+import time
+from functools import lru_cache
+from regex_safety import PatternTimeout, find_spans, vet_pattern
+
+# extract_amounts_with_patternsで使用するフラグ
+PATTERN_FLAGS = re.MULTILINE | re.IGNORECASE
+
+_FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+_AMOUNT_NOISE = re.compile(r'[¥￥,円]')
+
+
+def normalize_amount(amount_str):
+    """金額文字列を正規化（数値に変換）"""
+    try:
+        # 全角数字を半角に変換
+        amount_str = amount_str.translate(_FULLWIDTH_DIGITS)
+
+        # 円記号、カンマ、円を除去
+        amount_str = _AMOUNT_NOISE.sub('', amount_str)
+
+        # 空白を除去
+        amount_str = amount_str.strip()
+
+        # 数値に変換
+        if amount_str:
+            return int(amount_str)
+        else:
+            return None
+    except:
+        return None
+
+
+class PatternSet:
+    """検証・コンパイル済みの正規表現パターンの集合
+
+    パターンは生成時に1回だけ検証・コンパイルし、抽出時は正規化値で重複を
+    判定してから結果を生成するため、重複するマッチの辞書は作らない。
+    バックトラックが爆発する構文は拒否し、マッチングはパターンごとの時間制限付きで行う。
+    インスタンスはキャッシュして複数のスレッドで共有するため、作成後は変更しない
+    （時間切れは抽出ごとに渡すerrorsに記録する）。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.errors = {}  # パターン -> コンパイルエラー・拒否の内容
+        self._compiled = []  # (パターン, コンパイル結果, 値のグループ番号)
+
+        for pattern in self.patterns:
+            reason = vet_pattern(pattern, PATTERN_FLAGS)
+            if reason:
+                self.errors[pattern] = reason
+                continue
+            try:
+                compiled = re.compile(pattern, PATTERN_FLAGS)
+            except (re.error, TypeError) as e:
+                self.errors[pattern] = str(e)
+                continue
+            # グループがある場合は最初のグループ、なければ全体
+            self._compiled.append((pattern, compiled, 1 if compiled.groups else 0))
+
+    def __len__(self):
+        return len(self.patterns)
+
+    @property
+    def valid_patterns(self):
+        """コンパイルできたパターンのリスト"""
+        return [pattern for pattern, _, _ in self._compiled]
+
+    def iter_matches(self, text, stats=None, errors=None):
+        """(パターン, 元の文字列, 正規化値, 位置) をパターン順・出現順に返す
+
+        statsに辞書を渡すと {パターン: [一致数, 実行秒数]} に加算する。
+        errorsに辞書を渡すと時間切れになったパターンを記録し、同じ辞書を渡した以降の
+        抽出（同じ書類の次のページなど）ではそのパターンを使わない。
+        """
+        errors = {} if errors is None else errors
+        normalized_cache = {}
+        for pattern, compiled, group in self._compiled:
+            if pattern in errors:
+                continue  # この書類で時間切れになったパターン
+            start_time = time.perf_counter()
+            try:
+                spans = find_spans(compiled, group, text)
+            except PatternTimeout as e:
+                errors[pattern] = str(e)
+                spans = []
+            if stats is not None:
+                stats.setdefault(pattern, [0, 0.0])[1] += time.perf_counter() - start_time
+            for value, start, end in spans:
+                if value in normalized_cache:
+                    normalized_value = normalized_cache[value]
+                else:
+                    normalized_value = normalized_cache[value] = normalize_amount(value)
+                if normalized_value:
+                    if stats is not None:
+                        stats[pattern][0] += 1
+                    yield pattern, value, normalized_value, (start, end)
+
+    def extract(self, text, stats=None, seen_normalized=None, errors=None):
+        """金額を抽出し、同じ正規化値を持つものを除去して順に返す
+
+        seen_normalizedに集合を渡すと、複数のテキスト（ページ）をまたいで重複を除去する。
+        errorsはiter_matchesと同じ。
+        """
+        seen_normalized = set() if seen_normalized is None else seen_normalized
+        for pattern, value, normalized_value, span in self.iter_matches(text, stats, errors):
+            if normalized_value in seen_normalized:
+                continue
+            seen_normalized.add(normalized_value)
+            yield {
+                'raw': value,
+                'normalized': normalized_value,
+                'pattern': pattern,
+                'position': span
+            }
+
+
+@lru_cache(maxsize=128)
+def _compile_pattern_set(patterns):
+    return PatternSet(patterns)
+
+
+def compile_pattern_set(patterns):
+    """パターンセットを取得（同じパターンの組み合わせはプロセス内で再利用）"""
+    return _compile_pattern_set(tuple(patterns))
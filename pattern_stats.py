@@ -0,0 +1,168 @@
+# 正規表現パターンごとの抽出統計と、使われないパターンの整理
+#
+# 抽出結果を保存するたびに、書類パターンの各正規表現について実行回数・一致数・
+# 採用された値の数・実行時間をpattern_statisticsに加算する。
+# prune_document_patternsは採用実績の多い順にパターンを並べ替え、十分な回数
+# 実行しても一度も採用されなかったパターンをregex_patternsから削除する。
+#
+# 定期的な整理: python pattern_stats.py --min-runs 20 [--dry-run]
+import argparse
+import hashlib
+import os
+import sys
+from datetime import datetime
+from sqlalchemy import func, insert
+
+# この回数以上実行して一度も採用されなかったパターンを削除する（環境変数で調整可能）
+PATTERN_PRUNE_MIN_RUNS = int(os.getenv('PATTERN_PRUNE_MIN_RUNS', '20'))
+
+
+def pattern_hash(pattern):
+    """正規表現のSHA-256ハッシュ（統計のキー）"""
+    return hashlib.sha256(pattern.encode('utf-8')).hexdigest()
+
+
+def summarize_run(run_stats, extracted_values):
+    """1回の抽出のパターンごとの統計を作成
+
+    run_statsはextract_amounts_with_patternsに渡した {パターン: [一致数, 秒]}、
+    extracted_valuesは保存する抽出結果（各値の'pattern'が採用されたパターン）。
+    """
+    accepted = {}
+    for value in extracted_values:
+        pattern = value.get('pattern')
+        if pattern is not None:
+            accepted[pattern] = accepted.get(pattern, 0) + 1
+    return [
+        {'regex': pattern, 'matches': matches, 'accepted': accepted.get(pattern, 0), 'seconds': seconds}
+        for pattern, (matches, seconds) in run_stats.items()
+    ]
+
+
+def record_pattern_statistics(session, stats_model, pattern_id, summary):
+    """1回の抽出の統計を加算（SQLite/PostgreSQLは1回のINSERT ... ON CONFLICTで書き込む）"""
+    if not summary:
+        return
+    now = datetime.now()
+    rows = [{
+        'pattern_id': pattern_id,
+        'pattern_hash': pattern_hash(item['regex']),
+        'regex': item['regex'],
+        'runs': 1,
+        'match_count': item['matches'],
+        'accepted_count': item['accepted'],
+        'total_seconds': item['seconds'],
+        'last_accepted_at': now if item['accepted'] else None,
+        'updated_at': now,
+    } for item in summary]
+    table = stats_model.__table__
+    dialect_name = session.get_bind().dialect.name
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        excluded = statement.excluded
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.pattern_id, table.c.pattern_hash],
+            set_={
+                'runs': table.c.runs + excluded.runs,
+                'match_count': table.c.match_count + excluded.match_count,
+                'accepted_count': table.c.accepted_count + excluded.accepted_count,
+                'total_seconds': table.c.total_seconds + excluded.total_seconds,
+                'last_accepted_at': func.coalesce(excluded.last_accepted_at, table.c.last_accepted_at),
+                'updated_at': excluded.updated_at,
+            }
+        ), rows)
+        return
+
+    # ON CONFLICTがないDBでは行をロックして読み書きする
+    for row in rows:
+        stat = session.query(stats_model).filter_by(
+            pattern_id=row['pattern_id'], pattern_hash=row['pattern_hash']
+        ).with_for_update().first()
+        if stat is None:
+            session.execute(insert(table), [row])
+            continue
+        stat.runs += row['runs']
+        stat.match_count += row['match_count']
+        stat.accepted_count += row['accepted_count']
+        stat.total_seconds += row['total_seconds']
+        stat.last_accepted_at = row['last_accepted_at'] or stat.last_accepted_at
+        stat.updated_at = row['updated_at']
+
+
+def load_pattern_statistics(session, stats_model, pattern_id):
+    """書類パターンの統計を取得 {正規表現: 統計行}"""
+    rows = session.query(stats_model).filter(stats_model.pattern_id == pattern_id).all()
+    return {row.regex: row for row in rows}
+
+
+def rank_patterns(patterns, statistics, min_runs=PATTERN_PRUNE_MIN_RUNS):
+    """パターンを採用実績順に並べ替え、(残すパターン, 削除するパターン) を返す
+
+    採用された値の多い順（同数なら平均実行時間の短い順）に並べ、実績のないパターンは
+    元の順序のまま後ろに回す。min_runs回以上実行して一度も採用されなかったパターンは
+    削除するが、すべてが該当する場合も1つは残す。
+    """
+    contributing = []
+    untested = []
+    dead = []
+    for index, pattern in enumerate(patterns):
+        stat = statistics.get(pattern)
+        if stat is not None and stat.accepted_count:
+            contributing.append((-stat.accepted_count, stat.total_seconds / max(stat.runs, 1), index, pattern))
+        elif stat is not None and stat.runs >= min_runs:
+            dead.append(pattern)
+        else:
+            untested.append(pattern)
+    kept = [pattern for *_, pattern in sorted(contributing)] + untested
+    if not kept and dead:
+        kept, dead = dead[:1], dead[1:]
+    return kept, dead
+
+
+def prune_document_patterns(session, pattern_model, stats_model, min_runs=PATTERN_PRUNE_MIN_RUNS,
+                            dry_run=False):
+    """すべての書類パターンを並べ替え・整理し、[(パターンID, 削除したパターン)] を返す"""
+    results = []
+    pattern_ids = [row[0] for row in session.query(pattern_model.id).order_by(pattern_model.id).all()]
+    for pattern_id in pattern_ids:
+        query = session.query(pattern_model).filter(pattern_model.id == pattern_id)
+        document_pattern = query.first() if dry_run else query.with_for_update().first()
+        if document_pattern is None:
+            continue
+        patterns = document_pattern.get_patterns()
+        kept, dropped = rank_patterns(patterns, load_pattern_statistics(session, stats_model, pattern_id), min_runs)
+        if kept != patterns:
+            results.append((pattern_id, dropped))
+            if not dry_run:
+                document_pattern.regex_patterns = kept
+        if not dry_run:
+            session.commit()  # 行ロックはパターンごとに解放する
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="書類パターンの並べ替えと使われないパターンの削除")
+    parser.add_argument("--min-runs", type=int, default=PATTERN_PRUNE_MIN_RUNS,
+                        help="この回数以上実行して一度も採用されなかったパターンを削除")
+    parser.add_argument("--dry-run", action="store_true", help="削除せずに対象を表示")
+    args = parser.parse_args(argv)
+
+    from batch_process import _load_modules
+    _, database = _load_modules()
+    with database.session_scope() as session:
+        results = database.prune_patterns(session, min_runs=args.min_runs, dry_run=args.dry_run)
+    for pattern_id, dropped in results:
+        print(f"書類パターン {pattern_id}: 並べ替え / 削除 {len(dropped)}件")
+        for pattern in dropped:
+            print(f"  - {pattern}")
+    print(f"{'対象' if args.dry_run else '整理'}: {len(results)}件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# PDFの入力（ファイルパス・bytes・memoryview）を共通に扱うモジュール
+import os
+import tempfile
+from contextlib import contextmanager
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+
+# ラスタライズ用にPDFを書き出す一時ファイルの場所
+PDF_SPOOL_DIR = os.getenv('PDF_SPOOL_DIR') or None  # 省略時はOSの一時ディレクトリ
+
+
+def is_pdf_path(source):
+    """ファイルパスかどうか"""
+    return isinstance(source, (str, os.PathLike))
+
+
+def read_pdf(source):
+    """パスの場合は読み込み、bytes/memoryviewの場合はそのまま返す"""
+    if is_pdf_path(source):
+        with open(source, 'rb') as f:
+            return f.read()
+    return source
+
+
+def pdf_as_bytes(source):
+    """bytesとして取得（bytesを要求するAPI用、bytesの場合はコピーしない）"""
+    data = read_pdf(source)
+    return data if isinstance(data, bytes) else bytes(data)
+
+
+@contextmanager
+def spooled_pdf(source):
+    """popplerに渡すPDFのパスを取得
+
+    pdf2imageのbytes版は呼び出しのたびにPDF全体を一時ファイルに書き出すため、
+    bytes/memoryviewは大きさにかかわらず一意な名前の一時ファイルに1回だけ書き出してパスを返す。
+    一時ファイルはwithを抜けるときに必ず削除する。
+    """
+    if is_pdf_path(source):
+        yield source
+        return
+
+    fd, path = tempfile.mkstemp(prefix='upload_', suffix='.pdf', dir=PDF_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(source)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def pdfinfo(source, **kwargs):
+    """pdfinfoの結果を取得（パス・バイト列のどちらにも対応）"""
+    if is_pdf_path(source):
+        return pdfinfo_from_path(source, **kwargs)
+    return pdfinfo_from_bytes(source, **kwargs)
+
+
+def convert_pdf(source, **kwargs):
+    """PDFをPIL画像に変換（パス・バイト列のどちらにも対応）"""
+    if is_pdf_path(source):
+        return convert_from_path(source, **kwargs)
+    return convert_from_bytes(source, **kwargs)
@@ -0,0 +1,590 @@
+# LLMやユーザーが作成した正規表現の安全性チェックと時間制限付き実行モジュール
+#
+# ネストした量指定子など、バックトラックが指数的に増える構文は実行前に静的に拒否する。
+# 静的チェックで検出できないパターンに備え、マッチングは別プロセス（REGEX_WORKERS個のプール）で
+# 実行し、パターンごとの時間制限（REGEX_TIME_BUDGET秒）を超えたらプロセスを停止して作り直す。
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from metrics import count_event
+
+try:
+    from re import _parser as sre_parse  # Python 3.11以降
+except ImportError:
+    import sre_parse
+
+# パターンごとの時間制限（秒、0で別プロセスを使わずに実行）
+REGEX_TIME_BUDGET = float(os.getenv('REGEX_TIME_BUDGET', '1.0'))
+# この時間（秒）以上かかったパターンを「遅いパターン」として記録
+REGEX_SLOW_SECONDS = float(os.getenv('REGEX_SLOW_SECONDS', '0.05'))
+# 正規表現を実行するワーカープロセスの数（同時に実行できるパターンの数）
+REGEX_WORKERS = int(os.getenv('REGEX_WORKERS', str(min(4, os.cpu_count() or 1))))
+# 時間制限を超えたパターンを、LLMが新たに提案しても受け付けない時間（秒）
+REGEX_TIMEOUT_BAN_SECONDS = float(os.getenv('REGEX_TIMEOUT_BAN_SECONDS', '600'))
+# 受け付けるパターンの最大長
+MAX_PATTERN_LENGTH = 1000
+# これより大きい上限の繰り返しは無制限の繰り返しとみなす
+_REPEAT_LIMIT = 16
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+# 文字クラスの重なりを調べるための代表的な文字（OCRテキストに現れる文字）
+_PROBE_CHARS = '0123456789０１２３４５６７８９aZ_ 　\t\n,，.．:：¥￥円万残高-/()（）'
+
+
+def _category_predicate(category):
+    return {
+        sre_parse.CATEGORY_DIGIT: str.isdecimal,
+        sre_parse.CATEGORY_NOT_DIGIT: lambda c: not c.isdecimal(),
+        sre_parse.CATEGORY_SPACE: str.isspace,
+        sre_parse.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+        sre_parse.CATEGORY_WORD: lambda c: c.isalnum() or c == '_',
+        sre_parse.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == '_'),
+    }.get(category, lambda c: True)
+
+
+def _char_predicate(op, av):
+    """1文字に一致する要素の判定関数（1文字の要素でなければNone）"""
+    if op == sre_parse.LITERAL:
+        return lambda c: ord(c) == av
+    if op == sre_parse.NOT_LITERAL:
+        return lambda c: ord(c) != av
+    if op == sre_parse.ANY:
+        return lambda c: True
+    if op == sre_parse.IN:
+        negate = False
+        checks = []
+        for item_op, item_av in av:
+            if item_op == sre_parse.NEGATE:
+                negate = True
+            elif item_op == sre_parse.LITERAL:
+                checks.append(lambda c, v=item_av: ord(c) == v)
+            elif item_op == sre_parse.RANGE:
+                checks.append(lambda c, r=item_av: r[0] <= ord(c) <= r[1])
+            elif item_op == sre_parse.CATEGORY:
+                checks.append(_category_predicate(item_av))
+            else:
+                checks.append(lambda c: True)
+        return lambda c: any(check(c) for check in checks) != negate
+    return None
+
+
+def _item_predicate(op, av):
+    """要素が一致しうる文字の判定関数（複雑な要素は任意の文字とみなす）"""
+    predicate = _char_predicate(op, av)
+    if predicate is not None:
+        return predicate
+    if op in _REPEATS and len(av[2]) == 1:
+        return _item_predicate(*av[2][0])
+    if op == sre_parse.SUBPATTERN and len(av[3]) == 1:
+        return _item_predicate(*av[3][0])
+    return lambda c: True
+
+
+def _edge_predicate(subpattern, last=False):
+    """サブパターンの先頭（last=Trueなら末尾）に来うる文字の判定関数
+
+    省略可能な要素（a? や a* など）は、その次（末尾なら前）の要素も候補に含める。
+    """
+    items = list(subpattern)
+    if last:
+        items.reverse()
+    predicates = []
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        if op in _REPEATS:
+            predicates.append(_edge_predicate(av[2], last))
+            optional = av[0] == 0 or av[2].getwidth()[0] == 0
+        elif op == sre_parse.SUBPATTERN:
+            predicates.append(_edge_predicate(av[3], last))
+            optional = av[3].getwidth()[0] == 0
+        elif op == sre_parse.BRANCH:
+            predicates.extend(_edge_predicate(branch, last) for branch in av[1])
+            optional = any(branch.getwidth()[0] == 0 for branch in av[1])
+        else:
+            predicates.append(_item_predicate(op, av))
+            optional = False
+        if not optional:
+            break
+    return lambda c: any(predicate(c) for predicate in predicates)
+
+
+def _overlaps(first, second, probe):
+    return any(first(c) and second(c) for c in probe)
+
+
+def _is_unbounded(op, av):
+    return op in _REPEATS and (av[1] == sre_parse.MAXREPEAT or av[1] > _REPEAT_LIMIT)
+
+
+def _first_predicate(subpattern):
+    """分岐の先頭の文字の判定関数"""
+    for op, av in subpattern:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        return _item_predicate(op, av)
+    return None  # 空の分岐
+
+
+def _repeat_predicates(subpattern):
+    """サブパターン内の繰り返し要素の判定関数をすべて取得"""
+    predicates = []
+    for op, av in subpattern:
+        if op in _REPEATS and av[1] > 1:
+            predicates.append(_item_predicate(op, av))
+        for child in _children(op, av):
+            predicates.extend(_repeat_predicates(child))
+    return predicates
+
+
+def _has_separator(body, probe):
+    """繰り返しの本体に、内部のどの繰り返しとも重ならない必須の1文字があるか
+
+    例えば (?:[\\d,]+円)+ は「円」で区切られるため、繰り返しの分け方は1通りに決まる。
+    """
+    repeats = _repeat_predicates(body)
+    for op, av in body:
+        predicate = _char_predicate(op, av)
+        if predicate is not None and not any(_overlaps(predicate, r, probe) for r in repeats):
+            return True
+    return False
+
+
+def _children(op, av):
+    if op in _REPEATS or op == sre_parse.POSSESSIVE_REPEAT:
+        return [av[2]]
+    if op == sre_parse.SUBPATTERN:
+        return [av[3]]
+    if op == sre_parse.BRANCH:
+        return list(av[1])
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return [av[1]]
+    if op == sre_parse.ATOMIC_GROUP:
+        return [av]
+    if op == sre_parse.GROUPREF_EXISTS:
+        return [branch for branch in av[1:] if branch is not None]
+    return []
+
+
+def _contains_unbounded(subpattern):
+    for op, av in subpattern:
+        if _is_unbounded(op, av):
+            return True
+        if any(_contains_unbounded(child) for child in _children(op, av)):
+            return True
+    return False
+
+
+def _min_width(state, op, av):
+    return sre_parse.SubPattern(state, [(op, av)]).getwidth()[0]
+
+
+def _unbounded_edge(subpattern, state, last=False):
+    """先頭（last=Trueなら末尾）にある無制限の繰り返しが一致しうる文字の判定関数（なければNone）
+
+    グループ（(...) や (?:...)）の中や、省略可能な要素を挟んだ位置の繰り返しも対象にする。
+    """
+    items = list(subpattern)
+    if last:
+        items.reverse()
+    predicates = []
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue
+        if _is_unbounded(op, av):
+            predicates.append(_edge_predicate([(op, av)], last))
+        elif op == sre_parse.SUBPATTERN or op in _REPEATS:
+            # グループの中、または (\\d+)? のような上限のある繰り返しの中
+            inner = _unbounded_edge(av[3] if op == sre_parse.SUBPATTERN else av[2], state, last)
+            if inner is not None:
+                predicates.append(inner)
+        elif op == sre_parse.BRANCH:
+            predicates.extend(p for p in (_unbounded_edge(branch, state, last) for branch in av[1]) if p is not None)
+        if _min_width(state, op, av) > 0:
+            break
+    if not predicates:
+        return None
+    return lambda c: any(predicate(c) for predicate in predicates)
+
+
+def _is_marker(body, index, probe):
+    """本体の他の要素と重ならない文字の省略可能な1文字（,? など）か"""
+    op, av = body[index]
+    if op not in _REPEATS or av[0] != 0 or av[1] != 1 or len(av[2]) != 1:
+        return False
+    predicate = _char_predicate(*av[2][0])
+    if predicate is None:
+        return False
+    return not any(
+        _overlaps(predicate, _item_predicate(*item), probe) for i, item in enumerate(body) if i != index
+    )
+
+
+def _repeat_body_width(body, probe):
+    """繰り返しの本体の幅（区切りとして使われる省略可能な1文字を除く）
+
+    \\d{1,3}(?:,?\\d{3})* の「,?」のように、本体の他の要素と重ならない文字の省略可能な要素は、
+    入力によって一致するかどうかが1通りに決まるため幅の計算から除く。
+    """
+    items = [item for i, item in enumerate(body) if not _is_marker(body, i, probe)]
+    return sre_parse.SubPattern(body.state, items).getwidth()
+
+
+def _check(subpattern, probe):
+    """危険な構文の理由を返す（問題なければNone）"""
+    # 直前までに末尾で一致しうる無制限の繰り返しの文字（グループの中も含む）
+    previous = None
+    for op, av in subpattern:
+        # 前の無制限の繰り返しの末尾と、この要素の先頭の無制限の繰り返しが同じ文字に一致すると、
+        # 区切り方が複数になり、一致しない入力で多項式時間のバックトラックが起きる
+        leading = _unbounded_edge([(op, av)], subpattern.state)
+        if previous is not None and leading is not None and _overlaps(previous, leading, probe):
+            return "同じ文字に一致する無制限の繰り返しが連続しています（\\d+\\d+ や \\d+(\\d+) のような構文）"
+        trailing = _unbounded_edge([(op, av)], subpattern.state, last=True)
+        if _min_width(subpattern.state, op, av) > 0:
+            previous = trailing
+        elif trailing is not None:
+            # 省略可能な要素（(?:a+)? など）は、省略した場合の直前の繰り返しも残す
+            previous = trailing if previous is None else (lambda c, a=previous, b=trailing: a(c) or b(c))
+        if op in _REPEATS and av[1] > 1 and not _is_unbounded(op, av):
+            # (?:\\d+){2} のように、上限のある繰り返しでも前後の回が連続する
+            inner_leading = _unbounded_edge(av[2], subpattern.state)
+            inner_trailing = _unbounded_edge(av[2], subpattern.state, last=True)
+            if inner_leading is not None and inner_trailing is not None and _overlaps(
+                    inner_trailing, inner_leading, probe):
+                return "同じ文字に一致する無制限の繰り返しが連続しています（\\d+\\d+ や \\d+(\\d+) のような構文）"
+        if _is_unbounded(op, av):
+            body = av[2]
+            while len(body) == 1 and body[0][0] == sre_parse.SUBPATTERN:
+                body = body[0][1][3]  # (?:...) や (...) の中身
+            low, high = _repeat_body_width(body, probe)
+            if (_contains_unbounded(body) or low != high) and not _has_separator(body, probe):
+                return "ネストした量指定子（(a+)+ のような繰り返しの繰り返し）は使用できません"
+            for inner_op, inner_av in body:
+                if inner_op == sre_parse.BRANCH:
+                    firsts = [_first_predicate(branch) for branch in inner_av[1]]
+                    if None in firsts or any(
+                        _overlaps(a, b, probe) for i, a in enumerate(firsts) for b in firsts[i + 1:]
+                    ):
+                        return "繰り返しの中に先頭が重なる選択肢（(a|ab)+ のような構文）は使用できません"
+        for child in _children(op, av):
+            reason = _check(child, probe)
+            if reason:
+                return reason
+    return None
+
+
+def vet_pattern(pattern, flags=0):
+    """パターンの安全性を静的にチェックし、拒否する理由を返す（問題なければNone）
+
+    構文エラーはre.compileで報告するため、ここではNoneを返す。
+    """
+    if not isinstance(pattern, str):
+        return None
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"パターンが長すぎます（{MAX_PATTERN_LENGTH}文字以内）"
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except (re.error, TypeError, RecursionError):
+        return None
+    probe = _PROBE_CHARS + ''.join(sorted(set(pattern)))
+    return _check(parsed, probe)
+
+
+def vet_patterns(patterns):
+    """安全なパターンだけを返す（拒否したパターンは理由を表示）
+
+    LLMが新たに提案したパターンに使い、最近時間制限を超えたパターンも拒否する。
+    保存済みのパターンは書類ごとの時間切れだけで扱い、ここでは拒否しない。
+    """
+    accepted = []
+    for pattern in patterns:
+        reason = vet_pattern(pattern)
+        if not reason and _timed_out_recently(pattern):
+            reason = f"最近時間制限（{REGEX_TIME_BUDGET}秒）を超えたパターンです"
+        if reason:
+            print(f"パターンを拒否しました: {pattern} ({reason})")
+            count_event('rejected_patterns')
+        else:
+            accepted.append(pattern)
+    return accepted
+
+
+# --- パターンごとの実行時間の記録 ---
+
+_timed_out = {}  # パターン -> 最後に時間制限を超えた時刻（time.monotonic()）
+_slow_patterns = {}  # パターン -> {'count', 'max_seconds', 'timeouts'}
+_slow_lock = threading.Lock()
+
+
+def record_pattern_time(pattern, seconds, timed_out=False):
+    """パターンの実行時間を記録（遅いパターン・時間切れのパターンだけ保持）"""
+    if not timed_out and seconds < REGEX_SLOW_SECONDS:
+        return
+    with _slow_lock:
+        stats = _slow_patterns.setdefault(pattern, {'count': 0, 'max_seconds': 0.0, 'timeouts': 0})
+        stats['count'] += 1
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        if timed_out:
+            stats['timeouts'] += 1
+            _timed_out[pattern] = time.monotonic()
+    count_event('slow_patterns', result='timeout' if timed_out else 'slow')
+
+
+def _timed_out_recently(pattern):
+    """REGEX_TIMEOUT_BAN_SECONDS以内に時間制限を超えたか（期限切れの記録は削除）"""
+    with _slow_lock:
+        timed_out_at = _timed_out.get(pattern)
+        if timed_out_at is None:
+            return False
+        if time.monotonic() - timed_out_at < REGEX_TIMEOUT_BAN_SECONDS:
+            return True
+        del _timed_out[pattern]
+        return False
+
+
+def slow_patterns():
+    """遅いパターンの記録を最大実行時間の降順で取得"""
+    with _slow_lock:
+        items = [(pattern, dict(stats)) for pattern, stats in _slow_patterns.items()]
+    return sorted(items, key=lambda item: item[1]['max_seconds'], reverse=True)
+
+
+# --- 時間制限付きの実行 ---
+
+class PatternTimeout(Exception):
+    """パターンの実行が時間制限を超えた"""
+
+
+def _find_spans(compiled, group, text):
+    return [(match.group(group), match.start(), match.end()) for match in compiled.finditer(text)]
+
+
+def _worker_main(conn):
+    """ワーカープロセス: テキストを受け取り、パターンごとの一致を返す"""
+    text = ''
+    compiled = {}
+    conn.send(('ready', None))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] == 'text':
+            text = message[1]
+            continue
+        _, pattern, flags, group = message
+        try:
+            key = (pattern, flags)
+            if key not in compiled:
+                if len(compiled) >= 256:
+                    compiled.clear()
+                compiled[key] = re.compile(pattern, flags)
+            conn.send(('ok', _find_spans(compiled[key], group, text)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+class RegexWorker:
+    """正規表現を別プロセスで実行し、時間制限を超えたらプロセスを停止して作り直す
+
+    Streamlitのスクリプトはメインスレッド以外で動くためsignalで中断できず、
+    reモジュールのマッチングはスレッドからも中断できないため別プロセスを使う。
+    """
+
+    def __init__(self, time_budget=None):
+        self.time_budget = REGEX_TIME_BUDGET if time_budget is None else time_budget
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+        self._text = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main, args=(child_conn,), name="regex-worker", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._text = None
+        parent_conn.recv()  # 起動を待ってから時間を計る
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self._text = None
+
+    def find_spans(self, pattern, flags, group, text):
+        """((一致した文字列, 開始位置, 終了位置) のリスト, 実行時間) を返す（時間切れはPatternTimeout）"""
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._stop()
+                self._start()
+            if self._text is not text:
+                self._conn.send(('text', text))
+                self._text = text
+            start = time.perf_counter()
+            self._conn.send(('find', pattern, flags, group))
+            if not self._conn.poll(self.time_budget):
+                self._stop()
+                raise PatternTimeout(f"時間制限（{self.time_budget}秒）を超えました")
+            status, value = self._conn.recv()
+            seconds = time.perf_counter() - start
+        if status == 'error':
+            raise re.error(value)
+        return value, seconds
+
+    def has_text(self, text):
+        """このテキストを送信済みか"""
+        return self._text is text
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+
+class RegexWorkerPool:
+    """RegexWorkerのプール（最大size個のパターンを同時に実行する）
+
+    ワーカーは必要になった時点で起動する。直前に同じテキストを送ったワーカーを優先して
+    使い、ページのテキストをワーカーに送り直す回数を減らす。
+    """
+
+    def __init__(self, size=None, time_budget=None):
+        self.size = max(1, size or REGEX_WORKERS)
+        self.time_budget = REGEX_TIME_BUDGET if time_budget is None else time_budget
+        self._idle = []
+        self._created = 0
+        self._condition = threading.Condition()
+
+    def _acquire(self, text):
+        with self._condition:
+            while True:
+                for index, worker in enumerate(self._idle):
+                    if worker.has_text(text):
+                        return self._idle.pop(index)
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return RegexWorker(self.time_budget)
+                self._condition.wait()
+
+    def _release(self, worker):
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def find_spans(self, pattern, flags, group, text):
+        """空いているワーカーでRegexWorker.find_spansを実行"""
+        worker = self._acquire(text)
+        try:
+            return worker.find_spans(pattern, flags, group, text)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self._condition:
+            workers, self._idle = self._idle, []
+            self._created -= len(workers)
+        for worker in workers:
+            worker.close()
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_regex_worker_pool():
+    """プロセス内で共有するワーカーのプールを取得"""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = RegexWorkerPool()
+        return _worker_pool
+
+
+def find_spans(compiled, group, text):
+    """時間制限付きでパターンの一致を取得し、実行時間を記録
+
+    時間制限を超えた場合はPatternTimeoutを送出する（呼び出し側で書類ごとに記録する）。
+    """
+    if REGEX_TIME_BUDGET <= 0:
+        start = time.perf_counter()
+        spans = _find_spans(compiled, group, text)
+        record_pattern_time(compiled.pattern, time.perf_counter() - start)
+        return spans
+    pool = get_regex_worker_pool()
+    try:
+        spans, seconds = pool.find_spans(compiled.pattern, compiled.flags, group, text)
+    except PatternTimeout:
+        record_pattern_time(compiled.pattern, pool.time_budget, timed_out=True)
+        raise
+    record_pattern_time(compiled.pattern, seconds)
+    return spans
+
+
+# --- 静的チェックの回帰確認（python regex_safety.py） ---
+
+# 受け付けるべき金額抽出のパターン（線形時間で一致する）
+_SAFE_EXAMPLES = [
+    r'\d+(?:,\d{3})*',
+    r'[¥￥]?\s*(\d+(?:,\d{3})*)円',
+    r'(?<=\s)([\d]{1,3}(?:,\d{3})+)(?=\s)',
+    r'(?:残高|金額|合計|計|額)[：:\s]*([¥￥]?[\d,]+)円?',
+    r'合計金額[：:\s]*([¥￥]?[０-９\d,]+)',
+    r'金\s*([\d,]+)\s*円也',
+    r'(\d+,)+',
+    r'(?:[\d,]+円)+',
+    r'(?:定期|普通)預金\s+\S+\s+([\d,]+)',
+    r'\d{1,3}(?:,?\d{3})*',
+    r'(\d{1,3}(?:,\d{3})*)\s*円',
+]
+# 拒否すべきパターン（バックトラックが指数的・多項式的に増える）
+_UNSAFE_EXAMPLES = [
+    r'(a+)+',
+    r'\d+\d+',
+    r'(\d+,?)+',
+    r'(a|ab)+',
+    r'([\d,]+\s*)+',
+    r'\d+(?:\d{3})*',
+    r'[\d,]+(?:,\d{3})+',
+    # グループを挟んでも連続する繰り返しは同じ（'1' * 2000 で数十秒かかる）
+    r'\d+(\d+)x',
+    r'(\d+)(\d+)x',
+    r'.*([\d,]+)円',
+    r'\d+,?\d+x',
+    # 数字の連続に対して3乗の時間がかかる（'1' * 2000 で約8秒）
+    r'[0-9]+[,0-9]*円',
+]
+
+
+def check_examples():
+    """回帰確認用の例を静的チェックにかけ、期待と異なる結果のリストを返す"""
+    failures = []
+    for pattern in _SAFE_EXAMPLES:
+        reason = vet_pattern(pattern)
+        if reason:
+            failures.append(f"拒否されました: {pattern} ({reason})")
+    for pattern in _UNSAFE_EXAMPLES:
+        if vet_pattern(pattern) is None:
+            failures.append(f"受け付けられました: {pattern}")
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_examples()
+    for failure in failures:
+        print(failure)
+    print(f"静的チェックの回帰確認: {'NG' if failures else 'OK'} "
+          f"（{len(_SAFE_EXAMPLES) + len(_UNSAFE_EXAMPLES)}件中{len(failures)}件が不一致）")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,268 @@
+# 類似書類検索用のインデックスモジュール（MinHash/LSH）
+#
+# シグネチャは文字の多重集合（同じ文字のk回目の出現を別要素とする）のMinHash。
+# SequenceMatcherのratio()はquick_ratio()（文字の多重集合の一致率）以下なので、
+# ratioが閾値tを超える組の多重集合のJaccard係数は t / (2 - t) 以上（t=0.7で0.54以上）。
+# LSHのバンドで集めた候補は、メモリ上のシグネチャで推定したJaccard係数がこの下限から
+# ESTIMATE_MARGINを引いた値以上のものに絞り込む（別テンプレートの書類は大半がここで除外される）。
+# 下限ちょうどの組が候補にならない確率は約6%（ノイズ入りの閾値付近の組では計測上0%）。
+# 確率的な絞り込みのため、結果は全件比較の近似（再現率はbenchmarks/bench_similarity.pyで計測）。
+import threading
+import time
+import zlib
+from collections import defaultdict
+from difflib import SequenceMatcher
+from sqlalchemy import insert
+
+# 類似度計算に使用する先頭文字数（従来のSequenceMatcher比較と同じ）
+SAMPLE_LENGTH = 500
+# シグネチャの長さ（One Permutation Hashingのビン数）
+NUM_BINS = 128
+# LSHの1バンドあたりの行数（バンド数 = NUM_BINS // ROWS_PER_BAND）
+ROWS_PER_BAND = 4
+# 推定Jaccard係数の許容誤差（128ビンの推定値の標準偏差は0.54付近で約0.044、その約2.7倍）
+ESTIMATE_MARGIN = 0.12
+# 最大IDより小さい未読み込みのID（コミット前・ロールバック）を再確認し続ける秒数
+SIGNATURE_GAP_SECONDS = 300
+
+_BIN_BITS = 7  # 2 ** _BIN_BITS == NUM_BINS
+_VALUE_MASK = (1 << (32 - _BIN_BITS)) - 1
+_EMPTY = _VALUE_MASK + 1
+_DENSIFY_OFFSET = _EMPTY + 1
+
+
+def _shingles(text):
+    """文字の多重集合を (文字 + 出現回数) の集合として取得"""
+    counts = defaultdict(int)
+    shingles = set()
+    for char in text[:SAMPLE_LENGTH]:
+        counts[char] += 1
+        shingles.add(f"{char}{counts[char]}")
+    return shingles
+
+
+def text_signature(text):
+    """テキストのMinHashシグネチャを計算
+
+    ハッシュ計算は1回のみで済むOne Permutation Hashingを使用し、
+    空のビンは右隣のビンの値で補完する（rotation densification）。
+    """
+    bins = [_EMPTY] * NUM_BINS
+    for shingle in _shingles(text or ""):
+        h = zlib.crc32(shingle.encode('utf-8'))
+        index = h >> (32 - _BIN_BITS)
+        value = h & _VALUE_MASK
+        if value < bins[index]:
+            bins[index] = value
+
+    if all(value == _EMPTY for value in bins):
+        return bins
+
+    signature = list(bins)
+    for i, value in enumerate(bins):
+        if value != _EMPTY:
+            continue
+        distance = 1
+        while bins[(i + distance) % NUM_BINS] == _EMPTY:
+            distance += 1
+        signature[i] = bins[(i + distance) % NUM_BINS] + _DENSIFY_OFFSET * distance
+    return signature
+
+
+def text_similarity(text_a, text_b):
+    """テキストの類似度を計算（SequenceMatcher）"""
+    return SequenceMatcher(None, text_a[:SAMPLE_LENGTH], text_b[:SAMPLE_LENGTH]).ratio()
+
+
+def best_match(ocr_text, candidates, threshold=0.7):
+    """候補の中から閾値を超える最も類似した要素を検索
+
+    candidatesは (要素, サンプルテキスト) のリスト。
+    quick_ratio()は類似度の上限値なので、現在の最良値を超えられない候補は
+    完全な比較を省略する（結果は全件比較と同じ）。
+    """
+    text = ocr_text[:SAMPLE_LENGTH]
+    matcher = SequenceMatcher(None, text, "")
+    best_item = None
+    best_score = 0
+
+    for item, sample in candidates:
+        if not sample:
+            continue
+        matcher.set_seq2(sample[:SAMPLE_LENGTH])
+        floor = max(best_score, threshold)
+        if matcher.real_quick_ratio() <= floor or matcher.quick_ratio() <= floor:
+            continue
+        similarity = matcher.ratio()
+        if similarity > best_score and similarity > threshold:
+            best_score = similarity
+            best_item = item
+
+    return best_item, best_score
+
+
+def _sketch(signature):
+    """各ビンの下位8ビットを1つの整数にまとめる"""
+    return int.from_bytes(bytes(value & 0xFF for value in signature), 'big')
+
+
+def _matching_bins(sketch_a, sketch_b):
+    """値が一致するビンの数（下位8ビットの偶然の一致を含む）"""
+    return (sketch_a ^ sketch_b).to_bytes(NUM_BINS, 'big').count(0)
+
+
+def candidate_jaccard(threshold):
+    """類似度の閾値に対応する、候補に残す推定Jaccard係数の下限"""
+    return max(threshold / (2 - threshold) - ESTIMATE_MARGIN, 0.0)
+
+
+class SimilarityIndex:
+    """MinHashシグネチャのLSHインデックス（プロセス内で保持）"""
+
+    def __init__(self):
+        self._buckets = defaultdict(list)
+        # パターンID -> 各ビンの下位8ビットを並べた整数（推定Jaccard係数の計算用）
+        self._sketches = {}
+        # データベースに保存済みと分かっているパターンID（空のシグネチャを含む）
+        self.known_ids = set()
+        # データベースから読み込んだ最大のパターンID
+        self.synced_id = 0
+        # synced_idより小さい未読み込みのID -> 最初に見つけた時刻（time.monotonic()）
+        self.gaps = {}
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._sketches)
+
+    def _band_keys(self, signature):
+        for start in range(0, NUM_BINS - ROWS_PER_BAND + 1, ROWS_PER_BAND):
+            yield (start, tuple(signature[start:start + ROWS_PER_BAND]))
+
+    def add(self, item_id, signature):
+        """シグネチャをインデックスに追加"""
+        with self.lock:
+            self.known_ids.add(item_id)
+            if item_id in self._sketches or not signature or signature[0] == _EMPTY:
+                return
+            self._sketches[item_id] = _sketch(signature)
+            for key in self._band_keys(signature):
+                self._buckets[key].append(item_id)
+
+    def candidates(self, signature, min_jaccard=0.0):
+        """いずれかのバンドが一致し、推定Jaccard係数がmin_jaccard以上の候補IDを取得（ID順）"""
+        found = set()
+        with self.lock:
+            for key in self._band_keys(signature):
+                bucket = self._buckets.get(key)
+                if bucket:
+                    found.update(bucket)
+            if min_jaccard > 0:
+                sketch = _sketch(signature)
+                min_matches = min_jaccard * NUM_BINS
+                found = [
+                    item_id for item_id in found
+                    if _matching_bins(sketch, self._sketches[item_id]) >= min_matches
+                ]
+        return sorted(found)
+
+    def clear(self):
+        """インデックスを初期化"""
+        with self.lock:
+            self._buckets.clear()
+            self._sketches.clear()
+            self.known_ids.clear()
+            self.synced_id = 0
+            self.gaps.clear()
+            self.loaded = False
+
+
+def _store_signatures(session, signature_model, rows):
+    """補完したシグネチャを別のトランザクションで保存（他のプロセスが保存済みの行は無視）"""
+    table = signature_model.__table__
+    bind = session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table).on_conflict_do_nothing()
+    elif bind.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    try:
+        with bind.engine.begin() as connection:
+            connection.execute(statement, rows)
+        return True
+    except Exception as e:
+        print(f"類似検索用シグネチャの保存エラー: {str(e)}")
+        return False
+
+
+def _backfill_signatures(index, session, pattern_model, signature_model):
+    """シグネチャ未保存の既存パターンのシグネチャを計算してインデックスに追加"""
+    missing = session.query(pattern_model.id, pattern_model.ocr_text_sample).outerjoin(
+        signature_model, signature_model.pattern_id == pattern_model.id
+    ).filter(signature_model.pattern_id.is_(None)).all()
+    if not missing:
+        return
+    rows = [{'pattern_id': pattern_id, 'signature': text_signature(sample or "")} for pattern_id, sample in missing]
+    for row in rows:
+        index.add(row['pattern_id'], row['signature'])
+    if not _store_signatures(session, signature_model, rows):
+        # 保存できなかった行は、他のプロセスが保存した時点で改めて読み込む
+        index.known_ids.difference_update(row['pattern_id'] for row in rows)
+
+
+def sync_index(index, session, pattern_model, signature_model):
+    """データベースの内容をインデックスに反映
+
+    初回はシグネチャ未保存の既存パターンを補完する。以降は読み込み済みの最大ID
+    （最大IDより小さい未読み込みのIDがあればその手前）より大きいIDだけを主キーの範囲で確認する。
+    他のプロセスが前後してコミットしたパターンは、SIGNATURE_GAP_SECONDSの間は再確認する。
+    """
+    with index.lock:
+        if not index.loaded:
+            _backfill_signatures(index, session, pattern_model, signature_model)
+            index.loaded = True
+
+        now = time.monotonic()
+        for pattern_id, found_at in list(index.gaps.items()):
+            if pattern_id in index.known_ids or now - found_at > SIGNATURE_GAP_SECONDS:
+                del index.gaps[pattern_id]
+        floor = min(index.gaps) - 1 if index.gaps else index.synced_id
+
+        stored_ids = [pattern_id for (pattern_id,) in session.query(signature_model.pattern_id).filter(
+            signature_model.pattern_id > floor
+        )]
+        new_ids = sorted(set(stored_ids) - index.known_ids)
+        for start in range(0, len(new_ids), 500):
+            rows = session.query(signature_model.pattern_id, signature_model.signature).filter(
+                signature_model.pattern_id.in_(new_ids[start:start + 500])
+            ).all()
+            for pattern_id, signature in rows:
+                index.add(pattern_id, signature)
+
+        if stored_ids:
+            highest = max(stored_ids)
+            stored = set(stored_ids)
+            for pattern_id in range(index.synced_id + 1, highest):
+                if pattern_id not in stored and pattern_id not in index.known_ids:
+                    index.gaps.setdefault(pattern_id, now)
+            index.synced_id = max(index.synced_id, highest)
+    return index
+
+
+def find_best_pattern(ocr_text, session, index, pattern_model, signature_model, threshold=0.7):
+    """インデックスで候補を絞り込み、最も類似したパターンを取得"""
+    sync_index(index, session, pattern_model, signature_model)
+    candidate_ids = index.candidates(text_signature(ocr_text), candidate_jaccard(threshold))
+    if not candidate_ids:
+        return None, 0
+
+    candidates = []
+    for start in range(0, len(candidate_ids), 500):
+        chunk = candidate_ids[start:start + 500]
+        candidates.extend(
+            session.query(pattern_model).filter(pattern_model.id.in_(chunk)).order_by(pattern_model.id).all()
+        )
+    return best_match(ocr_text, [(p, p.ocr_text_sample) for p in candidates], threshold)
@@ -0,0 +1,79 @@
+# PDFプレビュー用サムネイルのキャッシュモジュール（PDFのハッシュ + ページで管理）
+import io
+import threading
+from collections import OrderedDict
+from pdf_source import convert_pdf, pdfinfo
+from disk_cache import DiskLRUCache
+from metrics import count_event, stage_timer
+from ocr_cache import pdf_hash
+
+# プレビューの解像度と画質
+PREVIEW_DPI = 100
+PREVIEW_JPEG_QUALITY = 80
+# ページ数を覚えておくPDFの数
+_PAGE_COUNT_ENTRIES = 256
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class ThumbnailCache:
+    """ページごとのプレビュー画像（JPEG）をディスクにキャッシュ
+
+    同じPDF・ページの再表示ではpopplerを起動しない。ページ数もプロセス内で覚えておく。
+    """
+
+    def __init__(self, directory, max_bytes, dpi=PREVIEW_DPI, quality=PREVIEW_JPEG_QUALITY):
+        self._store = DiskLRUCache(directory, max_bytes, suffix=".jpg")
+        self.dpi = dpi
+        self.quality = quality
+        self._page_counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page_count(self, pdf_data, digest=None):
+        """PDFのページ数を取得"""
+        digest = digest or pdf_hash(pdf_data)
+        with self._lock:
+            if digest in self._page_counts:
+                self._page_counts.move_to_end(digest)
+                return self._page_counts[digest]
+        count = int(pdfinfo(pdf_data)['Pages'])
+        with self._lock:
+            self._page_counts[digest] = count
+            while len(self._page_counts) > _PAGE_COUNT_ENTRIES:
+                self._page_counts.popitem(last=False)
+        return count
+
+    def get(self, pdf_data, page_number, digest=None):
+        """指定ページのプレビュー画像（JPEGのバイト列）を取得（なければ描画して保存）"""
+        digest = digest or pdf_hash(pdf_data)
+        key = f"{digest}-p{page_number}-{self.dpi}dpi"
+        data = self._store.get(key)
+        count_event('cache_requests', cache='thumbnail', result='miss' if data is None else 'hit')
+        if data is None:
+            data = self._render(pdf_data, page_number)
+            self._store.set(key, data)
+        return data
+
+    @stage_timer('thumbnail_render')
+    def _render(self, pdf_data, page_number):
+        images = convert_pdf(pdf_data, dpi=self.dpi, first_page=page_number, last_page=page_number)
+        if not images:
+            raise ValueError(f"{page_number}ページ目を描画できませんでした")
+        output = io.BytesIO()
+        images[0].convert('RGB').save(output, format='JPEG', quality=self.quality)
+        images[0].close()
+        return output.getvalue()
+
+    def stats(self):
+        """ヒット/ミス回数と使用量を取得"""
+        return self._store.stats()
+
+
+def get_thumbnail_cache(directory, max_bytes):
+    """サムネイルキャッシュを取得（ディレクトリごとにプロセス内で共有）"""
+    key = str(directory)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ThumbnailCache(directory, max_bytes)
+        return _caches[key]